@@ -10,3 +10,18 @@ SESSION_STRING = os.getenv("SESSION_STRING") # For the user client
 OWNER_ID = int(os.getenv("OWNER_ID", "0")) # To restrict usage to the owner
 MONGO_URI = os.getenv("MONGO_URI")
 FORCE_CHANNEL_ID = -1002657096509
+
+# ── Engine tuning ──
+FANOUT_CONCURRENCY = int(os.getenv("FANOUT_CONCURRENCY", "3")) # Parallel destination sends per batch job
+RELAY_MODE = os.getenv("RELAY_MODE", "stream") # Restricted media: "stream" (memory relay) or "disk" (download then upload)
+RELAY_BUFFER_MB = int(os.getenv("RELAY_BUFFER_MB", "16")) # Max bytes held in memory per streaming relay
+RELAY_PREFETCH = int(os.getenv("RELAY_PREFETCH", "2")) # Restricted messages downloaded ahead of the current upload (0 = off)
+RELAY_SPOOL_MB = int(os.getenv("RELAY_SPOOL_MB", "2048")) # Disk budget for downloaded-ahead files
+UPLOAD_WINDOW = int(os.getenv("UPLOAD_WINDOW", "8")) # File parts in flight per upload
+MEDIA_CACHE_MB = int(os.getenv("MEDIA_CACHE_MB", "4096")) # On-disk cache of restricted downloads (0 = off)
+PROTECT_TTL = int(os.getenv("PROTECT_TTL", "1800")) # Seconds a source's "protected content" flag stays cached
+TAKEOUT_MIN_MESSAGES = int(os.getenv("TAKEOUT_MIN_MESSAGES", "2000")) # Export Mode: batch size from which history is read via takeout
+JOB_CONCURRENCY = int(os.getenv("JOB_CONCURRENCY", "10")) # Batch jobs running at once, the rest wait in line
+FAST_JOB_SLOTS = int(os.getenv("FAST_JOB_SLOTS", "8")) # ...of which fast-copy jobs
+RELAY_JOB_SLOTS = int(os.getenv("RELAY_JOB_SLOTS", "3")) # ...of which download/upload (protected source) jobs
+SHUTDOWN_GRACE = int(os.getenv("SHUTDOWN_GRACE", "25")) # Seconds running jobs get on SIGTERM to stop and save their place
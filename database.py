@@ -154,6 +154,7 @@ async def get_settings(user_id):
                 "remove_phones": False,
                 "remove_all_urls": False,
             }),
+            "export_mode": settings.get("export_mode", False),
         }
     return None
 
@@ -163,7 +164,7 @@ async def update_settings(user_id, **kwargs):
     allowed_keys = [
         "dest_channels", "filters", "caption_rules", "custom_thumbnail",
         "default_batch_channels", "default_live_channels",
-        "channel_nicknames", "channel_stats", "text_clean",
+        "channel_nicknames", "channel_stats", "text_clean", "export_mode",
     ]
     update_data = {k: v for k, v in kwargs.items() if k in allowed_keys}
 
@@ -375,3 +376,67 @@ async def get_all_user_ids():
     async for doc in cursor:
         users.append(doc["_id"])
     return users
+
+# --- UPLOADED FILE IDS ---
+
+async def get_uploaded_file_id(account_id, unique_id):
+    """file_id this account already uploaded for a source file_unique_id, or None."""
+    database = await get_db()
+    doc = await database.uploaded_files.find_one({"_id": f"{account_id}:{unique_id}"})
+    return doc["file_id"] if doc else None
+
+async def save_uploaded_file_id(account_id, unique_id, file_id):
+    import time as _time
+    database = await get_db()
+    await database.uploaded_files.update_one(
+        {"_id": f"{account_id}:{unique_id}"},
+        {"$set": {
+            "account_id": account_id,
+            "unique_id": unique_id,
+            "file_id": file_id,
+            "updated": _time.time()
+        }},
+        upsert=True
+    )
+
+async def delete_uploaded_file_id(account_id, unique_id):
+    database = await get_db()
+    await database.uploaded_files.delete_one({"_id": f"{account_id}:{unique_id}"})
+
+# --- RATE GOVERNOR ---
+
+async def get_rate_state(account_id):
+    """Request rates learned for this account by plugins/rate_governor.py, or None."""
+    database = await get_db()
+    doc = await database.rate_limits.find_one({"_id": account_id})
+    return doc.get("state") if doc else None
+
+async def save_rate_state(account_id, state):
+    import time as _time
+    database = await get_db()
+    await database.rate_limits.update_one(
+        {"_id": account_id},
+        {"$set": {"state": state, "updated": _time.time()}},
+        upsert=True
+    )
+
+# --- BATCH JOB CHECKPOINTS ---
+
+async def save_batch_checkpoint(user_id, **fields):
+    """Create or update the resumable state of a user's batch job (one per user)."""
+    import time as _time
+    database = await get_db()
+    await database.batch_jobs.update_one(
+        {"_id": user_id},
+        {"$set": {**fields, "updated": _time.time()}},
+        upsert=True
+    )
+
+async def get_batch_checkpoints():
+    """Batch jobs that were queued or running when the bot last stopped."""
+    database = await get_db()
+    return [doc async for doc in database.batch_jobs.find({})]
+
+async def delete_batch_checkpoint(user_id):
+    database = await get_db()
+    await database.batch_jobs.delete_one({"_id": user_id})
@@ -20,7 +20,8 @@ from database import init_db, update_settings, get_settings, is_user_banned, get
 
 # Plugins
 from plugins.auth import handle_auth_input
-from plugins.copy_manager import handle_batch_input
+from plugins.copy_manager import handle_batch_input, resume_batch_jobs
+from plugins.job_runner import job_runner
 from plugins.settings import show_settings_panel, _nick_states
 from plugins.livebatch import handle_livebatch_input, init_live_monitors
 import plugins.channel_picker  # registers chpick_ callbacks
@@ -140,7 +141,7 @@ async def input_handler(client, message):
             text = message.text or message.caption
             user_id = message.from_user.id
             
-            if itype in ["rem_word", "rep_word_old", "rep_word_new", "set_prefix", "set_suffix"] and not text:
+            if itype in ["rem_word", "rep_word_old", "rep_word_new", "set_prefix", "set_suffix", "set_keyword"] and not text:
                 await message.reply_text("⚠️ **Invalid Input**\nPlease send a valid text message.", reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("❌ Cancel", callback_data="cancel_input")]]))
                 return
             
@@ -189,6 +190,14 @@ async def input_handler(client, message):
                 del client.waiting_input
                 await show_settings_panel(user_id, message, is_edit=False)
                 
+            elif itype == "set_keyword":
+                f = settings.get("filters") or {"all": True}
+                f["keyword"] = text.strip()
+                await update_settings(user_id, filters=f)
+                await message.reply_text(f"✅ Keyword filter set to: `{f['keyword']}`")
+                del client.waiting_input
+                await show_settings_panel(user_id, message, is_edit=False)
+
             elif itype == "set_thumb":
                 if not message.photo:
                     await message.reply_text("⚠️ **Invalid Input**\nPlease send a valid Image/Photo.", reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("❌ Cancel", callback_data="cancel_input")]]))
@@ -562,6 +571,12 @@ async def main():
     print("Initializing live monitors...")
     await init_live_monitors(bot)
     print("Live monitors ready!")
+
+    # Re-queue batch jobs interrupted by the last shutdown or crash
+    try:
+        await resume_batch_jobs(bot)
+    except Exception as e:
+        logger.error(f"Batch resume failed: {e}")
     
     # Startup Notification
     try:
@@ -596,6 +611,8 @@ async def main():
         logger.info(f"Self-ping engine started → {render_url}")
 
     await idle()
+    # SIGTERM (redeploy): let running jobs stop between messages and checkpoint
+    await job_runner.shutdown()
     await bot.stop()
 
 if __name__ == "__main__":
@@ -1,4 +1,5 @@
 import os
+import time
 import asyncio
 from pyrogram import Client, filters, enums
 from pyrogram.types import Message
@@ -6,6 +7,10 @@ from config import OWNER_ID
 from database import (get_all_users_count, add_ban, remove_ban, is_user_banned, 
                       check_db_connection, get_all_user_ids, add_protected_channel, 
                       remove_protected_channel, get_protected_channels)
+from plugins.media_cache import media_cache
+from plugins.rate_governor import active_governors
+from plugins.retry_policy import retry_stats
+from plugins.job_runner import job_runner
 
 # Ensure OWNER_ID is int
 try:
@@ -28,10 +33,15 @@ async def stats_command(client, message):
 
     try:
         user_count = await get_all_users_count()
+        gov_lines = "".join(f"  • `{g.account_id}` — `{g.summary()}`\n" for g in active_governors()) or "  • `idle`\n"
         text = (
             "📊 **System Statistics**\n\n"
             f"👤 **Total Users:** `{user_count}`\n"
             f"🗄 **Database:** `{db_status}`\n"
+            f"💾 **Media Cache:** `{media_cache.summary()}`\n"
+            f"🚦 **Rate Governors:**\n{gov_lines}"
+            f"🔁 **Retries:** `{retry_stats.summary()}`\n"
+            f"🧵 **Jobs:** `{job_runner.summary()}`\n"
             "⚡ **System Status:** `Online`\n"
             "🛡 **Bot Version:** `2.0 Advanced`"
         )
@@ -39,6 +49,23 @@ async def stats_command(client, message):
     except Exception as e:
         await message.reply_text(f"❌ Error fetching stats: {e}")
 
+@Client.on_message(filters.command("queue") & filters.private)
+async def queue_command(client, message):
+    if message.from_user.id != OWNER_ID:
+        return
+
+    now = time.time()
+    text = f"🧵 **Job Scheduler**\n\n`{job_runner.summary()}`\n"
+    for job_class in job_runner.caps:
+        waiting = job_runner.queued(job_class)
+        text += f"\n**{job_class.title()}** — {job_runner.running[job_class]} running, {len(waiting)} waiting\n"
+        for pos, handle in enumerate(waiting[:20], 1):
+            text += (f"  {pos}. `{handle.user_id}` • {handle.tier} • waited "
+                     f"{(now - handle.created) / 60:.0f}m • ETA ~{job_runner.eta(handle, pos) / 60:.0f}m\n")
+        if len(waiting) > 20:
+            text += f"  … and {len(waiting) - 20} more\n"
+    await message.reply_text(text)
+
 @Client.on_message(filters.command("ban") & filters.private)
 async def ban_command(client, message):
     if message.from_user.id != OWNER_ID:
@@ -89,8 +116,16 @@ async def broadcast_command(client, message):
         await message.reply_text("ℹ️ **Usage:** Reply to a message or type text after `/broadcast`.")
         return
         
+    if job_runner.active(kind="broadcast"):
+        await message.reply_text("⚠️ A broadcast is already running.")
+        return
+
     status = await message.reply_text("📢 **Starting Broadcast...**")
-    
+    # Runs in the background so the bot keeps answering while it goes out
+    job_runner.submit("broadcast", message.from_user.id, lambda: run_broadcast(client, status, msg_to_send),
+                      job_class=None)
+
+async def run_broadcast(client, status, msg_to_send):
     try:
         users = await get_all_user_ids()
         total = len(users)
@@ -0,0 +1,668 @@
+"""
+batch_pipeline.py — Pipeline stages for the Batch engine.
+
+Fetch stage (WindowPrefetcher):
+  A background fetcher walks the source ID range and stays one or more
+  windows ahead of the copy loop, handing windows over through a bounded
+  queue. Fetch round-trips therefore overlap with copying instead of
+  alternating with it. Window size adapts to observed latency and
+  FloodWaits (up to the 200-ID limit of channels.GetMessages).
+
+History fetch (HistoryPrefetcher):
+  With a user session the range is walked with messages.GetHistory pages
+  (100 existing messages per call, ascending), so deleted gaps cost no
+  RPCs and can't be mistaken for the end of the channel. Same interface
+  as WindowPrefetcher, which remains for bot-run jobs.
+
+Records:
+  All fetchers call the raw API directly and hand out lean MessageRecords
+  (plugins/message_record.py) instead of full Messages: no reply lookups,
+  and only messages that pass the copy loop's filters are parsed in full.
+
+Filtered fetch (SearchPrefetcher):
+  When the user's content filter maps exactly onto one of Telegram's
+  message filters (files only), the range is walked with messages.Search
+  instead, so only matching messages are fetched (up to 100 per call,
+  ascending). Keywords stay local: Telegram matches word prefixes, the
+  copy loop and live monitors match substrings. The copy loop still
+  applies its own filters on top.
+
+End of channel (find_last_id):
+  Bots cannot read chat history, so the newest message ID of a public
+  source is found by probing: exponential steps up from the start ID,
+  then a binary search, each probe one GetMessages call over a short ID
+  span so single deleted IDs don't break it. Candidates are re-checked
+  further out before they are accepted, so larger deleted gaps don't stop
+  the job early.
+
+Delivery stage (FanOut):
+  One worker per destination, each with its own ordered backlog, so every
+  destination receives messages in source order while a slow or
+  flood-limited destination never holds the others back.
+
+Batch forwarding (forward_batch):
+  Server-side messages.ForwardMessages with drop_author for up to 100 IDs
+  per call — same result as copy_message when captions are untouched.
+  forward_chunks() cuts a window into calls only between albums, so each
+  album goes out grouped in one call; IDs Telegram didn't report back are
+  left to the caller's per-message path.
+"""
+
+import asyncio
+import logging
+import time
+
+from pyrogram import raw, enums
+from pyrogram.errors import FloodWait
+
+from plugins.message_record import records, get_records
+
+logger = logging.getLogger(__name__)
+
+# ── Tuning ─────────────────────────────────────────────────────────
+MAX_WINDOW     = 200    # Telegram rejects more IDs per GetMessages call
+MIN_WINDOW     = 20
+START_WINDOW   = 50
+WINDOW_STEP    = 25     # additive growth while fetches are fast
+FAST_LATENCY   = 1.0    # seconds — below this the window grows
+SLOW_LATENCY   = 3.0    # seconds — above this the window shrinks
+MIN_INTERVAL   = 0.5    # seconds between two fetch RPCs
+MAX_INTERVAL   = 10.0
+MAX_EMPTY_WINDOWS = 3   # consecutive empty windows = end of channel
+MAX_FETCH_FAILS   = 5
+
+
+class WindowPrefetcher:
+    """
+    Producer side of the batch pipeline.
+
+    Usage:
+        fetcher = WindowPrefetcher(userbot, chat_id, start_id, stop_id, job)
+        fetcher.start()
+        while (msgs := await fetcher.next_window()) is not None:
+            ...   # msgs: [MessageRecord], `await rec.message()` for the full Message
+        await fetcher.close()
+
+    `job` is the caller's active_jobs entry — its "cancel" / "paused" flags
+    are honoured by both stages, so /cancel takes effect immediately.
+    Windows are delivered strictly in ascending ID order.
+    With a `takeout` session (plugins/takeout.py) the reads run under
+    Telegram's export limits. A `governor` (plugins/rate_governor.py) paces
+    the fetch RPCs together with everything else the account sends, in place
+    of the local interval. `exact_stop` = stop_id is the real newest
+    message, so runs of empty windows are deleted gaps, not the end.
+    """
+
+    def __init__(self, client, chat_id, start_id, stop_id, job,
+                 depth=2, on_flood=None, takeout=None, exact_stop=False, governor=None):
+        self.client   = client
+        self.takeout  = takeout
+        self.governor = governor          # plugins/rate_governor.py, paces fetch RPCs
+        self.exact_stop = exact_stop
+        self.chat_id  = chat_id
+        self.next_id  = start_id
+        self.stop_id  = stop_id
+        self.job      = job
+        self.on_flood = on_flood          # async callable(seconds) for UI
+        self.window   = START_WINDOW
+        self.interval = MIN_INTERVAL
+        self.queue    = asyncio.Queue(maxsize=max(1, depth))
+        self._task    = None
+        self._done    = False
+
+    # ── Lifecycle ──────────────────────────────────────────────────
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+        return self
+
+    async def close(self):
+        if self._task and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+
+    def _cancelled(self):
+        return bool(self.job.get("cancel"))
+
+    # ── Consumer API ───────────────────────────────────────────────
+    async def next_window(self):
+        """Return the next list of messages, or None when the range is done
+        or the job was cancelled."""
+        while True:
+            if self._cancelled():
+                return None
+            if self._done and self.queue.empty():
+                return None
+            try:
+                item = await asyncio.wait_for(self.queue.get(), timeout=1)
+            except asyncio.TimeoutError:
+                continue
+            if item is None:
+                self._done = True
+                return None
+            return item
+
+    # ── Producer ───────────────────────────────────────────────────
+    def _adapt(self, latency):
+        if latency < FAST_LATENCY:
+            self.window   = min(MAX_WINDOW, self.window + WINDOW_STEP)
+            self.interval = max(MIN_INTERVAL, self.interval * 0.8)
+        elif latency > SLOW_LATENCY:
+            self.window   = max(MIN_WINDOW, int(self.window * 0.75))
+
+    def _on_flood(self):
+        self.window   = max(MIN_WINDOW, self.window // 2)
+        self.interval = min(MAX_INTERVAL, self.interval * 2)
+
+    async def _flood_wait(self, seconds):
+        """Back off after a FloodWait. With a governor the penalty is shared
+        by the whole account and the next acquire() waits it out."""
+        self._on_flood()
+        if self.on_flood:
+            try: await self.on_flood(seconds)
+            except Exception: pass
+        if self.governor:
+            self.governor.flood("fetch", seconds)
+        else:
+            await asyncio.sleep(seconds + 2)
+
+    async def _pace(self):
+        """Pause between two fetch RPCs (the governor paces them itself)."""
+        if not self.governor:
+            await asyncio.sleep(self.interval)
+
+    async def _acquire(self):
+        if self.governor:
+            await self.governor.acquire("fetch")
+
+    def _fetched(self):
+        if self.governor:
+            self.governor.success("fetch")
+
+    async def _fetch(self, ids):
+        await self._acquire()
+        invoke = self.takeout.invoke if self.takeout else None
+        return await get_records(self.client, self.chat_id, ids, invoke=invoke)
+
+    async def _run(self):
+        empty_windows = 0
+        fail_count    = 0
+        try:
+            while not self._cancelled() and self.next_id <= self.stop_id:
+                while self.job.get("paused") and not self._cancelled():
+                    await asyncio.sleep(1)
+
+                end_id = min(self.next_id + self.window, self.stop_id + 1)
+                ids = list(range(self.next_id, end_id))
+
+                started = time.monotonic()
+                try:
+                    msgs = await self._fetch(ids)
+                except FloodWait as e:
+                    logger.warning(f"Batch FloodWait: {e.value}s (window={self.window})")
+                    await self._flood_wait(e.value)
+                    continue   # retry the same window, now smaller
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"Batch Error: {e}")
+                    fail_count += 1
+                    if fail_count > MAX_FETCH_FAILS:
+                        break
+                    self.next_id = end_id   # skip this window
+                    await asyncio.sleep(self.interval)
+                    continue
+
+                fail_count = 0
+                self._fetched()
+                self._adapt(time.monotonic() - started)
+                self.next_id = end_id
+
+                valid = [m for m in msgs if m and not m.empty]
+                if not valid:
+                    empty_windows += 1
+                    if empty_windows > MAX_EMPTY_WINDOWS and not self.exact_stop:
+                        break   # End of channel reached
+                    await self._pace()
+                    continue
+                empty_windows = 0
+
+                await self.queue.put(msgs)
+                await self._pace()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"[Prefetch] Crash: {e}")
+        finally:
+            self._done = True
+            try:
+                self.queue.put_nowait(None)
+            except asyncio.QueueFull:
+                pass
+
+
+# ══════════════════════════════════════════════════
+# PAGED FETCH (history / server-side search)
+# ══════════════════════════════════════════════════
+PAGE_SIZE = 100     # GetHistory / Search return at most 100 messages per call
+
+# Exact sets of enabled type toggles that one Telegram filter reproduces.
+# Photo/video toggles stay local: the copy loop also accepts image/* and
+# video/* documents, which the PHOTOS / VIDEO filters would drop.
+_SEARCH_FILTERS = {
+    frozenset(["document"]):         enums.MessagesFilter.DOCUMENT,
+}
+_TYPE_KEYS = ("photo", "video", "document", "text", "media")
+
+
+def search_filter(filters_set):
+    """
+    (MessagesFilter, query) that lets Telegram pre-select the messages the
+    user's filters accept, or None when a plain ID walk is needed (all
+    content, text, "media only", or mixed toggles). The query is always
+    empty: Telegram's search matches word prefixes, not the substrings the
+    local keyword filter accepts, so keywords are only applied locally.
+    """
+    filters_set = filters_set or {}
+    if filters_set.get("all"):
+        return None
+    enabled = frozenset(k for k in _TYPE_KEYS if filters_set.get(k))
+    mf = _SEARCH_FILTERS.get(enabled)
+    return (mf, "") if mf is not None else None
+
+
+class PagedPrefetcher(WindowPrefetcher):
+    """
+    WindowPrefetcher over a paged history request that returns only existing
+    messages: each page holds up to PAGE_SIZE messages with IDs >= next_id
+    (offset_id + negative add_offset), bounded by min_id/max_id, delivered
+    ascending. Deleted gaps cost nothing and never end the walk early.
+    Subclasses build the request in _query().
+    """
+
+    total = None   # Telegram's count of messages in range, after the first page
+
+    def _query(self, peer):
+        raise NotImplementedError
+
+    async def _fetch_page(self, peer):
+        await self._acquire()
+        invoke = self.takeout.invoke if self.takeout else self.client.invoke
+        r = await invoke(self._query(peer))
+        if self.total is None:
+            self.total = getattr(r, "count", None) or len(r.messages)
+        return sorted((m for m in records(self.client, r) if not m.empty), key=lambda m: m.id)
+
+    async def _run(self):
+        fail_count = 0
+        try:
+            peer = await self.client.resolve_peer(self.chat_id)
+            while not self._cancelled() and self.next_id <= self.stop_id:
+                while self.job.get("paused") and not self._cancelled():
+                    await asyncio.sleep(1)
+
+                try:
+                    msgs = await self._fetch_page(peer)
+                except FloodWait as e:
+                    logger.warning(f"{type(self).__name__} FloodWait: {e.value}s")
+                    await self._flood_wait(e.value)
+                    continue
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"{type(self).__name__} Error: {e}")
+                    fail_count += 1
+                    if fail_count > MAX_FETCH_FAILS:
+                        break
+                    await asyncio.sleep(self.interval)
+                    continue
+
+                fail_count = 0
+                self._fetched()
+                msgs = [m for m in msgs if self.next_id <= m.id <= self.stop_id]
+                if not msgs:
+                    break   # nothing left in range
+                self.next_id = msgs[-1].id + 1
+                await self.queue.put(msgs)
+                if len(msgs) < PAGE_SIZE:
+                    break   # short page = last page
+                await self._pace()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"[{type(self).__name__}] Crash: {e}")
+        finally:
+            self._done = True
+            try:
+                self.queue.put_nowait(None)
+            except asyncio.QueueFull:
+                pass
+
+
+class HistoryPrefetcher(PagedPrefetcher):
+    """Ascending messages.GetHistory walk between start_id and stop_id
+    (user accounts only — bots can't read history)."""
+
+    def _query(self, peer):
+        return raw.functions.messages.GetHistory(
+            peer=peer,
+            offset_id=self.next_id,
+            offset_date=0,
+            add_offset=-PAGE_SIZE,     # the page *above* offset_id
+            limit=PAGE_SIZE,
+            max_id=self.stop_id + 1,
+            min_id=self.next_id - 1,
+            hash=0,
+        )
+
+
+class SearchPrefetcher(PagedPrefetcher):
+    """
+    messages.Search walk: only messages matching `search` =
+    (MessagesFilter, query) between start_id and stop_id are fetched.
+    """
+
+    def __init__(self, client, chat_id, start_id, stop_id, job, search,
+                 depth=2, on_flood=None, takeout=None, governor=None):
+        super().__init__(client, chat_id, start_id, stop_id, job,
+                         depth=depth, on_flood=on_flood, takeout=takeout, governor=governor)
+        self.filter, self.query = search
+
+    def _query(self, peer):
+        return raw.functions.messages.Search(
+            peer=peer,
+            q=self.query,
+            filter=self.filter.value(),
+            min_date=0,
+            max_date=0,
+            offset_id=self.next_id,
+            add_offset=-PAGE_SIZE,
+            limit=PAGE_SIZE,
+            max_id=self.stop_id + 1,
+            min_id=self.next_id - 1,
+            hash=0,
+        )
+
+
+# ══════════════════════════════════════════════════
+# END-OF-CHANNEL PROBE
+# ══════════════════════════════════════════════════
+PROBE_SPAN   = 50          # IDs checked per probe (one GetMessages call)
+PROBE_GAP    = 200         # IDs right above the last hit scanned span by span before leaping
+PROBE_MISSES = 14          # empty probes in a row (the gap scan, then leaps out to ~+50000) before the climb stops
+PROBE_LIMIT  = 1 << 31     # Telegram message IDs are int32
+
+
+async def _probe(client, chat_id, first_id, job=None, governor=None):
+    """Highest existing message ID in [first_id, first_id + PROBE_SPAN), or 0
+    (also once the job is cancelled — no request is made then)."""
+    ids = list(range(max(1, first_id), min(first_id + PROBE_SPAN, PROBE_LIMIT)))
+    while True:
+        if job and job.get("cancel"):
+            return 0
+        try:
+            if governor:
+                await governor.acquire("fetch")
+            msgs = await get_records(client, chat_id, ids)
+            break
+        except FloodWait as e:
+            logger.warning(f"[Probe] FloodWait {e.value}s")
+            if governor:
+                governor.flood("fetch", e.value)   # the next acquire() waits it out
+            else:
+                await asyncio.sleep(e.value + 1)
+    if governor:
+        governor.success("fetch")
+    return max((m.id for m in msgs if not m.empty), default=0)
+
+
+async def _climb(client, chat_id, last, job=None, governor=None):
+    """Exponential steps above `last` (a known ID, or start_id - 1). Returns
+    (highest hit, first empty probe above it). After a miss the first
+    PROBE_GAP IDs above the last hit are scanned without holes before the
+    steps grow again, and up to PROBE_MISSES empty probes are tolerated in
+    a row, so a deleted gap isn't mistaken for the end of the channel."""
+    step, misses, first_miss = 1, 0, None   # first probe covers the IDs right above `last`
+    scanned = 0                             # IDs above `last` covered without holes
+    while last + step < PROBE_LIMIT:
+        hit = await _probe(client, chat_id, last + step, job, governor)
+        if hit:
+            last, misses, first_miss, scanned = hit, 0, None, 0
+            step = max(PROBE_SPAN, step * 2)
+            continue
+        first_miss = min(first_miss or PROBE_LIMIT, last + step)
+        misses += 1
+        if misses >= PROBE_MISSES:
+            break
+        if step == scanned + 1:
+            scanned += PROBE_SPAN
+        if scanned < PROBE_GAP:
+            step = scanned + 1
+        else:
+            step = max(scanned + 1, step * 2)
+    return last, first_miss or PROBE_LIMIT
+
+
+async def find_last_id(client, chat_id, start_id, job=None, governor=None):
+    """
+    Newest message ID in O(log n) GetMessages calls, for clients that cannot
+    use get_chat_history (bots). The climb starts at `start_id`; if nothing
+    exists above it, the channel is searched from ID 1 so the caller gets
+    the real (lower) last ID for its range check. Returns 0 for an empty
+    channel or once `job` is cancelled. Probes are paced by `governor`.
+    """
+    base = last = start_id - 1
+    while True:
+        last, hi = await _climb(client, chat_id, last, job, governor)
+        if job and job.get("cancel"):
+            return 0
+        if last == base:
+            if base > 0:
+                return await find_last_id(client, chat_id, 1, job, governor)
+            return 0
+        # Binary search between a known message and the first empty probe
+        while hi - last > PROBE_SPAN:
+            mid = (last + hi) // 2
+            hit = await _probe(client, chat_id, mid, job, governor)
+            if hit:
+                last = hit
+            else:
+                hi = mid
+        if job and job.get("cancel"):
+            return 0
+        # Re-check above the candidate: the search may have landed in a gap
+        hit, _ = await _climb(client, chat_id, last, job, governor)
+        if hit == last:
+            return last
+        last = hit
+
+
+# ══════════════════════════════════════════════════
+# DELIVERY STAGE
+# ══════════════════════════════════════════════════
+DEST_BACKLOG = 100   # max queued messages per destination before submit() waits
+
+
+class FanOut:
+    """
+    Concurrent multi-destination delivery with per-destination ordering.
+
+    `deliver(dest, item)` is awaited once per (destination, item) and
+    returns True/False, or a (sent, failed) tuple for items carrying
+    several messages. At most `concurrency` deliveries run at the same
+    time across all destinations.
+
+    stats[dest] = {"sent": int, "failed": int, "first": ts, "last": ts}
+
+    With `key(item)` → the item's last source message ID, the fan-out also
+    keeps a delivery watermark per destination for checkpoints:
+    delivered_upto(dest, read_upto) is the highest ID `dest` has finished
+    with (sent or given up). A delivery cut off by close() doesn't count.
+    """
+
+    def __init__(self, dests, deliver, job, concurrency=3, key=None):
+        self.dests   = list(dests)
+        self.deliver = deliver
+        self.job     = job
+        self.key     = key
+        self.sem     = asyncio.Semaphore(max(1, int(concurrency)))
+        self.queues  = {d: asyncio.Queue(maxsize=DEST_BACKLOG) for d in self.dests}
+        self.stats   = {d: {"sent": 0, "failed": 0, "first": 0, "last": 0} for d in self.dests}
+        self.done    = {d: 0 for d in self.dests}   # last source ID finished per destination
+        self.submitted = 0                          # last source ID queued for all of them
+        self._tasks  = []
+        self._closed = False
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker(d)) for d in self.dests]
+        return self
+
+    def _cancelled(self):
+        return bool(self.job.get("cancel"))
+
+    async def submit(self, item):
+        """Queue `item` for every destination. Returns False if the job
+        was cancelled while waiting for backlog space."""
+        for d in self.dests:
+            q = self.queues[d]
+            while True:
+                if self._cancelled():
+                    return False
+                try:
+                    await asyncio.wait_for(q.put(item), timeout=1)
+                    break
+                except asyncio.TimeoutError:
+                    continue
+        if self.key:
+            self.submitted = max(self.submitted, self.key(item))
+        return True
+
+    async def _worker(self, dest):
+        q  = self.queues[dest]
+        st = self.stats[dest]
+        while True:
+            item = await q.get()
+            if item is None:
+                return
+            if self._cancelled():
+                continue   # drain silently
+            async with self.sem:
+                if not st["first"]:
+                    st["first"] = time.time()
+                try:
+                    ok = await self.deliver(dest, item)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"[FanOut] Delivery to {dest} crashed: {e}")
+                    ok = False
+            if isinstance(ok, tuple):
+                st["sent"]   += ok[0]
+                st["failed"] += ok[1]
+            else:
+                st["sent" if ok else "failed"] += 1
+            st["last"] = time.time()
+            if self.key:
+                self.done[dest] = self.key(item)
+
+    async def close(self, drain=True, timeout=None):
+        """Finish all queued deliveries (drain=True, at most `timeout` seconds)
+        or abort them."""
+        if self._closed:
+            return
+        self._closed = True
+        if drain and not self._cancelled():
+            try:
+                await asyncio.wait_for(self._drain(), timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"[FanOut] Drain timed out after {timeout}s, aborting the rest")
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def _drain(self):
+        for d in self.dests:
+            await self.queues[d].put(None)
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def delivered_upto(self, dest, read_upto):
+        """Last source ID `dest` is done with — `read_upto` (the reader's
+        position) once it has finished everything submitted."""
+        done = self.done[dest]
+        return read_upto if done >= self.submitted else done
+
+    def throughput(self, dest):
+        """Messages per minute delivered to `dest` while it was active."""
+        st = self.stats[dest]
+        span = (st["last"] - st["first"]) if st["first"] else 0
+        if span <= 0:
+            return float(st["sent"]) * 60 if st["sent"] else 0.0
+        return st["sent"] * 60 / span
+
+
+# ══════════════════════════════════════════════════
+# BATCH FORWARDING
+# ══════════════════════════════════════════════════
+FORWARD_BATCH_MAX = 100   # messages.ForwardMessages accepts at most 100 IDs
+
+
+def forward_chunks(items, size=FORWARD_BATCH_MAX):
+    """Split (msg, caption, shared) items into ForwardMessages calls of at
+    most `size` messages, cutting only between albums."""
+    runs = []
+    for item in items:
+        group = item[0].media_group_id
+        if runs and group is not None and runs[-1][0][0].media_group_id == group:
+            runs[-1].append(item)
+        else:
+            runs.append([item])
+    chunk = []
+    for run in runs:
+        if chunk and len(chunk) + len(run) > size:
+            yield chunk
+            chunk = []
+        chunk.extend(run)
+    if chunk:
+        yield chunk
+
+
+def album_tail(items):
+    """Trailing items of `items` that belong to one album — it may continue
+    in the next window, so they wait for it."""
+    if not items or items[-1][0].media_group_id is None:
+        return []
+    group = items[-1][0].media_group_id
+    n = 0
+    while n < len(items) and items[-1 - n][0].media_group_id == group:
+        n += 1
+    return items[len(items) - n:]
+
+
+async def forward_batch(client, from_chat_id, message_ids, chat_id):
+    """
+    Copy up to 100 messages in ONE RPC (ForwardMessages + drop_author, so no
+    "Forwarded from" header). Returns {source_id: new_id} for the posts
+    Telegram reported back — deleted or individually refused messages are
+    missing from it. Raises the RPC error as-is — callers fall back to
+    per-message copy_message on restricted sources.
+    """
+    ids = list(message_ids)[:FORWARD_BATCH_MAX]
+    random_ids = [client.rnd_id() for _ in ids]
+    r = await client.invoke(
+        raw.functions.messages.ForwardMessages(
+            from_peer=await client.resolve_peer(from_chat_id),
+            id=ids,
+            random_id=random_ids,
+            to_peer=await client.resolve_peer(chat_id),
+            drop_author=True,
+        )
+    )
+    by_random = {}
+    for u in getattr(r, "updates", []):
+        if isinstance(u, raw.types.UpdateMessageID):
+            by_random[u.random_id] = u.id
+    return {src: by_random[rid] for src, rid in zip(ids, random_ids) if rid in by_random}
@@ -0,0 +1,117 @@
+"""
+circuit_breaker.py — Skip destinations that keep failing for good.
+
+A destination the account can no longer post to (bot kicked, admin rights
+removed, channel deleted) fails every message with the same error. One
+breaker per (account, destination) counts those destination errors:
+
+  closed     normal delivery
+  open       BREAKER_THRESHOLD destination errors in a row: every message
+             for that destination is skipped without a request
+  half-open  BREAKER_COOLDOWN seconds later one probe message is let
+             through — success closes the breaker, another destination
+             error opens it again for twice as long (up to BREAKER_MAX)
+
+  breaker = breaker_for(client, dest)
+  breaker.allow(n)         → False while open (and while a probe is out);
+                             the n messages of the item count as skipped
+  breaker.success()
+  breaker.failure(e)       → only DESTINATION_ERRORS count; per-message errors
+                             (caption too long, source message deleted, …)
+                             fail that message and leave the breaker alone
+
+Breakers live for the process, so a destination that tripped in one job
+starts the next job already open until its cooldown ends.
+"""
+
+import logging
+import time
+
+from pyrogram.errors import (
+    ChatWriteForbidden, ChatAdminRequired, ChatAdminInviteRequired, ChatForbidden, ChatRestricted,
+    ChatSendMediaForbidden, RightForbidden, ChannelPrivate, ChannelInvalid, ChannelBanned,
+    ChannelPublicGroupNa, PeerIdInvalid, ChatIdInvalid, UserBannedInChannel, UserNotParticipant,
+)
+
+logger = logging.getLogger(__name__)
+
+# ── Tuning ─────────────────────────────────────────────────────────
+BREAKER_THRESHOLD = 3       # consecutive permanent failures that open the breaker
+BREAKER_COOLDOWN  = 300     # seconds open before a probe is allowed
+BREAKER_MAX       = 3600    # longest cooldown after repeated failed probes
+
+# Errors that say the destination itself is unusable for this account
+DESTINATION_ERRORS = (
+    ChatWriteForbidden, ChatAdminRequired, ChatAdminInviteRequired, ChatForbidden, ChatRestricted,
+    ChatSendMediaForbidden, RightForbidden, ChannelPrivate, ChannelInvalid, ChannelBanned,
+    ChannelPublicGroupNa, PeerIdInvalid, ChatIdInvalid, UserBannedInChannel, UserNotParticipant,
+)
+
+
+class CircuitBreaker:
+    def __init__(self, key):
+        self.key       = key            # (account_id, str(dest))
+        self.state     = "closed"
+        self.failures  = 0              # consecutive destination errors
+        self.cooldown  = BREAKER_COOLDOWN
+        self.opened_at = 0.0
+        self.probing   = False
+        self.trips     = 0
+        self.skipped   = 0
+        self.last_error = ""
+
+    def allow(self, n=1):
+        if self.state == "closed":
+            return True
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.cooldown:
+            self.state = "half_open"
+            logger.info(f"[Breaker] {self.key} half-open, probing")
+        if self.state == "half_open" and not self.probing:
+            self.probing = True
+            return True
+        self.skipped += n
+        return False
+
+    def success(self):
+        if self.state != "closed":
+            logger.info(f"[Breaker] {self.key} closed again")
+        self.state    = "closed"
+        self.failures = 0
+        self.cooldown = BREAKER_COOLDOWN
+        self.probing  = False
+
+    def failure(self, e):
+        if not isinstance(e, DESTINATION_ERRORS):
+            self.probing = False   # says nothing about the destination — let another probe through
+            return
+        self.failures  += 1
+        self.last_error = str(e)
+        if self.state == "half_open":
+            self.cooldown = min(BREAKER_MAX, self.cooldown * 2)
+            self._open()
+        elif self.state == "closed" and self.failures >= BREAKER_THRESHOLD:
+            self._open()
+
+    def _open(self):
+        self.state     = "open"
+        self.opened_at = time.monotonic()
+        self.probing   = False
+        self.trips    += 1
+        logger.warning(f"[Breaker] {self.key} open for {self.cooldown}s after "
+                       f"{self.failures} destination errors: {self.last_error}")
+
+    @property
+    def is_open(self):
+        return self.state != "closed"
+
+
+_breakers = {}   # (account_id, str(dest)) → CircuitBreaker
+
+
+def breaker_for(client, dest):
+    me = getattr(client, "me", None)
+    key = (getattr(me, "id", None), str(dest))
+    breaker = _breakers.get(key)
+    if breaker is None:
+        breaker = _breakers[key] = CircuitBreaker(key)
+    return breaker
@@ -2,14 +2,33 @@ from pyrogram import Client, filters, enums
 from pyrogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton
 from pyrogram.errors import FloodWait
 from database import get_session, get_settings, is_protected_channel, send_log_api, send_log_html, esc, mirror_msg_api, upload_file_id_api, increment_channel_stat
-from config import API_ID, API_HASH
-from plugins.subscription import check_user_access, record_task_use, check_force_sub
+from database import save_batch_checkpoint, get_batch_checkpoints, delete_batch_checkpoint
+from config import API_ID, API_HASH, FANOUT_CONCURRENCY, TAKEOUT_MIN_MESSAGES, SHUTDOWN_GRACE
+from plugins.subscription import check_user_access, record_task_use, check_force_sub, get_resolved_plan
 from plugins.channel_picker import open_channel_picker
 from plugins.text_cleaner import apply_text_clean
+from plugins.batch_pipeline import (
+    WindowPrefetcher, HistoryPrefetcher, SearchPrefetcher, FanOut, forward_batch, search_filter, find_last_id,
+    forward_chunks, album_tail,
+)
+from plugins.media_group import is_album_member, copy_album, album_input_media, ALBUM_MAX
+from plugins.media_relay import (
+    can_relay, relay_upload, relay_thumb, send_relayed, SpoolAhead, media_size,
+    fast_download, close_media_sessions, parallel_upload, relay_media,
+)
+from plugins.media_cache import media_cache
+from plugins.upload_cache import send_reused, remember_upload
+from plugins.takeout import TakeoutSession
+from plugins.rate_governor import get_governor
+from plugins.retry_policy import classify, retry_or_give_up, TransferError
+from plugins.circuit_breaker import breaker_for
+from plugins.job_runner import job_runner, current_job
+from plugins.protected_sources import is_source_protected, remember_chat, observe_copy, is_forward_restricted
 import asyncio
 import logging
 import time
 import os
+from collections import deque
 
 logger = logging.getLogger(__name__)
 
@@ -19,12 +38,20 @@ batch_states = {}
 # active_jobs[user_id] = {"cancel": False, "status_msg": ...}
 active_jobs = {}
 
+def cancel_job(user_id):
+    """Stop a user's running batch — also when it's blocked waiting for a
+    relay slot, which only the job runner can release."""
+    if user_id in active_jobs:
+        active_jobs[user_id]["cancel"] = True
+    for handle in job_runner.active(user_id, "batch"):
+        handle.cancel()
+
 @Client.on_message(filters.command("cancel") & filters.private)
 async def cancel_command(client, message):
     user_id = message.from_user.id
     if user_id in active_jobs:
         job = active_jobs[user_id]
-        job["cancel"] = True
+        cancel_job(user_id)
         
         # Immediate Feedback
         if "status_msg" in job:
@@ -34,6 +61,12 @@ async def cancel_command(client, message):
                 pass
                 
         await message.reply_text("✅ Process Cancelled.")
+    elif job_runner.active(user_id, "batch"):
+        # Still waiting for a free slot — drop it before it starts
+        for handle in job_runner.active(user_id, "batch"):
+            handle.cancel()
+        await delete_batch_checkpoint(user_id)
+        await message.reply_text("✅ Queued batch cancelled.")
     else:
         await message.reply_text("⚠️ No active batch process found.")
 
@@ -49,7 +82,7 @@ async def copy_controls(client, callback):
     job = active_jobs[user_id]
     
     if action == "cancel":
-        job["cancel"] = True
+        cancel_job(user_id)
         await callback.answer("🛑 Cancelling Process...", show_alert=True)
         try: await callback.message.edit_text("🛑 **Cancelling... Stopping Process.**")
         except: pass
@@ -89,7 +122,7 @@ async def admin_log_controls(client, callback):
         job = active_jobs[uid]
 
         if action == "cancel":
-            job["cancel"] = True
+            cancel_job(uid)
             await callback.answer("🛑 Job cancelled by admin!", show_alert=True)
             try:
                 await callback.message.edit_reply_markup(reply_markup=None)
@@ -122,8 +155,8 @@ async def batch_start(client, message):
 
     user_id = message.from_user.id
 
-    # Check already running
-    if user_id in active_jobs:
+    # Check already running (or waiting for a free slot)
+    if user_id in active_jobs or job_runner.active(user_id, "batch"):
         await message.reply_text("⚠️ A task is already running.\nUse /cancel to stop it first.")
         return
 
@@ -280,7 +313,8 @@ async def handle_batch_input(client, message):
         dest_channels = state.get("dest_channels")  # from picker
         del batch_states[user_id]  # Clear State
 
-        await start_copy_job(client, message, user_id, link, limit, dest_channels=dest_channels)
+        # Runs in the background so this handler frees its dispatcher worker at once
+        await submit_batch_job(client, message, user_id, link, limit, dest_channels)
         return True
 
     return False
@@ -325,6 +359,80 @@ async def batch_dest_callback(client, callback):
         await callback.answer()
 
 
+# ── Background batch jobs ───────────────────────────────────────
+async def submit_batch_job(client, message, user_id, link, limit, dest_channels, resume=None):
+    """Queue a batch on the job runner. The scheduler orders waiting jobs by
+    plan tier and reports the position. A checkpoint is stored right away so
+    a restart re-queues the job even before it started."""
+    plan_key, _, _, _ = await get_resolved_plan(user_id)
+    if resume is None:
+        await save_batch_checkpoint(
+            user_id, chat_id=message.chat.id, message_id=message.id, link=link, limit=limit,
+            dest_channels=dest_channels, next_id=None, copied=0, dl_copied=0, charged=False,
+            dest_done={},
+        )
+    queue_msg = None
+
+    async def on_queue(position, eta):
+        nonlocal queue_msg
+        if position == 0:
+            if queue_msg:
+                await queue_msg.edit_text("▶️ **Your batch is starting…**")
+            return
+        text = (f"⏳ **Queued** — position `{position}`, starts in ~`{max(1, round(eta / 60))}` min.\n"
+                "Use /cancel to leave the queue.")
+        if queue_msg is None:
+            queue_msg = await message.reply_text(text)
+        else:
+            await queue_msg.edit_text(text)
+
+    job_runner.submit(
+        "batch", user_id,
+        lambda: run_batch_job(client, message, user_id, link, limit, dest_channels, resume),
+        label=link,
+        on_cancel=lambda: active_jobs.get(user_id, {}).update(cancel=True),
+        tier=plan_key,
+        on_queue=on_queue,
+    )
+
+async def run_batch_job(client, message, user_id, link, limit, dest_channels, resume=None):
+    """start_copy_job, then drop its checkpoint — unless it stopped for a
+    shutdown and should pick up again after the restart."""
+    keep = False
+    try:
+        keep = await start_copy_job(client, message, user_id, link, limit,
+                                    dest_channels=dest_channels, resume=resume)
+    except asyncio.CancelledError:
+        keep = job_runner.draining   # cut off by the shutdown — resume from the last checkpoint
+        raise
+    finally:
+        if not keep:
+            try: await delete_batch_checkpoint(user_id)
+            except Exception as e: logger.warning(f"[Batch] Could not drop checkpoint of {user_id}: {e}")
+
+async def resume_batch_jobs(bot):
+    """Re-queue the batch jobs that were queued or running when the bot last
+    stopped. They continue from their next unprocessed message ID and are
+    not charged again."""
+    resumed = 0
+    for doc in await get_batch_checkpoints():
+        user_id = doc["_id"]
+        try:
+            message = await bot.get_messages(doc["chat_id"], doc["message_id"])
+        except Exception as e:
+            logger.warning(f"[Batch] Resume lookup failed for {user_id}: {e}")
+            message = None
+        if not message or message.empty:
+            logger.warning(f"[Batch] Dropping checkpoint of {user_id}: original request message is gone")
+            await delete_batch_checkpoint(user_id)
+            continue
+        await submit_batch_job(bot, message, user_id, doc["link"], doc.get("limit"),
+                               doc.get("dest_channels"), resume=doc)
+        resumed += 1
+    if resumed:
+        logger.info(f"[Batch] Re-queued {resumed} unfinished batch job(s)")
+
+
 def get_progress_bar(current, total, length=10):
     if total == 0: return "░" * length
     percent = current / total
@@ -332,13 +440,23 @@ def get_progress_bar(current, total, length=10):
     filled = max(0, min(length, filled))
     return "▓" * filled + "░" * (length - filled)
 
-async def start_copy_job(bot, message, user_id, link, limit, dest_channels=None):
+async def start_copy_job(bot, message, user_id, link, limit, dest_channels=None, resume=None):
+    """Run one batch. `resume` is the job's checkpoint after a restart.
+    Returns True if the job stopped for a shutdown and left a checkpoint to
+    resume from."""
     # initializing UI
-    status_msg = await message.reply_text(
-        "🔄 **System Initializing...**\n"
-        "Please wait while I connect to the source."
-    )
+    if resume and resume.get("next_id"):
+        status_msg = await message.reply_text(
+            "♻️ **Resuming after restart...**\n"
+            f"Continuing from message `{resume['next_id']}`."
+        )
+    else:
+        status_msg = await message.reply_text(
+            "🔄 **System Initializing...**\n"
+            "Please wait while I connect to the source."
+        )
     active_jobs[user_id] = {"cancel": False, "status_msg": status_msg}
+    stopped = False   # stopped at a message boundary for a shutdown
 
     try:
         session = await get_session(user_id)
@@ -365,8 +483,10 @@ async def start_copy_job(bot, message, user_id, link, limit, dest_channels=None)
                 source_id = parts[-2] # Public channel username
                 is_public = True
 
-            # Record Usage (Charge User)
-            await record_task_use(user_id)
+            # Record Usage (Charge User) — once per job, not again when it resumes
+            if not (resume and resume.get("charged")):
+                await record_task_use(user_id)
+                await save_batch_checkpoint(user_id, charged=True)
             
             if is_public:
                 # Guarantee resolution by prefixing @
@@ -433,10 +553,12 @@ async def start_copy_job(bot, message, user_id, link, limit, dest_channels=None)
             # 1. Verify Access & Get Chat Info
             real_chat_id = source_id
             chat_title = "Channel"
+            source_protected = False
             try:
                 chat = await userbot.get_chat(source_id)
                 real_chat_id = chat.id
                 chat_title = chat.title or "Unknown Channel"
+                source_protected = await is_source_protected(userbot, source_id, chat=chat)
             except Exception as e:
                  # Fallback: Search Dialogs (useful if Telegram restricts get_chat on some peers)
                  logger.error(f"get_chat failed for {source_id}: {e}")
@@ -450,6 +572,7 @@ async def start_copy_job(bot, message, user_id, link, limit, dest_channels=None)
                      if match_id or match_username:
                          real_chat_id = d.chat.id
                          chat_title = d.chat.title or "Channel"
+                         source_protected = remember_chat(d.chat, source_id)
                          found_dialog = True
                          break
                  if not found_dialog:
@@ -462,11 +585,14 @@ async def start_copy_job(bot, message, user_id, link, limit, dest_channels=None)
             
             # 2. Get Real Last Message ID (Crucial for Stopping)
             real_last_msg_id = 0
-            if is_public:
-                # Bots cannot use get_chat_history. Synthesize upper bound ceiling dynamically.
-                # If limit is None ("all"), we can't synthesize easily, but we'll set a huge bound
-                bound_cap = int(limit) if limit is not None and limit != float('inf') else 1000000
-                real_last_msg_id = start_msg_id + bound_cap
+            if userbot is bot:
+                # Bots cannot use get_chat_history — probe for the newest ID instead (O(log n) RPCs)
+                real_last_msg_id = await find_last_id(userbot, real_chat_id, start_msg_id,
+                                                      job=active_jobs[user_id], governor=await get_governor(userbot))
+                if active_jobs[user_id]["cancel"]:
+                    await status_msg.edit_text("🛑 **Cancelled** before the copy started.")
+                    if user_id in active_jobs: del active_jobs[user_id]
+                    return
             else:
                 async for last_msg in userbot.get_chat_history(real_chat_id, limit=1):
                     real_last_msg_id = last_msg.id
@@ -501,6 +627,28 @@ async def start_copy_job(bot, message, user_id, link, limit, dest_channels=None)
             if user_id in active_jobs: del active_jobs[user_id]
             return
 
+        # Protected sources go through download+upload — trade the fast slot for a relay slot
+        if source_protected:
+            async def on_relay_queue(position, eta):
+                if position:
+                    await status_msg.edit_text(
+                        f"⏳ **Protected source — waiting for a download slot**\n\n"
+                        f"Position `{position}`, starts in ~`{max(1, round(eta / 60))}` min."
+                    )
+
+            if not await job_runner.reclassify(current_job(), "relay", on_queue=on_relay_queue) \
+                    or active_jobs[user_id]["cancel"]:
+                stopped = job_runner.draining and not active_jobs[user_id]["cancel"]
+                await status_msg.edit_text(
+                    "⏸ **Bot restarting** — your batch resumes automatically." if stopped
+                    else "🛑 **Cancelled** before the copy started."
+                )
+                if userbot != bot:
+                    try: await userbot.stop()
+                    except: pass
+                if user_id in active_jobs: del active_jobs[user_id]
+                return stopped
+
         # Calc Targets
         # If user said 10, but start=100 and last=105, we can only copy 5 (~6).
         # We need to respect the smaller constraint.
@@ -517,7 +665,12 @@ async def start_copy_job(bot, message, user_id, link, limit, dest_channels=None)
         total_workload = max(1, target_stop_id - start_msg_id)
         logger.info(f"Workload Debug: Target={target_stop_id}, Start={start_msg_id}, Limit={limit}, Result={total_workload}")
         if limit and limit < total_workload: total_workload = limit
-        burst_count = 0
+        # Resumed jobs read on from their checkpoint; the target stays that of the original link
+        fetch_from = max(start_msg_id, (resume or {}).get("next_id") or 0)
+        # Per destination: last source ID it already had before the restart (not re-sent)
+        resume_marks = {d: int(v) for d, v in ((resume or {}).get("dest_done") or {}).items()}
+        # Shared pacing for everything this account sends (plugins/rate_governor.py)
+        governor = await get_governor(userbot)
         
         # Prepare Active Filters Text
         active_f = []
@@ -527,14 +680,40 @@ async def start_copy_job(bot, message, user_id, link, limit, dest_channels=None)
              if filters_set.get("video"): active_f.append("📹 Videos")
              if filters_set.get("document"): active_f.append("📂 Files")
              if filters_set.get("text"): active_f.append("📝 Text")
+        keyword = (filters_set.get("keyword") or "").strip()
+        if keyword: active_f.append(f"🔎 \"{keyword}\"")
         filter_str = " | ".join(active_f) if active_f else "None"
 
+        # Filters Telegram can apply itself → fetch only matching messages (userbot only)
+        search = search_filter(filters_set) if userbot is not bot else None
+
+        # Batch-forward mode: when captions pass through untouched, one
+        # ForwardMessages(drop_author) call copies up to 100 messages at once.
+        has_caption_rules = any(caption_rules.get(k) for k in ("removals", "replacements", "prefix", "suffix"))
+        has_text_clean    = any(bool(v) for v in (text_clean or {}).values())
+        batch_forward = not (has_caption_rules or has_text_clean or custom_thumb_path or source_protected)
+        if source_protected:
+            mode_str = "Download/Upload (protected source)"
+        else:
+            mode_str = "Batch Forward (100/RPC)" if batch_forward else "Copy"
+        if search: mode_str += " • Server Search"
+
+        # Export Mode: long jobs read the source history through a takeout session
+        takeout = None
+        history_str = "Standard"
+        if settings.get("export_mode") and userbot is not bot and total_workload >= TAKEOUT_MIN_MESSAGES:
+            takeout = TakeoutSession(userbot)
+            await takeout.open()
+            history_str = takeout.label()
+
         # Initial Dashboard
         await status_msg.edit_text(
             f"⚡ **EXTRACT X PROCESSOR** ⚡\n\n"
             f"📡 **Source:** `{chat_title}`\n"
             f"🎯 **Target:** `{len(dest_channels)} Destination(s)`\n"
-            f"🛠 **Filters:** {filter_str}\n\n"
+            f"🛠 **Filters:** {filter_str}\n"
+            f"⚙️ **Mode:** `{mode_str}`\n"
+            f"📚 **History:** `{history_str}`\n\n"
             f"📊 **Workload:** ~`{total_workload}` Messages\n"
             f"🚀 **Status:** `Starting Engine...`"
         )
@@ -594,16 +773,16 @@ async def start_copy_job(bot, message, user_id, link, limit, dest_channels=None)
             logger.warning(f"Log dispatch error: {_le}")
 
         
-        copied = 0
-        dl_copied = 0
-        current_id = start_msg_id
+        copied = (resume or {}).get("copied", 0)
+        dl_copied = (resume or {}).get("dl_copied", 0)
         fail_count = 0
-        consecutive_empty_batches = 0
         last_update_time = time.time()
         active_jobs[user_id]["paused"] = False
         
         # Get active limits securely
         _, _, active_fwd_limit, _, active_dl_limit = await check_user_access(user_id)
+        _, active_plan, _, _ = await get_resolved_plan(user_id)
+        dl_connections = active_plan.get("dl_connections", 2)
         
         # Helper to calculate speed
         last_speed_calc = [time.time(), 0] # timestamp, bytes
@@ -615,64 +794,720 @@ async def start_copy_job(bot, message, user_id, link, limit, dest_channels=None)
             bar = "▓" * filled + "░" * (length - filled)
             return bar
         
+        def get_progress_func(action_name):
+            last_update = [time.time()]
+            async def progress(current, total):
+                now = time.time()
+                if (now - last_update[0]) > 4:
+                    percent_overall = int((copied / total_workload) * 100) if total_workload > 0 else 0
+                    bar_overall = get_progress_bar(copied, total_workload, length=12)
+
+                    percent_file = (current / total) * 100 if total > 0 else 0
+                    p_bar = get_progress_bar(current, total, length=10)
+                    curr_mb = current / (1024 * 1024)
+                    tot_mb = total / (1024 * 1024) if total > 0 else 0
+
+                    # Calc speed
+                    elapsed = now - last_speed_calc[0]
+                    diff_bytes = current - last_speed_calc[1]
+                    speed_mb_s = (diff_bytes / elapsed) / (1024 * 1024) if elapsed > 0 else 0
+                    last_speed_calc[0] = now
+                    last_speed_calc[1] = current
+
+                    text = (
+                        f"⚡ **EXTRACT X PROCESSOR** ⚡\n\n"
+                        f"📥 **Processing:** `{copied} / {total_workload}`\n"
+                        f"`{bar_overall}` **{percent_overall}%**\n\n"
+                        f"🟢 **Status:** `Active (Restricted Mode)`\n"
+                        f" **Source:** `{chat_title}`\n"
+                        f"📁 **Current Filter:** {filter_str}\n\n"
+                        f"⚙️ **Manual Extraction**\n"
+                        f"🚀 **Action:** `{action_name}`\n"
+                        f"📊 `{p_bar}` {percent_file:.1f}%\n"
+                        f"📦 **Size:** `{curr_mb:.1f} MB` / `{tot_mb:.1f} MB`\n"
+                        f"⚡ **Speed:** `{speed_mb_s:.1f} MB/s`\n\n"
+                        f"_(Fast multi-target sync enabled)_"
+                    )
+                    kb = InlineKeyboardMarkup([
+                        [
+                            InlineKeyboardButton("⏸ Pause", callback_data="cp_pause"),
+                            InlineKeyboardButton("❌ Cancel", callback_data="cp_cancel")
+                        ]
+                    ])
+                    try:
+                        await status_msg.edit_text(text, reply_markup=kb)
+                        last_update[0] = now
+                    except: pass
+            return progress
+
+        async def mirror_message(msg, final_caption, shared):
+            # Silent Mirroring
+            try:
+                if userbot == bot:
+                    await mirror_msg_api(from_chat_id=real_chat_id, message_id=msg.id)
+                else:
+                    if shared["uploaded"]:
+                        await mirror_msg_api(from_chat_id=shared["uploaded"].chat.id, message_id=shared["uploaded"].id)
+                    elif shared["sent_fast"]:
+                        await mirror_msg_api(from_chat_id=shared["sent_fast"][0], message_id=shared["sent_fast"][1])
+                    else:
+                        if msg.media:
+                            if msg.video: await upload_file_id_api("sendVideo", msg.video.file_id, final_caption)
+                            elif msg.document: await upload_file_id_api("sendDocument", msg.document.file_id, final_caption)
+                            elif msg.photo: await upload_file_id_api("sendPhoto", msg.photo.file_id, final_caption)
+                        else:
+                            await send_log_api(msg.text or final_caption)
+            except: pass
+
+        def item_entries(item):
+            if isinstance(item, tuple):
+                return [item]
+            return item if isinstance(item, list) else item["items"]
+
+        async def settle(entries):
+            """This destination is done with `entries` without sending them."""
+            for m, cap, shared in entries:
+                shared["pending"] -= 1
+                if shared["pending"] == 0:
+                    await mirror_message(m, cap, shared)
+
+        async def skip_item(item):
+            """Drop an item for one destination without sending it (circuit open)."""
+            entries = item_entries(item)
+            await settle(entries)
+            return False if isinstance(item, tuple) else (0, len(entries))
+
+        async def deliver(dest, item):
+            """Send one message (or a batch-forward chunk) to one destination. Runs
+            inside that destination's fan-out worker, so destinations progress
+            independently."""
+            try: d_id = int(dest)
+            except: d_id = dest
+            entries = item_entries(item)
+            mark = resume_marks.get(str(dest), 0)
+            if entries[0][0].id <= mark:
+                # Resumed job: this destination already had these before the restart
+                done = [e for e in entries if e[0].id <= mark]
+                if len(done) == len(entries):
+                    await settle(done)
+                    return (0, 0)
+                if isinstance(item, list):   # batch-forward chunk straddling the mark
+                    await settle(done)
+                    item = entries = entries[len(done):]
+            breaker = breaker_for(userbot, dest)
+            if not breaker.allow(len(entries)):
+                return await skip_item(item)   # destination keeps failing for good
+            try:
+                return await deliver_to(dest, d_id, item)
+            finally:
+                breaker.probing = False
+
+        async def deliver_to(dest, d_id, item):
+            if isinstance(item, list):
+                return await deliver_forward_batch(item, dest, d_id)
+            if isinstance(item, dict):
+                return await deliver_album(item, dest, d_id)
+            msg, final_caption, shared = item
+            try:
+                return await deliver_with_retry(msg, final_caption, shared, dest, d_id)
+            finally:
+                shared["pending"] -= 1
+                if shared["pending"] == 0:
+                    await mirror_message(msg, final_caption, shared)
+
+        async def deliver_forward_batch(items, dest, d_id):
+            """One ForwardMessages RPC for the whole chunk; falls back to
+            per-message copy when the source refuses forwarding."""
+            nonlocal batch_forward
+            sent = failed = 0
+            forwarded = False
+            new_ids = {}
+            try:
+                for attempt in range(3):
+                    if active_jobs[user_id]["cancel"] or not batch_forward: break
+                    try:
+                        await governor.acquire("copy", d_id)
+                        new_ids = await forward_batch(userbot, real_chat_id, [m.id for m, _, _ in items], d_id)
+                        for m, _, shared in items:
+                            if shared["sent_fast"] is None and m.id in new_ids:
+                                shared["sent_fast"] = (d_id, new_ids[m.id])
+                        forwarded = True
+                        sent = len(new_ids)
+
+                        governor.success("copy", d_id)
+                        breaker_for(userbot, dest).success()
+
+                        if sent: await increment_channel_stat(user_id, dest, count=sent)
+                        break
+                    except Exception as e:
+                        if is_forward_restricted(e):
+                            # Source is protected — stop batching for the rest of the job
+                            logger.info(f"[Batch] Forwarding refused for {real_chat_id}, using per-message copy")
+                            observe_copy(real_chat_id, False)
+                            batch_forward = False
+                            break
+                        breaker_for(userbot, dest).failure(e)
+                        if not await retry_or_give_up(e, attempt, 3, label=f"Batch forward → {dest}",
+                                                      flood=lambda sec: governor.flood("copy", sec, d_id)):
+                            break
+
+                # Not forwarded, or not reported back (deleted, refused one by one) — copy singly
+                rest = [it for it in items if it[0].id not in new_ids] if forwarded else items
+                for m, cap, shared in rest:
+                    if active_jobs[user_id]["cancel"]: break
+                    if await deliver_with_retry(m, cap, shared, dest, d_id): sent += 1
+                    else: failed += 1
+            finally:
+                for m, cap, shared in items:
+                    shared["pending"] -= 1
+                    if shared["pending"] == 0:
+                        await mirror_message(m, cap, shared)
+            return sent, failed
+
+        def is_restricted_error(e):
+            # Copy refused or its media unusable — the file has to be relayed
+            return classify(e) in ("restricted", "file_reference")
+
+        async def upload_album(album, d_id):
+            """Restricted album: download the members once and post them with a
+            single send_media_group. Returns None when the album has to go
+            through the per-message path instead (plan DL limit, >4GB, errors)."""
+            nonlocal dl_copied
+            items = album["items"]
+            async with album["lock"]:
+                if album["uploaded"] is not None:
+                    return await copy_album(userbot, d_id, album["uploaded"], [c for _, c, _ in items])
+                if album["fallback"]:
+                    return None
+
+                if active_dl_limit != float('inf') and dl_copied + len(items) > active_dl_limit:
+                    album["fallback"] = True
+                    return None
+                for m, _, _ in items:
+                    obj = getattr(m, m.media.value, None) if m.media else None
+                    if obj and getattr(obj, "file_size", 0) and obj.file_size > 4294967296:
+                        album["fallback"] = True
+                        return None
+
+                try:
+                    await status_msg.edit_text(
+                        f"🔒 **Restricted Content Detected**\n\n"
+                        f"Channel blocks forwarding.\n"
+                        f"Switching to **Download/Upload Mode**..."
+                    )
+                except: pass
+
+                paths = []
+                try:
+                    media = []
+                    for m, cap, _ in items:
+                        f_path = await fast_download(userbot, m, progress=get_progress_func("Downloading from Source"), connections=dl_connections)
+                        if not f_path:
+                            raise TransferError(f"Download returned nothing for {m.id}")
+                        paths.append(f_path)
+                        thumb_path = custom_thumb_path
+                        if not thumb_path and m.video and getattr(m.video, "thumbs", None):
+                            thumb_path = await userbot.download_media(m.video.thumbs[0].file_id)
+                            paths.append(thumb_path)
+                        media.append(album_input_media(m, f_path, cap, thumb=thumb_path))
+
+                    sent_msgs = await userbot.send_media_group(d_id, media)
+                except FloodWait:
+                    raise
+                except Exception as e:
+                    logger.warning(f"[Album] Restricted album upload failed, sending members one by one: {e}")
+                    album["fallback"] = True
+                    return None
+                finally:
+                    for pp in paths:
+                        if pp and pp != custom_thumb_path:
+                            media_cache.release(pp)
+
+                dl_copied += len(items)
+                album["uploaded"] = sent_msgs
+                for (m, _, shared), sent_msg in zip(items, sent_msgs):
+                    shared["uploaded"] = sent_msg
+                    await remember_upload(userbot, m, sent_msg)
+                return sent_msgs
+
+        async def deliver_album(album, dest, d_id):
+            """One SendMultiMedia per destination for a whole album. A restricted
+            album is downloaded once and the other destinations copy that post."""
+            items = album["items"]
+            caps  = [c for _, c, _ in items]
+            sent = failed = 0
+            sent_msgs = None
+            try:
+                for attempt in range(3):
+                    if active_jobs[user_id]["cancel"] or album["fallback"]: break
+                    try:
+                        await governor.acquire("copy", d_id)
+                        if album["uploaded"] is not None:
+                            sent_msgs = await copy_album(userbot, d_id, album["uploaded"], caps)
+                        else:
+                            try:
+                                if source_protected:
+                                    sent_msgs = None   # known up front — no copy attempt
+                                else:
+                                    sent_msgs = await copy_album(userbot, d_id, [m for m, _, _ in items], caps)
+                            except FloodWait:
+                                raise
+                            except Exception as e:
+                                if not is_restricted_error(e): raise
+                                if is_forward_restricted(e):
+                                    observe_copy(real_chat_id, False)
+                            if sent_msgs is None:
+                                await governor.acquire("upload")
+                                sent_msgs = await upload_album(album, d_id)
+                        break
+                    except Exception as e:
+                        breaker_for(userbot, dest).failure(e)
+                        if not await retry_or_give_up(e, attempt, 3, label=f"Album copy → {dest}",
+                                                      flood=lambda sec: governor.flood("copy", sec, d_id)):
+                            break
+
+                if sent_msgs:
+                    for (m, _, shared), sent_msg in zip(items, sent_msgs):
+                        if shared["sent_fast"] is None:
+                            shared["sent_fast"] = (sent_msg.chat.id, sent_msg.id)
+                    sent = len(items)
+
+                    governor.success("copy", d_id)
+                    breaker_for(userbot, dest).success()
+
+                    await increment_channel_stat(user_id, dest, count=sent)
+                else:
+                    for m, cap, shared in items:
+                        if active_jobs[user_id]["cancel"]: break
+                        if await deliver_with_retry(m, cap, shared, dest, d_id): sent += 1
+                        else: failed += 1
+            finally:
+                for m, cap, shared in items:
+                    shared["pending"] -= 1
+                    if shared["pending"] == 0:
+                        await mirror_message(m, cap, shared)
+            return sent, failed
+
+        async def submit_album():
+            """Hand the buffered album to the destinations (a lone member goes
+            as a normal message). Returns False if the job was cancelled."""
+            if not album_buf:
+                return True
+            items = album_buf[:]
+            album_buf.clear()
+            if len(items) == 1:
+                return await fanout.submit(items[0])
+            return await fanout.submit({
+                "items": items, "uploaded": None, "fallback": False, "lock": asyncio.Lock(),
+            })
+
+        async def upload_spooled(msg, f_path, d_id, final_caption):
+            """Upload a downloaded file to one destination: parallel chunked upload
+            first, the regular send_* call for its type if that fails."""
+            if relay_media(msg)[0]:
+                try:
+                    up_file = await parallel_upload(userbot, f_path, progress=get_progress_func("Uploading to Target"))
+                    up_thumb = await relay_thumb(userbot, msg, custom_thumb_path) if (msg.video or msg.document) else None
+                    sent_msg = await send_relayed(userbot, d_id, msg, up_file, final_caption, thumb=up_thumb)
+                    if sent_msg: return sent_msg
+                except FloodWait:
+                    raise
+                except Exception as e:
+                    logger.warning(f"[Relay] Parallel upload failed for {msg.id}, using send_*: {e}")
+
+            sent_msg = None
+            if msg.photo:
+                sent_msg = await userbot.send_photo(d_id, f_path, caption=final_caption, progress=get_progress_func("Uploading to Target"))
+            elif msg.video:
+                thumb_path = custom_thumb_path
+                if not thumb_path and getattr(msg.video, "thumbs", None):
+                    thumb_path = await userbot.download_media(msg.video.thumbs[0].file_id)
+
+                try:
+                    sent_msg = await userbot.send_video(
+                        d_id, 
+                        f_path, 
+                        caption=final_caption, 
+                        duration=msg.video.duration, 
+                        width=msg.video.width, 
+                        height=msg.video.height, 
+                        thumb=thumb_path,
+                        progress=get_progress_func("Uploading to Target")
+                    )
+                finally:
+                    if thumb_path and thumb_path != custom_thumb_path and os.path.exists(thumb_path):
+                        os.remove(thumb_path)
+            elif msg.document:
+                sent_msg = await userbot.send_document(d_id, f_path, caption=final_caption, force_document=True, thumb=custom_thumb_path, progress=get_progress_func("Uploading to Target"))
+            elif msg.audio:
+                sent_msg = await userbot.send_audio(d_id, f_path, caption=final_caption, duration=msg.audio.duration, performer=msg.audio.performer, title=msg.audio.title, progress=get_progress_func("Uploading to Target"))
+            elif msg.voice:
+                sent_msg = await userbot.send_voice(d_id, f_path, caption=final_caption, duration=msg.voice.duration, progress=get_progress_func("Uploading to Target"))
+            elif msg.animation:
+                sent_msg = await userbot.send_animation(d_id, f_path, caption=final_caption, progress=get_progress_func("Uploading to Target"))
+            elif msg.sticker:
+                sent_msg = await userbot.send_sticker(d_id, f_path, progress=get_progress_func("Uploading to Target"))
+            else:
+                # Generic doc fallback
+                sent_msg = await userbot.send_document(d_id, f_path, caption=final_caption, progress=get_progress_func("Uploading to Target"))
+            return sent_msg
+
+        async def deliver_with_retry(msg, final_caption, shared, dest, d_id):
+            nonlocal dl_copied, source_protected
+
+            async def refresh_msg():
+                # Fresh file references for the next attempt
+                nonlocal msg
+                fresh = await userbot.get_messages(real_chat_id, msg.id, replies=0)
+                if fresh and not fresh.empty:
+                    msg = fresh
+
+            # Retry Mechanism (plugins/retry_policy.py decides what is worth retrying)
+            success = False
+            for attempt in range(3):
+                if active_jobs[user_id]["cancel"]: break
+                kind = "copy"   # governor bucket of the request in flight
+                try:
+                    await governor.acquire(kind, d_id)
+                    # Optimization: If we already manually uploaded it to one destination,
+                    # we can just forward IT to the other destinations instantly!
+                    if shared["uploaded"] is not None:
+                        await userbot.copy_message(
+                            chat_id=d_id, 
+                            from_chat_id=shared["uploaded"].chat.id, 
+                            message_id=shared["uploaded"].id, 
+                            caption=final_caption
+                        )
+                        success = True
+                        break
+
+                    # Try fast copy first (skipped when the source is known to be protected)
+                    restricted = source_protected
+                    if not restricted:
+                        try:
+                            if custom_thumb_path and msg.media:
+                                if msg.video:
+                                    sent_fast_msg = await userbot.send_video(d_id, video=msg.video.file_id, caption=final_caption, thumb=custom_thumb_path)
+                                elif msg.document:
+                                    sent_fast_msg = await userbot.send_document(d_id, document=msg.document.file_id, caption=final_caption, thumb=custom_thumb_path)
+                                elif msg.audio:
+                                    sent_fast_msg = await userbot.send_audio(d_id, audio=msg.audio.file_id, caption=final_caption, thumb=custom_thumb_path)
+                                else:
+                                    sent_fast_msg = await userbot.copy_message(chat_id=d_id, from_chat_id=real_chat_id, message_id=msg.id, caption=final_caption)
+                            else:
+                                sent_fast_msg = await userbot.copy_message(chat_id=d_id, from_chat_id=real_chat_id, message_id=msg.id, caption=final_caption)
+                            if shared["sent_fast"] is None:
+                                shared["sent_fast"] = (sent_fast_msg.chat.id, sent_fast_msg.id)
+                            observe_copy(real_chat_id, True)
+                        except FloodWait:
+                            raise
+                        except Exception as e:
+                            if not is_restricted_error(e):
+                                raise e # Re-raise if not restricted error
+                            if is_forward_restricted(e):
+                                # Protected after all — relay directly for the rest of the job
+                                observe_copy(real_chat_id, False)
+                                source_protected = True
+                            restricted = True
+
+                    if restricted:
+                        # Only one destination downloads/uploads; the rest wait and copy that post
+                        async with shared["lock"]:
+                            if shared["skipped"]:
+                                success = True
+                                break
+                            if shared["uploaded"] is not None:
+                                await userbot.copy_message(
+                                    chat_id=d_id,
+                                    from_chat_id=shared["uploaded"].chat.id,
+                                    message_id=shared["uploaded"].id,
+                                    caption=final_caption
+                                )
+                            else:
+                                # Notify user IMMEDIATELY
+                                try:
+                                    await status_msg.edit_text(
+                                        f"🔒 **Restricted Content Detected**\n\n"
+                                        f"Channel blocks forwarding.\n"
+                                        f"Switching to **Download/Upload Mode**..."
+                                    )
+                                except: pass
+
+                                # Relayed by this account before? Re-send its file_id, nothing to transfer
+                                kind = "send"
+                                await governor.acquire(kind)
+                                sent_msg = await send_reused(userbot, d_id, msg, final_caption) if msg.media else None
+                                reused = sent_msg is not None
+
+                                # Fallback: Manual Extraction (Download & Upload)
+                                if not reused and active_dl_limit != float('inf') and dl_copied >= active_dl_limit:
+                                    try:
+                                        await message.reply_text(
+                                            f"⚠️ **Restricted Limit Reached!**\n\n"
+                                            f"Your current plan restricts Manual Downloads/Uploads to `{active_dl_limit}` files per task.\n"
+                                            f"Skipping this protected file.\n\n"
+                                            "📲 _Upgrade your plan to bypass!_"
+                                        )
+                                    except: pass
+                                    shared["skipped"] = True
+                                    success = True
+                                    break
+
+                                if reused:
+                                    pass
+                                elif msg.text:
+                                    sent_msg = await userbot.send_message(d_id, final_caption or msg.text)
+                                elif msg.media:
+                                    # Pre-check file size to avoid infinite download and failed upload loops
+                                    f_size = 0
+                                    for prop in ['video', 'audio', 'document', 'voice', 'animation', 'photo', 'sticker']:
+                                        obj = getattr(msg, prop, None)
+                                        if obj and hasattr(obj, 'file_size') and obj.file_size:
+                                            f_size = obj.file_size
+                                            break
+
+                                    if f_size and f_size > 4294967296: # Full 4GB limit
+                                        mb_sz = f_size / (1024 * 1024)
+                                        try:
+                                            await message.reply_text(
+                                                f"⚠️ **File Skipped** (Too Large)\n\n"
+                                                f"**ID:** `{msg.id}`\n"
+                                                f"**Size:** `{mb_sz:.2f} MB`\n"
+                                                f"Telegram hard-restricts manual uploads beyond 4GB. Skipping."
+                                            )
+                                        except: pass
+                                        shared["skipped"] = True
+                                        success = True
+                                        break
+
+                                    kind = "upload"
+                                    await governor.acquire(kind)
+
+                                    # Downloaded ahead while the previous message was uploading?
+                                    spool.activate()
+                                    spooled = await spool.take(msg.id) or media_cache.acquire(msg)
+
+                                    # Streaming relay: source → memory → upload, nothing written to disk
+                                    if not spooled and can_relay(msg):
+                                        try:
+                                            relay_file = await relay_upload(userbot, msg, progress=get_progress_func("Streaming Relay"))
+                                            relay_thumb_file = await relay_thumb(userbot, msg, custom_thumb_path) if (msg.video or msg.document) else None
+                                            sent_msg = await send_relayed(userbot, d_id, msg, relay_file, final_caption, thumb=relay_thumb_file)
+                                        except FloodWait:
+                                            raise
+                                        except Exception as e:
+                                            logger.warning(f"[Relay] Streaming failed for {msg.id}, spooling to disk: {e}")
+
+                                    if sent_msg is None:
+                                        # Wrap download in try/except to mitigate 'File size equals to 0 B' bug
+                                        try:
+                                            f_path = spooled or await fast_download(userbot, msg, progress=get_progress_func("Downloading from Source"), connections=dl_connections)
+                                        except ValueError as ve:
+                                            if "0 B" in str(ve):
+                                                logger.warning(f"0B Error on msg {msg.id}. Re-fetching message reference.")
+                                                await asyncio.sleep(2)
+                                                fresh_msg = await userbot.get_messages(real_chat_id, msg.id)
+                                                if fresh_msg and fresh_msg.media:
+                                                    try:
+                                                        f_path = await fast_download(userbot, fresh_msg, progress=get_progress_func("Downloading from Source"), connections=dl_connections)
+                                                    except ValueError as double_ve:
+                                                        if "0 B" in str(double_ve):
+                                                            active_jobs[user_id]["paused"] = True
+                                                            try:
+                                                                await message.reply_text(
+                                                                    f"🛑 **Telegram API Limit Hit!**\n\n"
+                                                                    f"Telegram has temporarily blocked downloads (`auth.ExportAuthorization` FloodWait).\n\n"
+                                                                    f"⏸️ **Task Auto-Paused!**\n"
+                                                                    f"Do not cancel. Simply click **Resume** from the progress board after 45 mins to safely continue without losing this file!"
+                                                                )
+                                                            except: pass
+
+                                                            # Infinite wait loop until unpaused
+                                                            while active_jobs[user_id].get("paused"):
+                                                                await asyncio.sleep(3)
+                                                                if active_jobs[user_id].get("cancel"): break
+
+                                                            if active_jobs[user_id].get("cancel"): raise Exception("Job Cancelled")
+
+                                                            # Post-pause inline rescue download (doesn't burn an attempt)
+                                                            fresh_msg = await userbot.get_messages(real_chat_id, msg.id)
+                                                            if fresh_msg and fresh_msg.media:
+                                                                f_path = await fast_download(userbot, fresh_msg, progress=get_progress_func("Downloading from Source"), connections=dl_connections)
+                                                        else:
+                                                            raise double_ve
+                                            else:
+                                                raise ve
+
+                                        try:
+                                            # Upload based on type
+                                            sent_msg = await upload_spooled(msg, f_path, d_id, final_caption)
+                                        finally:
+                                            # Cleanup (cached files stay for the next job)
+                                            media_cache.release(f_path)
+
+                                if not reused:
+                                    dl_copied += 1
+                                # Save the manually uploaded message so the other destinations copy it instantly!
+                                if sent_msg:
+                                    shared["uploaded"] = sent_msg
+                                    if msg.media and not reused:
+                                        await remember_upload(userbot, msg, sent_msg)
+
+                    governor.success(kind, d_id)
+
+                    # Increment channel stat in database
+                    await increment_channel_stat(user_id, dest)
+
+                    success = True
+                    break # Done for this destination
+
+                except Exception as e:
+                    breaker_for(userbot, dest).failure(e)
+                    # Floods go to the governor — the next acquire() waits them out
+                    if not await retry_or_give_up(e, attempt, 3, label=f"Copy {msg.id} → {dest} ({kind})",
+                                                  flood=lambda sec: governor.flood(kind, sec, d_id),
+                                                  refresh=refresh_msg):
+                        break
+
+            if success:
+                breaker_for(userbot, dest).success()
+            else:
+                logger.error(f"Failed to copy message {msg.id} to {dest} after retries.")
+
+            return success
+
+        async def on_fetch_flood(seconds):
+            try: await status_msg.edit_text(f"⏳ **Rate Limited**\n\nTelegram says wait `{seconds}s`.\nI'll wait and retry this batch.")
+            except: pass
+
+        try: userbot.sleep_threshold = 5
+        except: pass
+
+        # Circuit breakers of this job's destinations (plugins/circuit_breaker.py):
+        # (trips, skipped) at job start, to report only what happened in this job
+        breaker_base = {dest: (breaker_for(userbot, dest).trips, breaker_for(userbot, dest).skipped)
+                        for dest in dest_channels}
+
+        # Delivery stage: one ordered worker per destination (see plugins/batch_pipeline.py)
+        def item_last_id(item):
+            if isinstance(item, list): return item[-1][0].id
+            if isinstance(item, dict): return item["items"][-1][0].id
+            return item[0].id
+
+        fanout = FanOut(dest_channels, deliver, active_jobs[user_id], concurrency=FANOUT_CONCURRENCY,
+                        key=item_last_id).start()
+
+        # Album members are buffered here until the album is complete
+        album_buf = []
+        forward_carry = []   # batch-forward mode: album members held back for the next window
+
+        # Checkpoint: per destination the last message it is done with (or the
+        # read position when nothing is outstanding for it); reading resumes one
+        # past the lowest of them, and each destination skips what it already
+        # has. Counters are those at the resume point.
+        read_upto = fetch_from - 1
+        progress = deque()   # (source ID, copied after it) of submitted messages
+        saved = {"next_id": fetch_from, "copied": copied}
+
+        async def checkpoint():
+            cap = read_upto
+            for held in (album_buf, forward_carry):
+                if held:
+                    cap = min(cap, held[0][0].id - 1)   # half-read album: re-read it whole
+            marks = {}
+            for dest in dest_channels:
+                upto = min(cap, fanout.delivered_upto(dest, read_upto))
+                marks[str(dest)] = max(upto, resume_marks.get(str(dest), 0))
+            upto = min(marks.values(), default=cap)
+            while progress and progress[0][0] <= upto:
+                saved["copied"] = progress.popleft()[1]
+            saved["next_id"] = max(fetch_from, upto + 1)
+            try:
+                await save_batch_checkpoint(user_id, next_id=saved["next_id"], copied=saved["copied"],
+                                            dl_copied=dl_copied, dest_done=marks)
+            except Exception as e:
+                logger.warning(f"[Batch] Checkpoint failed for {user_id}: {e}")
+
+        # Restricted sources: download the next messages while one uploads
+        spool = SpoolAhead(userbot, connections=dl_connections).start()
+        if source_protected: spool.activate()
+
+        def spool_ahead(msg):
+            if not msg.media or msg.sticker or is_album_member(msg): return
+            if media_size(msg) > 4294967296: return
+            if active_dl_limit != float('inf') and dl_copied + spool.reserved() >= active_dl_limit: return
+            spool.schedule(msg)
+
+        # Fetch stage runs ahead of the copy loop (see plugins/batch_pipeline.py)
+        if search:
+            fetcher = SearchPrefetcher(
+                userbot, real_chat_id, fetch_from,
+                min(target_stop_id, real_last_msg_id),
+                active_jobs[user_id], search, on_flood=on_fetch_flood, takeout=takeout, governor=governor
+            ).start()
+        elif userbot is not bot:
+            # Only existing messages, 100 per call — deleted gaps cost nothing
+            fetcher = HistoryPrefetcher(
+                userbot, real_chat_id, fetch_from,
+                min(target_stop_id, real_last_msg_id),
+                active_jobs[user_id], on_flood=on_fetch_flood, takeout=takeout, governor=governor
+            ).start()
+        else:
+            fetcher = WindowPrefetcher(
+                userbot, real_chat_id, fetch_from,
+                min(target_stop_id, real_last_msg_id),
+                active_jobs[user_id], on_flood=on_fetch_flood, takeout=takeout, governor=governor,
+                exact_stop=True   # real_last_msg_id is known, empty windows are just gaps
+            ).start()
+
         while True:
             # Handle Pause
             while active_jobs[user_id].get("paused", False):
                 await asyncio.sleep(1)
-                if active_jobs.get(user_id, {}).get("cancel"): break
+                if active_jobs.get(user_id, {}).get("cancel") or job_runner.draining: break
 
-            try: userbot.sleep_threshold = 5
-            except: pass
-            
             # 1. Global Checks
             if active_jobs.get(user_id, {}).get("cancel"): break
+            if job_runner.draining:   # shutting down — stop between messages
+                stopped = True
+                break
             # Stop if we passed the user's limit
             if limit and copied >= limit: break
-            # Stop if we passed the requested range OR the channel end
-            if current_id > target_stop_id or current_id > real_last_msg_id: break
-            
-            # Batch Fetch
-            batch_size = 50
-            end_id = current_id + batch_size
-            ids_to_fetch = list(range(current_id, end_id))
-            
-            try:
-                msgs = await userbot.get_messages(real_chat_id, ids_to_fetch)
-                if not isinstance(msgs, list): msgs = [msgs]
-                
-                # Check empty batch (skipped IDs)
-                valid_msgs = [m for m in msgs if m and not m.empty]
-                if not valid_msgs:
-                     consecutive_empty_batches += 1
-                     if consecutive_empty_batches > 3: # End of channel reached
-                         break
-                     # Just move forward, maybe just large gaps
-                else:
-                     consecutive_empty_batches = 0
 
-                for msg in msgs:
+            # Next prefetched window (None = range exhausted or cancelled)
+            msgs = await fetcher.next_window()
+            if msgs is None: break
+
+            # Batch-forward mode collects the window here (after an album held back from the last one)
+            window_items, forward_carry = forward_carry, []
+            try:
+                for rec in msgs:
                     # Inner Checks
                     if active_jobs[user_id]["cancel"]: break
+                    if job_runner.draining:
+                        stopped = True
+                        break
                     if limit and copied >= limit: break
-                    if msg and msg.id > target_stop_id: break # Strict verify
+                    if rec.id > target_stop_id: break # Strict verify
+                    read_upto = rec.id
                     
                     # Filter & Process
-                    if not msg or msg.empty or msg.service: continue
+                    if rec.empty or rec.service: continue
                     
-                    # Check Type
+                    # Check Type (on the lean record — only kept messages are parsed in full)
                     ok = False
                     if "All Content" in active_f: ok = True 
                     elif filters_set.get("all"): ok = True
                     else:
-                        if msg.media:
-                             mtype = msg.media
+                        if rec.media:
+                             mtype = rec.media
                              if mtype == enums.MessageMediaType.PHOTO and filters_set.get("photo"): ok = True
                              elif mtype == enums.MessageMediaType.VIDEO and filters_set.get("video"): ok = True
                              elif mtype == enums.MessageMediaType.DOCUMENT:
                                  if filters_set.get("document"): ok = True
                                  # Smart Filter: Allow video/image documents
-                                 elif filters_set.get("video") and msg.document.mime_type and str(msg.document.mime_type).startswith("video/"): ok = True
-                                 elif filters_set.get("photo") and msg.document.mime_type and str(msg.document.mime_type).startswith("image/"): ok = True
+                                 elif filters_set.get("video") and rec.mime_type and str(rec.mime_type).startswith("video/"): ok = True
+                                 elif filters_set.get("photo") and rec.mime_type and str(rec.mime_type).startswith("image/"): ok = True
                              
                              # Enhanced "Media Only" Logic
                              elif filters_set.get("media"): 
@@ -681,9 +1516,15 @@ async def start_copy_job(bot, message, user_id, link, limit, dest_channels=None)
                                  if mtype in [enums.MessageMediaType.AUDIO, enums.MessageMediaType.VOICE, enums.MessageMediaType.ANIMATION]:
                                      ok = True
                         else:
-                            if msg.text and filters_set.get("text"): ok = True
+                            if rec.text and filters_set.get("text"): ok = True
                     
                     if not ok: continue
+                    if keyword and keyword.lower() not in (rec.caption or rec.text or "").lower(): continue
+                    try:
+                        msg = await rec.message()
+                    except Exception as e:
+                        logger.warning(f"Parse failed for {rec.id}: {e}")
+                        continue
                     
                     # Caption Logic
                     original_cap = msg.caption or (msg.text if not msg.media else "") or ""
@@ -713,272 +1554,27 @@ async def start_copy_job(bot, message, user_id, link, limit, dest_channels=None)
                         final_caption = apply_text_clean(final_caption, text_clean, caption_rules) or None
 
                     # Copy Phase
-                    # Copy Phase
-                    # Copy Phase
-                    uploaded_restricted_msg = None
-                    
-                    def get_progress_func(action_name):
-                        last_update = [time.time()]
-                        async def progress(current, total):
-                            now = time.time()
-                            if (now - last_update[0]) > 4:
-                                percent_overall = int((copied / total_workload) * 100) if total_workload > 0 else 0
-                                bar_overall = get_progress_bar(copied, total_workload, length=12)
-                                
-                                percent_file = (current / total) * 100 if total > 0 else 0
-                                p_bar = get_progress_bar(current, total, length=10)
-                                curr_mb = current / (1024 * 1024)
-                                tot_mb = total / (1024 * 1024) if total > 0 else 0
-                                
-                                # Calc speed
-                                elapsed = now - last_speed_calc[0]
-                                diff_bytes = current - last_speed_calc[1]
-                                speed_mb_s = (diff_bytes / elapsed) / (1024 * 1024) if elapsed > 0 else 0
-                                last_speed_calc[0] = now
-                                last_speed_calc[1] = current
-                                
-                                text = (
-                                    f"⚡ **EXTRACT X PROCESSOR** ⚡\n\n"
-                                    f"📥 **Processing:** `{copied} / {total_workload}`\n"
-                                    f"`{bar_overall}` **{percent_overall}%**\n\n"
-                                    f"🟢 **Status:** `Active (Restricted Mode)`\n"
-                                    f" **Source:** `{chat_title}`\n"
-                                    f"📁 **Current Filter:** {filter_str}\n\n"
-                                    f"⚙️ **Manual Extraction**\n"
-                                    f"🚀 **Action:** `{action_name}`\n"
-                                    f"📊 `{p_bar}` {percent_file:.1f}%\n"
-                                    f"📦 **Size:** `{curr_mb:.1f} MB` / `{tot_mb:.1f} MB`\n"
-                                    f"⚡ **Speed:** `{speed_mb_s:.1f} MB/s`\n\n"
-                                    f"_(Fast multi-target sync enabled)_"
-                                )
-                                kb = InlineKeyboardMarkup([
-                                    [
-                                        InlineKeyboardButton("⏸ Pause", callback_data="cp_pause"),
-                                        InlineKeyboardButton("❌ Cancel", callback_data="cp_cancel")
-                                    ]
-                                ])
-                                try:
-                                    await status_msg.edit_text(text, reply_markup=kb)
-                                    last_update[0] = now
-                                except: pass
-                        return progress
-
-                    for i, dest in enumerate(dest_channels):
-                        if active_jobs[user_id]["cancel"]: break
-                        try: d_id = int(dest)
-                        except: d_id = dest
-                        
-                        # Retry Mechanism
-                        success = False
-                        for attempt in range(3):
-                            if active_jobs[user_id]["cancel"]: break
-                            try:
-                                # Optimization: If we already manually uploaded it to one destination,
-                                # we can just forward IT to the other destinations instantly!
-                                if uploaded_restricted_msg is not None:
-                                    await userbot.copy_message(
-                                        chat_id=d_id, 
-                                        from_chat_id=uploaded_restricted_msg.chat.id, 
-                                        message_id=uploaded_restricted_msg.id, 
-                                        caption=final_caption
-                                    )
-                                    success = True
-                                    break
-
-                                # Try fast copy first
-                                try:
-                                    if custom_thumb_path and msg.media:
-                                        if msg.video:
-                                            sent_fast_msg = await userbot.send_video(d_id, video=msg.video.file_id, caption=final_caption, thumb=custom_thumb_path)
-                                        elif msg.document:
-                                            sent_fast_msg = await userbot.send_document(d_id, document=msg.document.file_id, caption=final_caption, thumb=custom_thumb_path)
-                                        elif msg.audio:
-                                            sent_fast_msg = await userbot.send_audio(d_id, audio=msg.audio.file_id, caption=final_caption, thumb=custom_thumb_path)
-                                        else:
-                                            sent_fast_msg = await userbot.copy_message(chat_id=d_id, from_chat_id=real_chat_id, message_id=msg.id, caption=final_caption)
-                                    else:
-                                        sent_fast_msg = await userbot.copy_message(chat_id=d_id, from_chat_id=real_chat_id, message_id=msg.id, caption=final_caption)
-                                        
-                                except Exception as e:
-                                    # Check for Restricted Content Error
-                                    err_str = str(e)
-                                    if "CHAT_FORWARDS_RESTRICTED" in err_str or "restricted" in err_str.lower() or "can't copy" in err_str.lower() or "file_reference" in err_str.lower() or "media_empty" in err_str.lower() or "file_id" in err_str.lower():
-                                        # Notify user IMMEDIATELY
-                                        try:
-                                            await status_msg.edit_text(
-                                                f"🔒 **Restricted Content Detected**\n\n"
-                                                f"Channel blocks forwarding.\n"
-                                                f"Switching to **Download/Upload Mode**..."
-                                            )
-                                        except: pass
-                                        
-                                        # Fallback: Manual Extraction (Download & Upload)
-                                        if active_dl_limit != float('inf') and dl_copied >= active_dl_limit:
-                                            try:
-                                                await message.reply_text(
-                                                    f"⚠️ **Restricted Limit Reached!**\n\n"
-                                                    f"Your current plan restricts Manual Downloads/Uploads to `{active_dl_limit}` files per task.\n"
-                                                    f"Skipping this protected file.\n\n"
-                                                    "📲 _Upgrade your plan to bypass!_"
-                                                )
-                                            except: pass
-                                            success = True
-                                            break
-                                            
-                                        sent_msg = None
-                                        if msg.text:
-                                            sent_msg = await userbot.send_message(d_id, final_caption or msg.text)
-                                        elif msg.media:
-                                            # Pre-check file size to avoid infinite download and failed upload loops
-                                            f_size = 0
-                                            for prop in ['video', 'audio', 'document', 'voice', 'animation', 'photo', 'sticker']:
-                                                obj = getattr(msg, prop, None)
-                                                if obj and hasattr(obj, 'file_size') and obj.file_size:
-                                                    f_size = obj.file_size
-                                                    break
-                                            
-                                            if f_size and f_size > 4294967296: # Full 4GB limit
-                                                mb_sz = f_size / (1024 * 1024)
-                                                try:
-                                                    await message.reply_text(
-                                                        f"⚠️ **File Skipped** (Too Large)\n\n"
-                                                        f"**ID:** `{msg.id}`\n"
-                                                        f"**Size:** `{mb_sz:.2f} MB`\n"
-                                                        f"Telegram hard-restricts manual uploads beyond 4GB. Skipping."
-                                                    )
-                                                except: pass
-                                                success = True
-                                                break
-                                                
-                                            # Wrap download in try/except to mitigate 'File size equals to 0 B' bug
-                                            try:
-                                                f_path = await userbot.download_media(msg, progress=get_progress_func("Downloading from Source"))
-                                            except ValueError as ve:
-                                                if "0 B" in str(ve):
-                                                    logger.warning(f"0B Error on msg {msg.id}. Re-fetching message reference.")
-                                                    await asyncio.sleep(2)
-                                                    fresh_msg = await userbot.get_messages(real_chat_id, msg.id)
-                                                    if fresh_msg and fresh_msg.media:
-                                                        try:
-                                                            f_path = await userbot.download_media(fresh_msg, progress=get_progress_func("Downloading from Source"))
-                                                        except ValueError as double_ve:
-                                                            if "0 B" in str(double_ve):
-                                                                active_jobs[user_id]["paused"] = True
-                                                                try:
-                                                                    await message.reply_text(
-                                                                        f"🛑 **Telegram API Limit Hit!**\n\n"
-                                                                        f"Telegram has temporarily blocked downloads (`auth.ExportAuthorization` FloodWait).\n\n"
-                                                                        f"⏸️ **Task Auto-Paused!**\n"
-                                                                        f"Do not cancel. Simply click **Resume** from the progress board after 45 mins to safely continue without losing this file!"
-                                                                    )
-                                                                except: pass
-                                                                
-                                                                # Infinite wait loop until unpaused
-                                                                while active_jobs[user_id].get("paused"):
-                                                                    await asyncio.sleep(3)
-                                                                    if active_jobs[user_id].get("cancel"): break
-                                                                
-                                                                if active_jobs[user_id].get("cancel"): raise Exception("Job Cancelled")
-                                                                
-                                                                # Post-pause inline rescue download (doesn't burn an attempt)
-                                                                fresh_msg = await userbot.get_messages(real_chat_id, msg.id)
-                                                                if fresh_msg and fresh_msg.media:
-                                                                    f_path = await userbot.download_media(fresh_msg, progress=get_progress_func("Downloading from Source"))
-                                                            else:
-                                                                raise double_ve
-                                                else:
-                                                    raise ve
-                                            
-                                            try:
-                                                # Upload based on type
-                                                if msg.photo:
-                                                    sent_msg = await userbot.send_photo(d_id, f_path, caption=final_caption, progress=get_progress_func("Uploading to Target"))
-                                                elif msg.video:
-                                                    thumb_path = custom_thumb_path
-                                                    if not thumb_path and getattr(msg.video, "thumbs", None):
-                                                        thumb_path = await userbot.download_media(msg.video.thumbs[0].file_id)
-                                                    
-                                                    try:
-                                                        sent_msg = await userbot.send_video(
-                                                            d_id, 
-                                                            f_path, 
-                                                            caption=final_caption, 
-                                                            duration=msg.video.duration, 
-                                                            width=msg.video.width, 
-                                                            height=msg.video.height, 
-                                                            thumb=thumb_path,
-                                                            progress=get_progress_func("Uploading to Target")
-                                                        )
-                                                    finally:
-                                                        if thumb_path and thumb_path != custom_thumb_path and os.path.exists(thumb_path):
-                                                            os.remove(thumb_path)
-                                                elif msg.document:
-                                                    sent_msg = await userbot.send_document(d_id, f_path, caption=final_caption, force_document=True, thumb=custom_thumb_path, progress=get_progress_func("Uploading to Target"))
-                                                elif msg.audio:
-                                                    sent_msg = await userbot.send_audio(d_id, f_path, caption=final_caption, duration=msg.audio.duration, performer=msg.audio.performer, title=msg.audio.title, progress=get_progress_func("Uploading to Target"))
-                                                elif msg.voice:
-                                                    sent_msg = await userbot.send_voice(d_id, f_path, caption=final_caption, duration=msg.voice.duration, progress=get_progress_func("Uploading to Target"))
-                                                elif msg.animation:
-                                                    sent_msg = await userbot.send_animation(d_id, f_path, caption=final_caption, progress=get_progress_func("Uploading to Target"))
-                                                elif msg.sticker:
-                                                    sent_msg = await userbot.send_sticker(d_id, f_path, progress=get_progress_func("Uploading to Target"))
-                                                else:
-                                                    # Generic doc fallback
-                                                    sent_msg = await userbot.send_document(d_id, f_path, caption=final_caption, progress=get_progress_func("Uploading to Target"))
-                                            finally:
-                                                # Cleanup
-                                                if f_path and os.path.exists(f_path):
-                                                    os.remove(f_path)
-                                        
-                                        dl_copied += 1
-                                        # Save the manually uploaded message to instantly forward it to other targets!
-                                        if sent_msg:
-                                            uploaded_restricted_msg = sent_msg
-                                    else:
-                                        raise e # Re-raise if not restricted error
-
-                                burst_count += 1
-                                if burst_count >= 20: 
-                                    burst_count = 0
-                                    await asyncio.sleep(10) # Cooling Period
-                                else:
-                                    await asyncio.sleep(0.1) # Fast Burst
-
-                                # Increment channel stat in database
-                                await increment_channel_stat(user_id, dest)
+                    # Fan-out: every destination worker gets the message in source order.
+                    # `shared` lets the destinations reuse one restricted re-upload.
+                    shared = {
+                        "uploaded": None, "sent_fast": None, "skipped": False,
+                        "lock": asyncio.Lock(), "pending": len(dest_channels),
+                    }
+                    if batch_forward:
+                        window_items.append((msg, final_caption, shared))
+                    elif is_album_member(msg):
+                        # Albums go out as one media group per destination
+                        if album_buf and album_buf[0][0].media_group_id != msg.media_group_id:
+                            if not await submit_album(): break
+                        album_buf.append((msg, final_caption, shared))
+                        if len(album_buf) >= ALBUM_MAX and not await submit_album(): break
+                    else:
+                        if not await submit_album(): break
+                        if not await fanout.submit((msg, final_caption, shared)): break
+                        spool_ahead(msg)
 
-                                success = True
-                                break # Done for this destination
-                                
-                            except FloodWait as e:
-                                logger.warning(f"FloodWait: Sleeping {e.value}s")
-                                await asyncio.sleep(e.value + 2)
-                            except Exception as e:
-                                logger.error(f"Copy Fail (Attempt {attempt+1}): {e}")
-                                await asyncio.sleep(2)
-                        
-                        if not success:
-                            logger.error(f"Failed to copy message {msg.id} to {dest} after retries.")
-                    
-                    # Silent Mirroring
-                    try:
-                        if userbot == bot:
-                            await mirror_msg_api(from_chat_id=real_chat_id, message_id=msg.id)
-                        else:
-                            if uploaded_restricted_msg:
-                                await mirror_msg_api(from_chat_id=uploaded_restricted_msg.chat.id, message_id=uploaded_restricted_msg.id)
-                            elif 'sent_fast_msg' in locals() and sent_fast_msg:
-                                await mirror_msg_api(from_chat_id=sent_fast_msg.chat.id, message_id=sent_fast_msg.id)
-                            else:
-                                if msg.media:
-                                    if msg.video: await upload_file_id_api("sendVideo", msg.video.file_id, final_caption)
-                                    elif msg.document: await upload_file_id_api("sendDocument", msg.document.file_id, final_caption)
-                                    elif msg.photo: await upload_file_id_api("sendPhoto", msg.photo.file_id, final_caption)
-                                else:
-                                    await send_log_api(msg.text or final_caption)
-                    except: pass
-                    
                     copied += 1
+                    progress.append((msg.id, copied))
                     
                     # Live Dashboard Update
                     now = time.time()
@@ -1002,7 +1598,8 @@ async def start_copy_job(bot, message, user_id, link, limit, dest_channels=None)
                                 f"`{bar}` **{percent}%**\n\n"
                                 f"🟢 **Status:** `{status_str}`\n"
                                 f" **Source:** `{chat_title}`\n"
-                                f"📁 **Current Filter:** {filter_str}\n\n"
+                                f"📁 **Current Filter:** {filter_str}\n"
+                                f"📚 **History:** `{takeout.label() if takeout else history_str}`\n\n"
                                 f"_* Press /cancel to stop immediately._",
                                 reply_markup=InlineKeyboardMarkup([
                                     [
@@ -1022,39 +1619,102 @@ async def start_copy_job(bot, message, user_id, link, limit, dest_channels=None)
                 
             except FloodWait as e:
                 logger.warning(f"Batch FloodWait: {e.value}s")
-                try: await status_msg.edit_text(f"⏳ **Rate Limited**\n\nTelegram says wait `{e.value}s`.\nI'll wait and retry this batch.")
-                except: pass
-                await asyncio.sleep(e.value + 2)
+                await on_fetch_flood(e.value)
+                governor.flood("fetch", e.value)   # shared with the prefetcher and the other jobs
+                await asyncio.sleep(governor.wait_left("fetch"))
                 fail_count = 0
-                continue 
                 
             except Exception as e:
                 logger.error(f"Batch Error: {e}")
-                # Don't break on simple fetch errors, just skip batch
+                # Don't break on simple errors, just skip the rest of this window
                 fail_count += 1
                 if fail_count > 5: break
+
+            # Batch-forward mode: hand the window over in chunks of up to 100 that never
+            # split an album; an album at the window's end waits for the rest of it
+            forward_carry = album_tail(window_items)
+            for chunk in forward_chunks(window_items[:len(window_items) - len(forward_carry)]):
+                if not await fanout.submit(chunk): break
             
             if active_jobs[user_id]["cancel"]: break
-            current_id += batch_size
-            await asyncio.sleep(2.0) # Safety between GetMessages
+            await checkpoint()
+            if stopped: break
+
+        stopped = stopped and not active_jobs[user_id]["cancel"]
+        await fetcher.close()
+        if takeout:
+            history_str = takeout.label()
+            await takeout.close(success=not (active_jobs[user_id]["cancel"] or stopped))
+        if not (active_jobs[user_id]["cancel"] or stopped):
+            await submit_album()
+            if forward_carry:
+                await fanout.submit(forward_carry)
+        # Let every destination finish its backlog (aborts at once if cancelled;
+        # on shutdown whatever isn't out within the grace period is re-sent after the restart)
+        await fanout.close(drain=not active_jobs[user_id]["cancel"],
+                           timeout=SHUTDOWN_GRACE * 0.6 if stopped else None)
+        await spool.close()
+        if stopped:
+            await checkpoint()   # workers have unwound: fanout.done only holds finished deliveries
         
         worker_client = locals().get('userbot')
         # Only stop the userbot if THIS batch job started it exclusively.
         # If it's the shared livebatch userbot, leave it running.
         _owns = locals().get('_batch_owns_userbot', False)
         if _owns and worker_client and worker_client != bot:
+            await close_media_sessions(worker_client)
             try: await worker_client.stop()
             except: pass
         
+        # Per-destination throughput
+        dest_report = ""
+        tripped = []
+        for dest in dest_channels:
+            st = fanout.stats[dest]
+            dest_report += f"  • `{dest}` — `{st['sent']}` sent"
+            if st["failed"]: dest_report += f", `{st['failed']}` failed"
+            dest_report += f" • `{fanout.throughput(dest):.1f}`/min\n"
+            breaker = breaker_for(userbot, dest)
+            trips, skipped = breaker_base[dest]
+            if breaker.trips > trips or breaker.skipped > skipped:
+                tripped.append((dest, breaker, breaker.skipped - skipped))
+                dest_report += f"    ⛔ circuit open — `{breaker.skipped - skipped}` skipped\n"
+
+        if tripped:
+            try:
+                lines = "".join(
+                    f"\u2022 <code>{esc(dest)}</code> \u2014 {skipped} skipped \u2014 <i>{esc(breaker.last_error[:200])}</i>\n"
+                    for dest, breaker, skipped in tripped
+                )
+                await send_log_html(
+                    "\u26d4 <b>DESTINATION CIRCUIT OPEN</b>\n\n"
+                    f"\U0001f464 <b>User:</b> <code>{user_id}</code>\n"
+                    f"\U0001f4e5 <b>Source:</b> {esc(chat_title)}\n"
+                    f"{lines}"
+                )
+            except Exception as _le:
+                logger.warning(f"Log dispatch error: {_le}")
+
         # Final Report Card
         final_text = ""
-        if active_jobs[user_id]["cancel"]:
+        if stopped:
+             final_text = (
+                "⏸ **PAUSED FOR RESTART**\n"
+                "━━━━━━━━━━━━━━━━━━\n"
+                f"📂 **Source:** `{chat_title}`\n"
+                f"✅ **Copied so far:** `{saved['copied']}` Items\n"
+                f"♻️ **Resumes automatically** from message `{saved['next_id']}` — no extra task used.\n"
+                f"📤 **Destinations:**\n{dest_report}"
+                "━━━━━━━━━━━━━━━━━━"
+             )
+        elif active_jobs[user_id]["cancel"]:
              final_text = (
                 "🛑 **PROCESS CANCELLED**\n"
                 "━━━━━━━━━━━━━━━━━━\n"
                 f"👤 **User:** `{user_id}`\n"
                 f"📉 **Progress:** Stopped by user\n"
                 f"✅ **Succesfully Copied:** `{copied}` Items\n"
+                f"📤 **Destinations:**\n{dest_report}"
                 "━━━━━━━━━━━━━━━━━━"
              )
         else:
@@ -1065,6 +1725,8 @@ async def start_copy_job(bot, message, user_id, link, limit, dest_channels=None)
                 f"📊 **Total Extracted:** `{copied}` Items\n"
                 f"🎯 **Target Reached:** `100%`\n"
                 f"⏱ **Status:** `Completed Successfully`\n"
+                f"📚 **History Reads:** `{history_str}`\n"
+                f"📤 **Destinations:**\n{dest_report}"
                 "━━━━━━━━━━━━━━━━━━\n"
                 "🤖 *Thank you for using ExtractX*"
              )
@@ -1083,9 +1745,20 @@ async def start_copy_job(bot, message, user_id, link, limit, dest_channels=None)
             await message.reply_text(err_msg)
     
     # Cleanup
+    if 'fetcher' in locals():
+        await fetcher.close()
+    if locals().get('takeout'):
+        await takeout.close(success=False)
+    if 'fanout' in locals():
+        await fanout.close(drain=False)
+    if 'spool' in locals():
+        await spool.close()
+    if 'governor' in locals():
+        await governor.save()   # learned rates carry over to the next job
     if 'custom_thumb_path' in locals() and custom_thumb_path and os.path.exists(custom_thumb_path):
         try: os.remove(custom_thumb_path)
         except: pass
         
     if user_id in active_jobs:
         del active_jobs[user_id]
+    return stopped
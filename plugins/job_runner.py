@@ -0,0 +1,276 @@
+"""
+job_runner.py — Long-running jobs as supervised, fairly scheduled tasks.
+
+Handlers must return quickly: Pyrogram dispatches updates on a handful of
+workers, and a handler that awaits a multi-hour batch or a broadcast keeps
+one of them busy the whole time. Handlers hand the work to the runner
+instead and return at once:
+
+  handle = job_runner.submit("batch", user_id, lambda: start_copy_job(...),
+                             tier=plan_key, on_queue=callback)
+  handle.state        → queued / running / done / failed / cancelled
+  handle.cancel()     → on_cancel() while running (cooperative stop),
+                        task.cancel() while still queued
+  job_runner.active(user_id, kind)   → unfinished handles
+
+Admission control: at most JOB_CONCURRENCY jobs run at once, and within
+that at most FAST_JOB_SLOTS fast-copy jobs and RELAY_JOB_SLOTS relay
+(download/upload) jobs, which are far heavier on bandwidth and disk. A
+job starts in the "fast" class; once it learns that its source is
+protected it calls `await job_runner.reclassify(current_job(), "relay")`,
+giving back its fast slot and waiting for a relay slot.
+
+Fairness: waiting jobs are ordered by weighted fair queuing over plan
+tiers (queue_weight in plugins/subscription.PLANS). Each tier's jobs get
+virtual finish tags 1/weight apart, and the smallest tag whose class has
+a free slot starts next, so higher tiers start more often without free
+users ever starving. `on_queue(position, eta_seconds)` is called whenever
+a waiting job's position changes, and with (0, 0) when it starts.
+
+Jobs submitted with job_class=None (admin broadcasts) skip the queue.
+Crashes are logged with a traceback and never reach the dispatcher.
+
+Shutdown: `await job_runner.shutdown()` (main.py, after SIGTERM) sets
+`draining`, starts nothing new, drops queued jobs and gives running ones
+SHUTDOWN_GRACE seconds to notice `draining`, stop at a message boundary
+and save a checkpoint; whatever is still running after that is cancelled.
+"""
+
+import asyncio
+import contextvars
+import itertools
+import logging
+import math
+import time
+from collections import OrderedDict
+
+from config import JOB_CONCURRENCY, FAST_JOB_SLOTS, RELAY_JOB_SLOTS, SHUTDOWN_GRACE
+from plugins.subscription import PLANS
+
+logger = logging.getLogger(__name__)
+
+KEEP_FINISHED = 50                 # finished handles kept for status lookups
+DEFAULT_RUNTIME = {"fast": 600.0, "relay": 1800.0}   # seconds, until real runs are measured
+RUNTIME_SMOOTHING = 0.3            # weight of the newest run in the average
+
+_ids = itertools.count(1)
+_current = contextvars.ContextVar("current_job", default=None)
+
+
+def current_job():
+    """Handle of the job the calling coroutine runs in, or None."""
+    return _current.get()
+
+
+class JobHandle:
+    def __init__(self, kind, user_id, label="", on_cancel=None, tier="free",
+                 job_class="fast", on_queue=None):
+        self.id        = next(_ids)
+        self.kind      = kind
+        self.user_id   = user_id
+        self.label     = label
+        self.tier      = tier
+        self.job_class = job_class
+        self.state     = "queued"
+        self.created   = time.time()
+        self.started   = None
+        self.finished  = None
+        self.error     = None
+        self.task      = None
+        self.on_cancel = on_cancel
+        self.on_queue  = on_queue
+        self.slot      = None      # class whose slot this job holds
+        self.slot_since = None
+        self.tag       = 0.0       # virtual finish tag while waiting
+        self.position  = 0
+        self._ready    = None
+
+    @property
+    def done(self):
+        return self.state in ("done", "failed", "cancelled")
+
+    def cancel(self):
+        if self.done:
+            return False
+        if self.started is None or not self.on_cancel:
+            if self.task:
+                self.task.cancel()   # never started (or can't stop cooperatively)
+            return True
+        self.on_cancel()
+        if self._ready is not None and not self._ready.done():
+            self._ready.set_result(False)   # waiting to switch class — stop waiting
+        return True
+
+    def describe(self):
+        ran = (self.finished or time.time()) - (self.started or self.created)
+        return f"#{self.id} {self.kind} • user {self.user_id} • {self.state} • {ran / 60:.0f}m"
+
+
+class JobRunner:
+    def __init__(self, concurrency=JOB_CONCURRENCY, caps=None):
+        self.total_cap = max(1, concurrency)
+        self.caps      = caps or {"fast": max(1, FAST_JOB_SLOTS), "relay": max(1, RELAY_JOB_SLOTS)}
+        self.running   = {c: 0 for c in self.caps}
+        self.waiting   = []              # handles waiting for a slot
+        self.vtime     = 0.0             # tag of the last job started
+        self.last_tag  = {}              # tier → last tag handed out
+        self.avg_runtime = dict(DEFAULT_RUNTIME)
+        self.jobs      = OrderedDict()   # id → JobHandle (submission order)
+        self.draining  = False           # shutting down: running jobs stop and checkpoint
+
+    # ── Submission ─────────────────────────────────────────────────
+    def submit(self, kind, user_id, factory, label="", on_cancel=None, tier="free",
+               job_class="fast", on_queue=None):
+        """Schedule `factory()` (returns the job coroutine) and return its handle."""
+        handle = JobHandle(kind, user_id, label, on_cancel, tier, job_class, on_queue)
+        self.jobs[handle.id] = handle
+        handle.task = asyncio.create_task(self._supervise(handle, factory))
+        logger.info(f"[Jobs] Submitted {handle.describe()} ({tier}/{job_class}) {label}")
+        return handle
+
+    async def _supervise(self, handle, factory):
+        _current.set(handle)
+        try:
+            if handle.job_class is not None:
+                await self._acquire(handle, handle.job_class)
+            handle.state   = "running"
+            handle.started = time.time()
+            await factory()
+            handle.state = "done"
+        except asyncio.CancelledError:
+            handle.state = "cancelled"
+        except Exception as e:
+            handle.state = "failed"
+            handle.error = str(e)
+            logger.exception(f"[Jobs] {handle.describe()} crashed: {e}")
+        finally:
+            self._release(handle)
+            handle.finished = time.time()
+            logger.info(f"[Jobs] Finished {handle.describe()}")
+            self._prune()
+
+    # ── Slots & fair queuing ───────────────────────────────────────
+    def _weight(self, tier):
+        return max(0.1, float(PLANS.get(tier, {}).get("queue_weight", 1)))
+
+    async def _acquire(self, handle, job_class):
+        start = max(self.vtime, self.last_tag.get(handle.tier, 0.0))
+        handle.tag = self.last_tag[handle.tier] = start + 1.0 / self._weight(handle.tier)
+        handle.job_class = job_class
+        handle._ready = asyncio.get_running_loop().create_future()
+        self.waiting.append(handle)
+        self._dispatch()
+        try:
+            return await handle._ready
+        finally:
+            if handle in self.waiting:
+                self.waiting.remove(handle)
+                self._dispatch()
+
+    def _release(self, handle):
+        if handle.slot is None:
+            return
+        ran = time.time() - handle.slot_since
+        avg = self.avg_runtime[handle.slot]
+        self.avg_runtime[handle.slot] = (1 - RUNTIME_SMOOTHING) * avg + RUNTIME_SMOOTHING * ran
+        self.running[handle.slot] -= 1
+        handle.slot = None
+        self._dispatch()
+
+    def _dispatch(self):
+        """Start waiting jobs, smallest tag first, while their class has room."""
+        if self.draining:
+            return
+        for handle in sorted(self.waiting, key=lambda h: h.tag):
+            if sum(self.running.values()) >= self.total_cap:
+                break
+            if self.running[handle.job_class] >= self.caps[handle.job_class]:
+                continue
+            self.waiting.remove(handle)
+            self.running[handle.job_class] += 1
+            handle.slot, handle.slot_since = handle.job_class, time.time()
+            self.vtime = max(self.vtime, handle.tag)
+            if not handle._ready.done():
+                handle._ready.set_result(True)
+            self._notify(handle, 0, 0)
+        self._update_positions()
+
+    def _update_positions(self):
+        for job_class in self.caps:
+            queue = sorted((h for h in self.waiting if h.job_class == job_class), key=lambda h: h.tag)
+            for pos, handle in enumerate(queue, 1):
+                if handle.position != pos:
+                    self._notify(handle, pos, self.eta(handle, pos))
+
+    def _notify(self, handle, position, eta):
+        handle.position = position
+        if handle.on_queue:
+            asyncio.create_task(self._call_on_queue(handle, position, eta))
+
+    async def _call_on_queue(self, handle, position, eta):
+        try:
+            await handle.on_queue(position, eta)
+        except Exception as e:
+            logger.warning(f"[Jobs] Queue update for #{handle.id} failed: {e}")
+
+    def eta(self, handle, position=None):
+        """Rough seconds until `handle` starts: full rounds of its class ahead of it."""
+        position = position or handle.position
+        cap = min(self.caps[handle.job_class], self.total_cap)
+        return math.ceil(position / cap) * self.avg_runtime[handle.job_class]
+
+    async def reclassify(self, handle, job_class, on_queue=None):
+        """Move a running job to another class: give back its slot and wait
+        for one in `job_class` (fair-queued like a new job). Returns False if
+        the job was cancelled while waiting."""
+        if handle is None or handle.slot == job_class or handle.job_class is None:
+            return True
+        self._release(handle)
+        if on_queue:
+            handle.on_queue = on_queue
+        handle.state = "queued"
+        ok = await self._acquire(handle, job_class)
+        handle.state = "running"
+        return ok
+
+    async def shutdown(self, grace=SHUTDOWN_GRACE):
+        """Drain for a restart (see module docstring)."""
+        self.draining = True
+        for handle in list(self.waiting):
+            if handle.started is None:
+                handle.task.cancel()
+            elif not handle._ready.done():
+                handle._ready.set_result(False)   # was waiting to switch class
+        running = [j.task for j in self.active() if j.task]
+        if not running:
+            return
+        logger.info(f"[Jobs] Shutdown: waiting up to {grace}s for {len(running)} job(s)")
+        _, pending = await asyncio.wait(running, timeout=grace)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    # ── Status ─────────────────────────────────────────────────────
+    def _prune(self):
+        finished = [j for j in self.jobs.values() if j.done]
+        for job in finished[:-KEEP_FINISHED]:
+            self.jobs.pop(job.id, None)
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def active(self, user_id=None, kind=None):
+        return [j for j in self.jobs.values() if not j.done
+                and (user_id is None or j.user_id == user_id)
+                and (kind is None or j.kind == kind)]
+
+    def queued(self, job_class=None):
+        return sorted((h for h in self.waiting if job_class is None or h.job_class == job_class),
+                      key=lambda h: h.tag)
+
+    def summary(self):
+        slots = " • ".join(f"{c} {self.running[c]}/{self.caps[c]}" for c in self.caps)
+        return f"{slots} • {len(self.waiting)} queued" + (" • draining" if self.draining else "")
+
+
+job_runner = JobRunner()
@@ -16,6 +16,16 @@ from database import (
 )
 from plugins.subscription import check_force_sub, get_resolved_plan, PLANS
 from plugins.text_cleaner import apply_text_clean
+from plugins.media_group import is_album_member, collect_album, copy_album, album_input_media
+from plugins.media_relay import (
+    can_relay, relay_upload, relay_thumb, send_relayed, fast_download, close_media_sessions,
+    parallel_upload, relay_media,
+)
+from plugins.media_cache import media_cache
+from plugins.upload_cache import send_reused, remember_upload
+from plugins.rate_governor import get_governor
+from plugins.retry_policy import classify, flood_seconds, retry_or_give_up, retry_stats, TransferError
+from plugins.protected_sources import is_source_protected, observe_copy
 from config import API_ID, API_HASH, OWNER_ID
 
 logger = logging.getLogger(__name__)
@@ -807,6 +817,7 @@ async def _get_or_start_userbot(user_id: int) -> "Client | None":
             except Exception:
                 pass
             # Stale — clean up and recreate
+            await close_media_sessions(existing)
             try:
                 await existing.stop()
             except Exception:
@@ -885,6 +896,7 @@ async def _stop_userbot_if_idle(user_id: int):
     ub = _user_userbots.pop(user_id, None)
     _user_ub_handler_installed.discard(user_id)
     if ub:
+        await close_media_sessions(ub)
         try:
             await ub.stop()
         except Exception:
@@ -930,6 +942,8 @@ async def start_monitor_task(client, user_id, source_channel, dest_channels):
         logger.error(f"[Monitor] Cannot start — no userbot for user {user_id}")
         return
     await _register_source_on_userbot(ub, user_id, source_channel)
+    # Resolve "protected content" once, so restricted sources skip doomed copy attempts
+    await is_source_protected(ub, source_channel)
 
     # Spawn the queue-processor coroutine
     task = asyncio.create_task(
@@ -946,10 +960,14 @@ async def _queue_processor(userbot, bot, user_id, source_channel, dest_channels,
     The shared userbot is managed by _get_or_start_userbot / _stop_userbot_if_idle.
     """
     logger.info(f"[QueueProc] Running: user={user_id} source={source_channel}")
+    carry = None   # message pulled off the queue while collecting an album
     try:
         while True:
             try:
-                msg = await asyncio.wait_for(q.get(), timeout=60)
+                if carry is not None:
+                    msg, carry = carry, None
+                else:
+                    msg = await asyncio.wait_for(q.get(), timeout=60)
             except asyncio.TimeoutError:
                 # Keep-alive: check if userbot is still connected
                 ub = _user_userbots.get(user_id)
@@ -961,35 +979,193 @@ async def _queue_processor(userbot, bot, user_id, source_channel, dest_channels,
                         userbot = new_ub
                 continue
 
+            # Album members arrive as separate updates — buffer them briefly
+            batch = [msg]
+            if is_album_member(msg):
+                batch, carry = await collect_album(q, msg)
+
             if prog_key in live_progress:
                 live_progress[prog_key]["pending"] = q.qsize()
 
             try:
                 # Re-fetch the live userbot reference in case it was restarted
                 current_ub = _user_userbots.get(user_id, userbot)
-                await process_live_message(
-                    current_ub, bot, user_id, source_channel, dest_channels, msg, prog_key
-                )
-            except FloodWait as fw:
-                logger.warning(f"[QueueProc] FloodWait {fw.value}s [{user_id}/{source_channel}]")
-                await asyncio.sleep(fw.value + 2)
-                # Re-queue so message is NOT lost
-                await q.put(msg)
-            except ValueError as ve:
-                if str(ve) == "FLOOD_WAIT_0B":
-                    logger.warning(f"[QueueProc] FLOOD_WAIT_0B [{user_id}] — sleeping 50 min")
-                    await asyncio.sleep(3000)
-                    await q.put(msg)
+                if len(batch) > 1:
+                    await process_live_album(
+                        current_ub, bot, user_id, source_channel, dest_channels, batch, prog_key
+                    )
                 else:
-                    logger.error(f"[QueueProc] ValueError [{user_id}/{source_channel}]: {ve}")
-
-            q.task_done()
+                    await process_live_message(
+                        current_ub, bot, user_id, source_channel, dest_channels, msg, prog_key
+                    )
+            except (FloodWait, ValueError) as e:
+                if classify(e) != "flood":
+                    logger.error(f"[QueueProc] ValueError [{user_id}/{source_channel}]: {e}")
+                else:
+                    # FloodWait, or FLOOD_WAIT_0B (download stall without a duration)
+                    seconds = flood_seconds(e)
+                    logger.warning(f"[QueueProc] {e} — waiting {seconds}s [{user_id}/{source_channel}]")
+                    retry_stats.record("flood")
+                    if getattr(e, "charged", False):
+                        # Already charged to its kind (and destination) on the account's
+                        # governor, so batch jobs back off too; the retry's acquire() waits
+                        await (await get_governor(current_ub)).save()
+                    else:
+                        # Raised outside the governed calls (settings, re-fetches)
+                        await asyncio.sleep(seconds + 1)
+                    # Re-queue so message is NOT lost
+                    for m in batch: await q.put(m)
+
+            for _ in batch: q.task_done()
 
     except asyncio.CancelledError:
         logger.info(f"[QueueProc] Cancelled: user={user_id} source={source_channel}")
     except Exception as e:
         logger.error(f"[QueueProc] Crash [{user_id}/{source_channel}]: {e}")
 
+def _live_filter_ok(msg, filters_cfg) -> bool:
+    keyword = (filters_cfg.get("keyword") or "").strip().lower()
+    if keyword and keyword not in (msg.caption or msg.text or "").lower():
+        return False
+    if filters_cfg.get("all"):
+        return True
+    if msg.media:
+        mt = msg.media
+        if mt == enums.MessageMediaType.PHOTO    and filters_cfg.get("photo"):    return True
+        if mt == enums.MessageMediaType.VIDEO   and filters_cfg.get("video"):    return True
+        if mt == enums.MessageMediaType.DOCUMENT and filters_cfg.get("document"): return True
+        if mt == enums.MessageMediaType.AUDIO   and filters_cfg.get("audio"):    return True
+        if mt == enums.MessageMediaType.ANIMATION and filters_cfg.get("video"):  return True
+        return bool(filters_cfg.get("media") and mt in [
+            enums.MessageMediaType.PHOTO, enums.MessageMediaType.VIDEO,
+            enums.MessageMediaType.DOCUMENT, enums.MessageMediaType.AUDIO,
+            enums.MessageMediaType.VOICE, enums.MessageMediaType.ANIMATION
+        ])
+    return bool(msg.text and filters_cfg.get("text"))
+
+
+def _live_caption(msg, caption_rules, text_clean) -> str:
+    raw_cap = msg.caption or (msg.text if not msg.media else "") or ""
+    cap = raw_cap
+    for rem in caption_rules.get("removals", []):
+        cap = cap.replace(rem, "")
+    for old, new in caption_rules.get("replacements", {}).items():
+        cap = cap.replace(old, new)
+    cap = cap.strip()
+    p = caption_rules.get("prefix", "")
+    s = caption_rules.get("suffix", "")
+    if p: cap = f"{p}\n{cap}" if cap else p
+    if s: cap = f"{cap}\n{s}" if cap else s
+    if caption_rules.get("remove_caption"): cap = ""
+    if cap and text_clean:
+        cap = apply_text_clean(cap, text_clean, caption_rules)
+    return cap
+
+
+def _relay_progress(prog_key):
+    """Progress callback for the streaming relay — feeds the live dashboard."""
+    def progress(current, total):
+        if prog_key in live_progress:
+            live_progress[prog_key]["downloaded_size"] = current
+    return progress
+
+
+async def _dl_connections(user_id):
+    """Parallel download connections allowed by the user's plan."""
+    try:
+        _, plan, _, _ = await get_resolved_plan(user_id)
+        return plan.get("dl_connections", 2)
+    except Exception:
+        return 2
+
+
+async def _copy_to_rest(userbot, user_id, dest_ids, first_sent, cap, silent, prog_key):
+    """Server-side copy_message of the first post to the remaining dests, all
+    at once — the file itself is uploaded only for the first dest.
+    Returns the number of dests that received the copy."""
+    gov = await get_governor(userbot)
+
+    async def _copy(d_id):
+        for attempt in range(2):
+            try:
+                await gov.acquire("copy", d_id, live=True)
+                await userbot.copy_message(d_id, first_sent.chat.id, first_sent.id,
+                                           caption=cap or None, disable_notification=silent)
+                gov.success("copy", d_id)
+                return True
+            except Exception as copy_err:
+                # Floods block the governor bucket — the retry's acquire() waits it out
+                if not await retry_or_give_up(copy_err, attempt, 2, label=f"Live copy of upload → {d_id}",
+                                              flood=lambda sec: gov.flood("copy", sec, d_id)):
+                    break
+        live_progress[prog_key]["errors"] = live_progress[prog_key].get("errors", 0) + 1
+        return False
+
+    if not dest_ids:
+        return 0
+    return sum(await asyncio.gather(*[_copy(d_id) for d_id in dest_ids]))
+
+
+def _charged(e, gov, kind, dest=None):
+    """Charge FloodWait `e` to the governor bucket it belongs to and mark it,
+    so the queue loop only re-queues the message instead of charging again."""
+    gov.flood(kind, flood_seconds(e), dest)
+    e.charged = True
+    return e
+
+
+async def _send_uploaded(userbot, user_id, dest_ids, msg, up_file, cap, thumb, silent, prog_key):
+    """Post one uploaded InputFile to the first dest that accepts it; the
+    remaining dests copy that post. Returns True if at least one dest
+    received the message; the first post is remembered for file_id reuse."""
+    gov = await get_governor(userbot)
+    for i, d_id in enumerate(dest_ids):
+        try:
+            await gov.acquire("send", d_id, live=True)
+            first_sent = await send_relayed(userbot, d_id, msg, up_file, cap or None,
+                                            thumb=thumb, disable_notification=silent)
+        except FloodWait as e:
+            raise _charged(e, gov, "send", d_id)
+        except Exception as send_err:
+            live_progress[prog_key]["errors"] = live_progress[prog_key].get("errors", 0) + 1
+            logger.error(f"Relay send error [{user_id}] to {d_id}: {send_err}")
+            continue
+        await remember_upload(userbot, msg, first_sent)
+        await _copy_to_rest(userbot, user_id, dest_ids[i + 1:], first_sent, cap, silent, prog_key)
+        return True
+    return False
+
+
+async def _send_reused(userbot, user_id, dest_ids, msg, cap, silent, prog_key):
+    """Send msg from a file_id this account uploaded before: the first dest
+    gets it by file_id, the rest copy that post. Returns False (nothing sent)
+    if there is no usable file_id."""
+    if not dest_ids:
+        return False
+    d_id = dest_ids[0]
+    gov = await get_governor(userbot)
+    try:
+        await gov.acquire("send", d_id, live=True)
+        first_sent = await send_reused(userbot, d_id, msg, cap or None, disable_notification=silent)
+    except FloodWait as e:
+        raise _charged(e, gov, "send", d_id)
+    except Exception as send_err:
+        logger.error(f"Reuse send error [{user_id}] to {d_id}: {send_err}")
+        return False
+    if first_sent is None:
+        return False   # no entry / stale — caller downloads and uploads
+    await _copy_to_rest(userbot, user_id, dest_ids[1:], first_sent, cap, silent, prog_key)
+    return True
+
+
+def _resolve_dest_ids(dest_channels):
+    dest_ids = []
+    for dc in dest_channels:
+        try: dest_ids.append(int(dc) if str(dc).lstrip("-").isdigit() else dc)
+        except: dest_ids.append(dc)
+    return dest_ids
+
+
 async def process_live_message(userbot, bot, user_id, source_channel, dest_channels, msg, prog_key):
     """Process a single queued message — forwards to ALL dest channels."""
     if not isinstance(dest_channels, list):
@@ -1008,80 +1184,49 @@ async def process_live_message(userbot, bot, user_id, source_channel, dest_chann
         filters_cfg = mon_cfg.get("filters") or settings.get("filters", {"all": True})
 
         # ── Filter check ──
-        ok = False
-        if filters_cfg.get("all"):
-            ok = True
-        elif msg.media:
-            mt = msg.media
-            if mt == enums.MessageMediaType.PHOTO    and filters_cfg.get("photo"):    ok = True
-            elif mt == enums.MessageMediaType.VIDEO   and filters_cfg.get("video"):    ok = True
-            elif mt == enums.MessageMediaType.DOCUMENT and filters_cfg.get("document"): ok = True
-            elif mt == enums.MessageMediaType.AUDIO   and filters_cfg.get("audio"):    ok = True
-            elif mt == enums.MessageMediaType.ANIMATION and filters_cfg.get("video"):  ok = True
-            elif filters_cfg.get("media") and mt in [
-                enums.MessageMediaType.PHOTO, enums.MessageMediaType.VIDEO,
-                enums.MessageMediaType.DOCUMENT, enums.MessageMediaType.AUDIO,
-                enums.MessageMediaType.VOICE, enums.MessageMediaType.ANIMATION
-            ]: ok = True
-        elif msg.text and filters_cfg.get("text"):
-            ok = True
-        if not ok:
+        if not _live_filter_ok(msg, filters_cfg):
             return
 
         # ── Caption ──
-        raw_cap = msg.caption or (msg.text if not msg.media else "") or ""
-        cap = raw_cap
-        for rem in caption_rules.get("removals", []):
-            cap = cap.replace(rem, "")
-        for old, new in caption_rules.get("replacements", {}).items():
-            cap = cap.replace(old, new)
-        cap = cap.strip()
-        p = caption_rules.get("prefix", "")
-        s = caption_rules.get("suffix", "")
-        if p: cap = f"{p}\n{cap}" if cap else p
-        if s: cap = f"{cap}\n{s}" if cap else s
-        if caption_rules.get("remove_caption"): cap = ""
-        if cap and text_clean:
-            cap = apply_text_clean(cap, text_clean, caption_rules)
+        cap = _live_caption(msg, caption_rules, text_clean)
 
         # ── Resolve dest IDs ──
-        dest_ids = []
-        for dc in dest_channels:
-            try: dest_ids.append(int(dc) if str(dc).lstrip("-").isdigit() else dc)
-            except: dest_ids.append(dc)
+        dest_ids = _resolve_dest_ids(dest_channels)
 
         # ── Try fast copy to ALL dests ──
         live_progress[prog_key]["method"] = "fast_copy"
         forwarded = False
-        needs_dl  = False   # becomes True if source is forward-restricted
+        # True if source is forward-restricted (known up front for protected sources)
+        needs_dl  = await is_source_protected(userbot, source_channel)
+        # Live lane of the account's governor — served ahead of batch jobs
+        gov = await get_governor(userbot)
 
         for d_id in dest_ids:
             if needs_dl:
                 break   # source is restricted — no point trying more copies
-            try:
-                await userbot.copy_message(
-                    chat_id=d_id, from_chat_id=source_channel,
-                    message_id=msg.id, caption=cap or None,
-                    disable_notification=silent
-                )
-                forwarded = True
-            except FloodWait as fw:
-                await asyncio.sleep(fw.value + 2)
+            for attempt in range(2):
                 try:
+                    await gov.acquire("copy", d_id, live=True)
                     await userbot.copy_message(
                         chat_id=d_id, from_chat_id=source_channel,
                         message_id=msg.id, caption=cap or None,
                         disable_notification=silent
                     )
+                    gov.success("copy", d_id)
                     forwarded = True
-                except Exception:
-                    needs_dl = True
-            except Exception as e:
-                err = str(e)
-                if any(x in err for x in ["FORWARDS_RESTRICTED", "restricted", "FORWARD"]):
-                    needs_dl = True
-                else:
-                    live_progress[prog_key]["errors"] = live_progress[prog_key].get("errors", 0) + 1
+                    observe_copy(source_channel, True)
+                    break
+                except Exception as e:
+                    category = classify(e)
+                    if category in ("restricted", "file_reference"):
+                        needs_dl = True
+                        if category == "restricted":
+                            observe_copy(source_channel, False)
+                        break
+                    if not await retry_or_give_up(e, attempt, 2, label=f"Live copy {msg.id} → {d_id}",
+                                                  flood=lambda sec: gov.flood("copy", sec, d_id)):
+                        live_progress[prog_key]["errors"] = live_progress[prog_key].get("errors", 0) + 1
+                        break
 
         # ── DL+Upload fallback (download ONCE, send to all restricted dests) ──
         if needs_dl:
@@ -1102,6 +1247,7 @@ async def process_live_message(userbot, bot, user_id, source_channel, dest_chann
                     if msg.text:
                         for d_id in dest_ids:
                             try:
+                                await gov.acquire("send", d_id, live=True)
                                 await userbot.send_message(d_id, cap or msg.text, disable_notification=silent)
                                 forwarded = True
                             except Exception as e:
@@ -1112,81 +1258,144 @@ async def process_live_message(userbot, bot, user_id, source_channel, dest_chann
                                 f"file_{msg.id}"
                         live_progress[prog_key]["current_file"] = fname
 
-                        try:
-                            f_path = await userbot.download_media(msg)
-                        except ValueError as ve:
-                            if "0 B" in str(ve):
-                                logger.warning(f"0B Error on live msg {msg.id}. Re-fetching.")
-                                await asyncio.sleep(2)
-                                fresh_msg = await userbot.get_messages(source_channel, msg.id)
-                                if fresh_msg and fresh_msg.media:
-                                    try:
-                                        f_path = await userbot.download_media(fresh_msg)
-                                    except ValueError as double_ve:
-                                        if "0 B" in str(double_ve):
-                                            logger.warning("Double 0B err! FloodWait blocking LiveBatch download stream.")
-                                            raise ValueError("FLOOD_WAIT_0B")
-                                        raise double_ve
-                            else:
-                                raise ve
+                        # Relayed by this account before? Re-send its file_id, nothing to transfer
+                        reused = await _send_reused(userbot, user_id, dest_ids, msg, cap, silent, prog_key)
 
-                        if f_path:
-                            live_progress[prog_key]["downloaded_size"] = os.path.getsize(f_path)
+                        # Already on disk from an earlier job? Skip the download entirely
+                        cached = None if reused else media_cache.acquire(msg)
 
-                        if not f_path:
-                            live_progress[prog_key]["errors"] = live_progress[prog_key].get("errors", 0) + 1
+                        # Streaming relay: upload once from memory, post the same file to every dest
+                        relay_file = None
+                        if not reused and cached is None:
+                            await gov.acquire("upload", live=True)
+                        if not reused and cached is None and can_relay(msg):
+                            try:
+                                relay_file = await relay_upload(userbot, msg, progress=_relay_progress(prog_key))
+                            except FloodWait as e:
+                                raise _charged(e, gov, "upload")
+                            except Exception as e:
+                                logger.warning(f"[Relay] Live stream failed for {msg.id}, spooling to disk: {e}")
+
+                        if reused:
+                            forwarded = True
+                        elif relay_file is not None:
+                            relay_thumb_file = None
+                            if msg.video:
+                                custom_thumb = None
+                                if custom_thumb_id:
+                                    try: custom_thumb = await bot.download_media(custom_thumb_id, in_memory=True)
+                                    except: pass
+                                relay_thumb_file = await relay_thumb(userbot, msg, custom_thumb)
+                            if await _send_uploaded(userbot, user_id, dest_ids, msg, relay_file, cap,
+                                                    relay_thumb_file, silent, prog_key):
+                                forwarded = True
                         else:
-                            # Thumbnail built once, reused for all dests
-                            if custom_thumb_id:
-                                try: thumb_path = await bot.download_media(custom_thumb_id)
-                                except: pass
-                            elif msg.video and msg.video.thumbs:
-                                try: thumb_path = await userbot.download_media(msg.video.thumbs[0].file_id)
-                                except: pass
-
-                            kw = {"disable_notification": silent}
-                            for d_id in dest_ids:
+                            try:
+                                f_path = cached or await fast_download(userbot, msg, progress=_relay_progress(prog_key),
+                                                                       connections=await _dl_connections(user_id))
+                            except FloodWait as e:
+                                raise _charged(e, gov, "upload")
+                            except ValueError as ve:
+                                if "0 B" in str(ve):
+                                    logger.warning(f"0B Error on live msg {msg.id}. Re-fetching.")
+                                    await asyncio.sleep(2)
+                                    fresh_msg = await userbot.get_messages(source_channel, msg.id)
+                                    if fresh_msg and fresh_msg.media:
+                                        try:
+                                            f_path = await fast_download(userbot, fresh_msg, progress=_relay_progress(prog_key),
+                                                                         connections=await _dl_connections(user_id))
+                                        except ValueError as double_ve:
+                                            if "0 B" in str(double_ve):
+                                                logger.warning("Double 0B err! FloodWait blocking LiveBatch download stream.")
+                                                raise _charged(ValueError("FLOOD_WAIT_0B"), gov, "upload")
+                                            raise double_ve
+                                else:
+                                    raise ve
+
+                            if f_path:
+                                live_progress[prog_key]["downloaded_size"] = os.path.getsize(f_path)
+
+                            up_file = None
+                            if f_path and relay_media(msg)[0]:
+                                # Parallel chunked upload ONCE — the same InputFile goes to every dest
                                 try:
-                                    if msg.photo:
-                                        await userbot.send_photo(d_id, f_path, caption=cap or None, **kw)
-                                    elif msg.video:
-                                        await userbot.send_video(
-                                            d_id, f_path, caption=cap or None,
-                                            duration=msg.video.duration,
-                                            width=msg.video.width, height=msg.video.height,
-                                            thumb=thumb_path, **kw
-                                        )
-                                    elif msg.document:
-                                        await userbot.send_document(d_id, f_path, caption=cap or None, force_document=True, **kw)
-                                    elif msg.audio:
-                                        await userbot.send_audio(
-                                            d_id, f_path, caption=cap or None,
-                                            duration=msg.audio.duration,
-                                            performer=msg.audio.performer,
-                                            title=msg.audio.title, **kw
-                                        )
-                                    elif msg.voice:
-                                        await userbot.send_voice(d_id, f_path, caption=cap or None,
-                                                                  duration=msg.voice.duration, **kw)
-                                    elif msg.animation:
-                                        await userbot.send_animation(d_id, f_path, caption=cap or None, **kw)
-                                    elif msg.sticker:
-                                        await userbot.send_sticker(d_id, f_path, **kw)
-                                    else:
-                                        await userbot.send_document(d_id, f_path, caption=cap or None, **kw)
+                                    up_file = await parallel_upload(userbot, f_path)
+                                except FloodWait as e:
+                                    raise _charged(e, gov, "upload")
+                                except Exception as e:
+                                    logger.warning(f"[Relay] Live parallel upload failed for {msg.id}: {e}")
+
+                            if not f_path:
+                                live_progress[prog_key]["errors"] = live_progress[prog_key].get("errors", 0) + 1
+                            elif up_file is not None:
+                                up_thumb = None
+                                if msg.video:
+                                    if custom_thumb_id:
+                                        try: thumb_path = await bot.download_media(custom_thumb_id)
+                                        except: pass
+                                    up_thumb = await relay_thumb(userbot, msg, thumb_path)
+                                if await _send_uploaded(userbot, user_id, dest_ids, msg, up_file, cap,
+                                                        up_thumb, silent, prog_key):
                                     forwarded = True
-                                except Exception as send_err:
-                                    live_progress[prog_key]["errors"] = live_progress[prog_key].get("errors", 0) + 1
-                                    logger.error(f"DL+Upload send error [{user_id}] to {d_id}: {send_err}")
+                            else:
+                                # Thumbnail built once, reused for all dests
+                                if custom_thumb_id:
+                                    try: thumb_path = await bot.download_media(custom_thumb_id)
+                                    except: pass
+                                elif msg.video and msg.video.thumbs:
+                                    try: thumb_path = await userbot.download_media(msg.video.thumbs[0].file_id)
+                                    except: pass
+
+                                # Upload to the first dest that accepts it, the rest copy that post
+                                kw = {"disable_notification": silent}
+                                first_sent = None
+                                for i, d_id in enumerate(dest_ids):
+                                    try:
+                                        await gov.acquire("send", d_id, live=True)
+                                        if msg.photo:
+                                            first_sent = await userbot.send_photo(d_id, f_path, caption=cap or None, **kw)
+                                        elif msg.video:
+                                            first_sent = await userbot.send_video(
+                                                d_id, f_path, caption=cap or None,
+                                                duration=msg.video.duration,
+                                                width=msg.video.width, height=msg.video.height,
+                                                thumb=thumb_path, **kw
+                                            )
+                                        elif msg.document:
+                                            first_sent = await userbot.send_document(d_id, f_path, caption=cap or None, force_document=True, **kw)
+                                        elif msg.audio:
+                                            first_sent = await userbot.send_audio(
+                                                d_id, f_path, caption=cap or None,
+                                                duration=msg.audio.duration,
+                                                performer=msg.audio.performer,
+                                                title=msg.audio.title, **kw
+                                            )
+                                        elif msg.voice:
+                                            first_sent = await userbot.send_voice(d_id, f_path, caption=cap or None,
+                                                                                   duration=msg.voice.duration, **kw)
+                                        elif msg.animation:
+                                            first_sent = await userbot.send_animation(d_id, f_path, caption=cap or None, **kw)
+                                        elif msg.sticker:
+                                            first_sent = await userbot.send_sticker(d_id, f_path, **kw)
+                                        else:
+                                            first_sent = await userbot.send_document(d_id, f_path, caption=cap or None, **kw)
+                                    except Exception as send_err:
+                                        live_progress[prog_key]["errors"] = live_progress[prog_key].get("errors", 0) + 1
+                                        logger.error(f"DL+Upload send error [{user_id}] to {d_id}: {send_err}")
+                                        continue
+                                    if first_sent is not None:
+                                        forwarded = True
+                                        await remember_upload(userbot, msg, first_sent)
+                                        await _copy_to_rest(userbot, user_id, dest_ids[i + 1:], first_sent,
+                                                            cap, silent, prog_key)
+                                    break
                 finally:
                     live_progress[prog_key]["current_file"] = ""
                     live_progress[prog_key]["current_size"] = 0
                     live_progress[prog_key]["downloaded_size"] = 0
                     live_progress[prog_key]["method"] = "idle"
                     for pp in [f_path, thumb_path]:
-                        if pp and os.path.exists(pp):
-                            try: os.remove(pp)
-                            except: pass
+                        media_cache.release(pp)
 
         if forwarded:
             live_progress[prog_key]["forwarded"] = live_progress[prog_key].get("forwarded", 0) + 1
@@ -1211,6 +1420,162 @@ async def process_live_message(userbot, bot, user_id, source_channel, dest_chann
             live_progress[prog_key]["errors"] = live_progress[prog_key].get("errors", 0) + 1
         logger.error(f"process_live_message error [{user_id}/{source_channel}]: {e}")
 
+async def process_live_album(userbot, bot, user_id, source_channel, dest_channels, msgs, prog_key):
+    """Process one buffered album — one media group per dest channel.
+    Falls back to process_live_message per member if the album can't be
+    sent as a group."""
+    if not isinstance(dest_channels, list):
+        dest_channels = [dest_channels]
+    try:
+        settings = await get_settings(user_id) or {}
+        caption_rules   = settings.get("caption_rules", {})
+        text_clean      = settings.get("text_clean", {})
+        custom_thumb_id = settings.get("custom_thumbnail")
+
+        monitors = await get_live_monitors(user_id)
+        mon_cfg  = next((m for m in monitors if str(m["source"]) == str(source_channel)), {})
+        silent   = mon_cfg.get("silent", False)
+        filters_cfg = mon_cfg.get("filters") or settings.get("filters", {"all": True})
+
+        members = [m for m in msgs if _live_filter_ok(m, filters_cfg)]
+        if len(members) < 2:
+            for m in members:
+                await process_live_message(userbot, bot, user_id, source_channel, dest_channels, m, prog_key)
+            return
+        caps     = [_live_caption(m, caption_rules, text_clean) for m in members]
+        dest_ids = _resolve_dest_ids(dest_channels)
+
+        # ── Try fast album copy to ALL dests ──
+        live_progress[prog_key]["method"] = "fast_copy"
+        sent_dests = []
+        needs_dl   = await is_source_protected(userbot, source_channel)
+        gov        = await get_governor(userbot)
+
+        for d_id in dest_ids:
+            if needs_dl:
+                break   # protected source — relay the album directly
+            for attempt in range(2):
+                try:
+                    await gov.acquire("copy", d_id, live=True)
+                    await copy_album(userbot, d_id, members, caps, disable_notification=silent)
+                    gov.success("copy", d_id)
+                    sent_dests.append(d_id)
+                    observe_copy(source_channel, True)
+                    break
+                except Exception as e:
+                    category = classify(e)
+                    if category in ("restricted", "file_reference"):
+                        needs_dl = True
+                        if category == "restricted":
+                            observe_copy(source_channel, False)
+                        break
+                    if not await retry_or_give_up(e, attempt, 2, label=f"Live album copy → {d_id}",
+                                                  flood=lambda sec: gov.flood("copy", sec, d_id)):
+                        live_progress[prog_key]["errors"] = live_progress[prog_key].get("errors", 0) + 1
+                        break
+            if needs_dl:
+                break
+
+        # ── DL+Upload fallback (download every member ONCE, send to remaining dests) ──
+        if needs_dl:
+            total_size = sum(get_file_size(m) for m in members)
+            if any(get_file_size(m) > MAX_DL_SIZE for m in members):
+                # Oversized member — let the single-message path skip just that one
+                for m in members:
+                    await process_live_message(userbot, bot, user_id, source_channel, dest_channels, m, prog_key)
+                return
+
+            live_progress[prog_key]["method"] = "dl_upload"
+            live_progress[prog_key]["current_file"] = f"Album ({len(members)} files)"
+            live_progress[prog_key]["current_size"] = total_size
+            live_progress[prog_key]["downloaded_size"] = 0
+
+            paths = []
+            thumb_path = None
+            try:
+                if custom_thumb_id:
+                    try: thumb_path = await bot.download_media(custom_thumb_id)
+                    except: pass
+
+                media = []
+                connections = await _dl_connections(user_id)
+                await gov.acquire("upload", live=True)
+                for m, cap in zip(members, caps):
+                    try:
+                        f_path = await fast_download(userbot, m, connections=connections)
+                    except FloodWait as e:
+                        raise _charged(e, gov, "upload")
+                    if not f_path:
+                        raise TransferError(f"Album member {m.id} download failed")
+                    paths.append(f_path)
+                    live_progress[prog_key]["downloaded_size"] += os.path.getsize(f_path)
+                    m_thumb = thumb_path
+                    if not m_thumb and m.video and m.video.thumbs:
+                        try:
+                            m_thumb = await userbot.download_media(m.video.thumbs[0].file_id)
+                            paths.append(m_thumb)
+                        except: pass
+                    media.append(album_input_media(m, f_path, cap, thumb=m_thumb))
+
+                # Upload the album once, the other dests copy that post server-side
+                pending = [d_id for d_id in dest_ids if d_id not in sent_dests]
+                first_post = None
+                while pending and not first_post:
+                    d_id = pending.pop(0)
+                    try:
+                        await gov.acquire("send", d_id, live=True)
+                        first_post = await userbot.send_media_group(d_id, media, disable_notification=silent)
+                        sent_dests.append(d_id)
+                        for m, sent in zip(members, first_post or []):
+                            await remember_upload(userbot, m, sent)
+                    except Exception as send_err:
+                        live_progress[prog_key]["errors"] = live_progress[prog_key].get("errors", 0) + 1
+                        logger.error(f"DL+Upload album send error [{user_id}] to {d_id}: {send_err}")
+
+                async def _copy_post(d_id):
+                    try:
+                        await gov.acquire("copy", d_id, live=True)
+                        await copy_album(userbot, d_id, first_post, caps, disable_notification=silent)
+                        sent_dests.append(d_id)
+                    except Exception as copy_err:
+                        live_progress[prog_key]["errors"] = live_progress[prog_key].get("errors", 0) + 1
+                        logger.error(f"Album copy error [{user_id}] to {d_id}: {copy_err}")
+
+                if first_post and pending:
+                    await asyncio.gather(*[_copy_post(d_id) for d_id in pending])
+            finally:
+                live_progress[prog_key]["current_file"] = ""
+                live_progress[prog_key]["current_size"] = 0
+                live_progress[prog_key]["downloaded_size"] = 0
+                live_progress[prog_key]["method"] = "idle"
+                for pp in paths + [thumb_path]:
+                    media_cache.release(pp)
+
+        if sent_dests:
+            n = len(members)
+            live_progress[prog_key]["forwarded"] = live_progress[prog_key].get("forwarded", 0) + n
+            live_progress[prog_key]["last_update"] = time.time()
+            for _ in members:
+                await increment_live_stats(user_id, source_channel)
+            for dc in dest_channels:
+                await increment_channel_stat(user_id, dc, count=n)
+            logger.info(f"Live album ({n}) forwarded: {source_channel} → {dest_channels} [{user_id}]")
+
+    except asyncio.CancelledError:
+        raise
+    except FloodWait as fw:
+        raise fw  # Bubble up to the queue loop to sleep and retry
+    except ValueError as ve:
+        if str(ve) == "FLOOD_WAIT_0B":
+            raise ve
+        if prog_key in live_progress:
+            live_progress[prog_key]["errors"] = live_progress[prog_key].get("errors", 0) + 1
+        logger.error(f"process_live_album error [{user_id}/{source_channel}]: {ve}")
+    except Exception as e:
+        if prog_key in live_progress:
+            live_progress[prog_key]["errors"] = live_progress[prog_key].get("errors", 0) + 1
+        logger.error(f"process_live_album error [{user_id}/{source_channel}]: {e}")
+
 # ══════════════════════════════════════════════════
 # STARTUP
 # ══════════════════════════════════════════════════
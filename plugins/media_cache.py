@@ -0,0 +1,173 @@
+"""
+media_cache.py — On-disk LRU cache of restricted downloads for ExtractX.
+Keyed by Telegram's file_unique_id, so the same file is fetched once no
+matter which job, user or live monitor sees it next.
+
+  acquire(msg)   → cached path (pinned) or None
+  store(msg, p)  → moves a fresh download into the cache, returns it pinned
+  release(p)     → unpins a cached file, or deletes a non-cached one
+
+Pinned files are never evicted. Least recently used files are evicted
+once the cache exceeds MEDIA_CACHE_MB. The index is rebuilt from the
+cache directory on start, so the cache survives restarts.
+"""
+
+import logging
+import os
+from collections import OrderedDict
+
+from config import MEDIA_CACHE_MB
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = os.path.join("downloads", "cache")
+CACHE_KINDS = ("video", "document", "audio", "voice", "animation", "photo", "sticker")
+
+
+def media_unique_id(msg):
+    """file_unique_id of msg's media (stable across chats and accounts), or None."""
+    for kind in CACHE_KINDS:
+        obj = getattr(msg, kind, None)
+        if obj and getattr(obj, "file_unique_id", None):
+            return obj.file_unique_id
+    return None
+
+
+class MediaCache:
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=MEDIA_CACHE_MB * 1024 * 1024):
+        self.dir       = cache_dir
+        self.max_bytes = max_bytes
+        self.entries   = OrderedDict()   # unique_id → {"path": str, "size": int}  (LRU first)
+        self.paths     = {}              # path → unique_id
+        self.refs      = {}              # unique_id → pin count
+        self.bytes     = 0
+        self.stats     = {"hits": 0, "misses": 0, "evictions": 0}
+        self._loaded   = False
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def _load(self):
+        """Rebuild the index from files left by a previous run (oldest first)."""
+        self._loaded = True
+        if not self.enabled or not os.path.isdir(self.dir):
+            return
+        files = []
+        for name in os.listdir(self.dir):
+            path = os.path.join(self.dir, name)
+            if os.path.isfile(path):
+                files.append((os.path.getmtime(path), name, path))
+        for _, name, path in sorted(files):
+            uid = os.path.splitext(name)[0]
+            size = os.path.getsize(path)
+            self.entries[uid] = {"path": path, "size": size}
+            self.paths[path] = uid
+            self.bytes += size
+        self._evict()
+
+    def _evict(self):
+        for uid in list(self.entries):
+            if self.bytes <= self.max_bytes:
+                break
+            if self.refs.get(uid):
+                continue   # in use — never pull a file out from under an upload
+            entry = self.entries.pop(uid)
+            self.paths.pop(entry["path"], None)
+            self.bytes -= entry["size"]
+            self.stats["evictions"] += 1
+            try: os.remove(entry["path"])
+            except OSError: pass
+
+    # ── API ────────────────────────────────────────────────────────
+    def acquire(self, msg):
+        """Pinned path of the cached copy of msg's media, or None."""
+        if not self.enabled:
+            return None
+        if not self._loaded:
+            self._load()
+        uid = media_unique_id(msg)
+        entry = self.entries.get(uid) if uid else None
+        if not entry or not os.path.exists(entry["path"]):
+            if entry:
+                self.entries.pop(uid)
+                self.paths.pop(entry["path"], None)
+                self.bytes -= entry["size"]
+            return None
+        self.entries.move_to_end(uid)
+        self.refs[uid] = self.refs.get(uid, 0) + 1
+        self.stats["hits"] += 1
+        return entry["path"]
+
+    def miss(self):
+        """Count a cache miss: called once per download that actually starts,
+        not per acquire() (callers look a file up more than once)."""
+        if self.enabled:
+            self.stats["misses"] += 1
+
+    def store(self, msg, path):
+        """Move a finished download into the cache. Returns the (pinned) cached
+        path, or `path` unchanged if it can't be cached."""
+        if not self.enabled or not path or not os.path.exists(path):
+            return path
+        if not self._loaded:
+            self._load()
+        uid = media_unique_id(msg)
+        size = os.path.getsize(path)
+        if not uid or size > self.max_bytes:
+            return path
+        entry = self.entries.get(uid)
+        if entry and not os.path.exists(entry["path"]):
+            self.entries.pop(uid)   # cached copy vanished — this download replaces it
+            self.paths.pop(entry["path"], None)
+            self.bytes -= entry["size"]
+        if uid in self.entries:
+            # Raced with another download of the same file — keep the cached copy
+            try: os.remove(path)
+            except OSError: pass
+            self.entries.move_to_end(uid)
+            self.refs[uid] = self.refs.get(uid, 0) + 1
+            return self.entries[uid]["path"]
+
+        os.makedirs(self.dir, exist_ok=True)
+        cached = os.path.join(self.dir, uid + os.path.splitext(path)[1])
+        try:
+            os.replace(path, cached)
+        except OSError as e:
+            logger.warning(f"[Cache] Could not cache {path}: {e}")
+            return path
+        self.entries[uid] = {"path": cached, "size": size}
+        self.paths[cached] = uid
+        self.refs[uid] = self.refs.get(uid, 0) + 1
+        self.bytes += size
+        self._evict()
+        return cached
+
+    def release(self, path):
+        """Done with `path`: unpin it if cached, delete it otherwise."""
+        if not path:
+            return
+        uid = self.paths.get(path)
+        if uid is None:
+            if os.path.exists(path):
+                try: os.remove(path)
+                except OSError: pass
+            return
+        n = self.refs.get(uid, 0) - 1
+        if n > 0:
+            self.refs[uid] = n
+        else:
+            self.refs.pop(uid, None)
+        self._evict()
+
+    def is_cached(self, path):
+        return path in self.paths
+
+    def summary(self):
+        total = self.stats["hits"] + self.stats["misses"]
+        rate  = (self.stats["hits"] * 100 / total) if total else 0
+        return (f"{len(self.entries)} files • {self.bytes / (1024 * 1024):.0f} MB • "
+                f"hit rate {rate:.0f}% ({self.stats['hits']}/{total}) • {self.stats['evictions']} evicted")
+
+
+media_cache = MediaCache()
@@ -0,0 +1,124 @@
+"""
+media_group.py — Album (media_group_id) helpers shared by Batch and LiveBatch.
+
+Telegram delivers an album as separate messages sharing one media_group_id.
+Copying them one by one costs one RPC per member per destination and posts
+the members as loose messages. These helpers keep an album together:
+
+  copy_album()         → one SendMultiMedia per destination, built from the
+                         messages already in hand (no get_media_group refetch,
+                         so filtered subsets of an album work too)
+  album_input_media()  → InputMedia* for send_media_group after a restricted
+                         download
+  collect_album()      → short buffering window for the live engine, which
+                         receives album members as independent updates
+"""
+
+import asyncio
+import time
+
+from pyrogram import raw, types, utils
+
+# ── Tuning ─────────────────────────────────────────────────────────
+ALBUM_MAX  = 10     # Telegram's limit per media group
+ALBUM_WAIT = 1.5    # seconds to wait for the next live album member
+
+
+def is_album_member(msg) -> bool:
+    """True if `msg` belongs to an album and can be re-sent inside one."""
+    return bool(
+        msg and getattr(msg, "media_group_id", None)
+        and (msg.photo or msg.video or msg.audio or msg.document)
+    )
+
+
+def _album_file_id(msg):
+    for prop in ("photo", "video", "audio", "document"):
+        obj = getattr(msg, prop, None)
+        if obj:
+            return obj.file_id
+    raise ValueError("Message with this type can't be copied.")
+
+
+async def copy_album(client, chat_id, msgs, captions, disable_notification=None):
+    """
+    Re-send `msgs` (members of one album, in order) to `chat_id` as one album.
+    `captions[i]` is the final caption of msgs[i] ("" / None = no caption).
+    Returns the list of sent Messages. RPC errors are raised as-is, so
+    restricted sources surface CHAT_FORWARDS_RESTRICTED like copy_message.
+    """
+    multi_media = []
+    for i, m in enumerate(msgs[:ALBUM_MAX]):
+        caption = captions[i] if i < len(captions) else None
+        multi_media.append(
+            raw.types.InputSingleMedia(
+                media=utils.get_input_media_from_file_id(_album_file_id(m)),
+                random_id=client.rnd_id(),
+                **await client.parser.parse(caption or "")
+            )
+        )
+
+    r = await client.invoke(
+        raw.functions.messages.SendMultiMedia(
+            peer=await client.resolve_peer(chat_id),
+            multi_media=multi_media,
+            silent=disable_notification or None,
+        ),
+        sleep_threshold=60
+    )
+
+    return await utils.parse_messages(
+        client,
+        raw.types.messages.Messages(
+            messages=[u.message for u in r.updates
+                      if isinstance(u, (raw.types.UpdateNewMessage, raw.types.UpdateNewChannelMessage))],
+            users=r.users,
+            chats=r.chats
+        )
+    )
+
+
+def album_input_media(msg, path, caption=None, thumb=None):
+    """InputMedia for one downloaded album member (used with send_media_group)."""
+    caption = caption or ""
+    if msg.photo:
+        return types.InputMediaPhoto(path, caption=caption)
+    if msg.video:
+        return types.InputMediaVideo(
+            path, caption=caption, thumb=thumb,
+            width=msg.video.width, height=msg.video.height,
+            duration=msg.video.duration, supports_streaming=True
+        )
+    if msg.audio:
+        return types.InputMediaAudio(
+            path, caption=caption, thumb=thumb,
+            duration=msg.audio.duration,
+            performer=msg.audio.performer, title=msg.audio.title
+        )
+    return types.InputMediaDocument(path, caption=caption, thumb=thumb)
+
+
+async def collect_album(q: asyncio.Queue, first, wait=ALBUM_WAIT):
+    """
+    Pull the remaining members of `first`'s album off a live queue.
+    Members arrive as separate updates a few ms apart, so the window slides
+    forward by `wait` after each one. Returns (members, next_msg) where
+    next_msg is the first unrelated message that arrived meanwhile (or None)
+    and must be processed next by the caller.
+    """
+    members  = [first]
+    deadline = time.monotonic() + wait
+    while len(members) < ALBUM_MAX:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            nxt = await asyncio.wait_for(q.get(), timeout=remaining)
+        except asyncio.TimeoutError:
+            break
+        if getattr(nxt, "media_group_id", None) == first.media_group_id:
+            members.append(nxt)
+            deadline = time.monotonic() + wait
+        else:
+            return members, nxt
+    return members, None
@@ -0,0 +1,687 @@
+"""
+media_relay.py — Transfer engine for restricted (no-forward) content.
+Used by both Batch and LiveBatch when a source blocks copy_message.
+
+Streaming relay (relay_upload / send_relayed):
+  Chunks from stream_media() pass through a bounded in-memory buffer
+  straight into SaveBigFilePart / SaveFilePart calls, so the download and
+  the upload overlap and the file never touches disk. send_relayed() then
+  posts the uploaded InputFile with the original media attributes.
+
+Parallel upload (parallel_upload):
+  Spooled files are uploaded with up to UPLOAD_WINDOW parts in flight over
+  pooled media sessions; each part is retried on its own after transient
+  errors. The returned InputFile is reused for every destination.
+
+Disk spool:
+  The plain download_media → send_* path stays in the callers as the
+  fallback (RELAY_MODE=disk, stickers, unknown sizes, relay errors).
+
+Parallel download (fast_download):
+  upload.GetFile parts are requested concurrently over several media
+  connections to the file's DC and written at their offsets into a
+  preallocated spool file. Connections come from a per-(client, DC) pool,
+  so only the first transfer pays for auth export/import. The connection
+  count comes from the user's plan ("dl_connections").
+  Finished part numbers are appended to a "<spool>.parts" sidecar, so a
+  retry after a network error or a file-reference refresh continues from
+  the parts already on disk instead of byte zero.
+  Finished downloads land in the media cache (media_cache.py), so a file
+  seen again by another job is served from disk without touching Telegram.
+  Downloads are single-flight per file_unique_id: a job or live monitor
+  asking for a file that is already downloading waits for that download
+  and takes it from the cache. Every download writes its own spool file,
+  so concurrent transfers of one message never share a file or sidecar.
+
+Download-ahead (SpoolAhead):
+  While message N uploads, the next RELAY_PREFETCH restricted messages are
+  already downloading into the spool, bounded by RELAY_SPOOL_MB on disk.
+  Uploads still happen in source order — the spool only hands over files.
+"""
+
+import asyncio
+import inspect
+import itertools
+import logging
+import math
+import os
+from collections import deque
+from hashlib import md5
+
+from pyrogram import raw, utils
+from pyrogram.errors import FloodWait, InternalServerError, FileReferenceExpired, FileReferenceInvalid
+from pyrogram.file_id import FileId, FileType
+from pyrogram.session import Auth, Session
+
+from config import RELAY_MODE, RELAY_BUFFER_MB, RELAY_PREFETCH, RELAY_SPOOL_MB, UPLOAD_WINDOW
+from plugins.media_cache import media_cache, media_unique_id
+from plugins.retry_policy import TransferError
+
+logger = logging.getLogger(__name__)
+
+# ── Tuning ─────────────────────────────────────────────────────────
+PART_SIZE      = 512 * 1024         # Telegram upload part size
+BIG_FILE_SIZE  = 10 * 1024 * 1024   # above this SaveBigFilePart is required
+UPLOAD_SESSIONS = 2                 # media connections an upload spreads its parts over
+PART_RETRIES   = 4                  # attempts per part on transient errors
+CHUNK_SIZE     = 1024 * 1024        # GetFile request size (max allowed)
+DL_CONNECTIONS = 4                  # default when the plan doesn't say
+DL_RETRIES     = 3                  # resumed attempts before falling back to download_media
+SPOOL_DIR      = "downloads"
+
+RELAY_KINDS = ("video", "document", "audio", "voice", "animation", "photo")
+
+
+def relay_enabled() -> bool:
+    return RELAY_MODE == "stream"
+
+
+def relay_media(msg):
+    """(kind, media object) if `msg` can go through the streaming relay."""
+    for kind in RELAY_KINDS:
+        obj = getattr(msg, kind, None)
+        if obj:
+            return kind, obj
+    return None, None
+
+
+def can_relay(msg) -> bool:
+    kind, obj = relay_media(msg)
+    return bool(relay_enabled() and kind and getattr(obj, "file_size", 0))
+
+
+async def _report(progress, current, total):
+    if progress:
+        try:
+            r = progress(current, total)
+            if inspect.isawaitable(r):
+                await r
+        except Exception:
+            pass
+
+
+async def relay_upload(client, msg, progress=None):
+    """
+    Stream `msg`'s media from the source into a fresh upload on `client`.
+    Returns a raw InputFile / InputFileBig ready for messages.SendMedia.
+    At most RELAY_BUFFER_MB of parts are held in memory at any time.
+    Raises on any transfer error — callers fall back to disk spooling.
+    """
+    kind, obj = relay_media(msg)
+    file_size = getattr(obj, "file_size", 0) or 0
+    if not kind or not file_size:
+        raise ValueError("Media size unknown — can't stream")
+
+    limit_mib = 4000 if client.me.is_premium else 2000
+    if file_size > limit_mib * 1024 * 1024:
+        raise ValueError(f"Can't upload files bigger than {limit_mib} MiB")
+
+    total_parts = math.ceil(file_size / PART_SIZE)
+    is_big      = file_size > BIG_FILE_SIZE
+    file_id     = client.rnd_id()
+    md5_sum     = None if is_big else md5()
+    queue       = asyncio.Queue(maxsize=max(1, RELAY_BUFFER_MB * 1024 * 1024 // PART_SIZE))
+    uploaded    = 0
+
+    sessions = await get_media_sessions(client, await client.storage.dc_id(), UPLOAD_SESSIONS)
+
+    async def worker(session):
+        nonlocal uploaded
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            part, chunk = item
+            await _save_part(session, file_id, part, chunk, total_parts if is_big else None)
+            uploaded += len(chunk)
+            await _report(progress, min(uploaded, file_size), file_size)
+
+    workers = []
+
+    async def put(item):
+        # A dead worker would leave the producer blocked on a full buffer
+        while True:
+            for w in workers:
+                if w.done() and not w.cancelled() and w.exception():
+                    raise w.exception()
+            try:
+                await asyncio.wait_for(queue.put(item), timeout=1)
+                return
+            except asyncio.TimeoutError:
+                continue
+
+    try:
+        n = UPLOAD_WINDOW if is_big else 1
+        workers = [asyncio.create_task(worker(sessions[i % len(sessions)])) for i in range(n)]
+
+        part, received, buf = 0, 0, bytearray()
+        async for chunk in client.stream_media(msg):
+            received += len(chunk)
+            buf += chunk
+            while len(buf) >= PART_SIZE:
+                data = bytes(buf[:PART_SIZE])
+                del buf[:PART_SIZE]
+                if md5_sum: md5_sum.update(data)
+                await put((part, data))
+                part += 1
+        if buf:
+            data = bytes(buf)
+            if md5_sum: md5_sum.update(data)
+            await put((part, data))
+            part += 1
+
+        # get_file() swallows transport errors and just ends the stream early
+        if received != file_size or part != total_parts:
+            raise TransferError(f"Stream ended at {received}/{file_size} bytes")
+
+        for _ in workers:
+            await put(None)
+        for r in await asyncio.gather(*workers, return_exceptions=True):
+            if isinstance(r, BaseException):
+                raise r
+    except BaseException:
+        for w in workers:
+            w.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        raise
+
+    name = getattr(obj, "file_name", None) or f"file_{msg.id}"
+    if is_big:
+        return raw.types.InputFileBig(id=file_id, parts=total_parts, name=name)
+    return raw.types.InputFile(id=file_id, parts=total_parts, name=name, md5_checksum=md5_sum.hexdigest())
+
+
+async def _save_part(session, file_id, part, chunk, total_parts=None):
+    """SaveBigFilePart (total_parts given) or SaveFilePart, retried on its own
+    after transient failures so one bad part never restarts the file."""
+    if total_parts:
+        rpc = raw.functions.upload.SaveBigFilePart(
+            file_id=file_id, file_part=part, file_total_parts=total_parts, bytes=chunk
+        )
+    else:
+        rpc = raw.functions.upload.SaveFilePart(file_id=file_id, file_part=part, bytes=chunk)
+
+    attempt = 0   # FloodWaits are waited out without using up an attempt
+    while True:
+        try:
+            if not await session.invoke(rpc):
+                raise InternalServerError(f"part {part} not saved")
+            return
+        except FloodWait as e:
+            await asyncio.sleep(e.value + 1)
+        except (InternalServerError, OSError, asyncio.TimeoutError) as e:
+            attempt += 1
+            if attempt >= PART_RETRIES:
+                raise
+            logger.warning(f"[Relay] Part {part} failed ({e}), retrying")
+            await asyncio.sleep(2 ** (attempt - 1))
+
+
+async def parallel_upload(client, path, progress=None, window=UPLOAD_WINDOW):
+    """
+    Upload a local file with up to `window` parts in flight. Returns a raw
+    InputFile / InputFileBig that can be sent to any number of chats with
+    send_relayed(). Raises once a part has used up its retries.
+    """
+    file_size = os.path.getsize(path)
+    if file_size == 0:
+        raise ValueError("File size equals to 0 B")
+    limit_mib = 4000 if client.me.is_premium else 2000
+    if file_size > limit_mib * 1024 * 1024:
+        raise ValueError(f"Can't upload files bigger than {limit_mib} MiB")
+
+    total_parts = math.ceil(file_size / PART_SIZE)
+    is_big      = file_size > BIG_FILE_SIZE
+    file_id     = client.rnd_id()
+    sessions    = await get_media_sessions(client, await client.storage.dc_id(), UPLOAD_SESSIONS)
+    todo        = iter(range(total_parts))
+    uploaded    = 0
+
+    async def worker(session, fp):
+        nonlocal uploaded
+        for part in todo:
+            fp.seek(part * PART_SIZE)
+            chunk = fp.read(PART_SIZE)
+            await _save_part(session, file_id, part, chunk, total_parts if is_big else None)
+            uploaded += len(chunk)
+            await _report(progress, min(uploaded, file_size), file_size)
+
+    n = max(1, int(window)) if is_big else 1
+    files = [open(path, "rb") for _ in range(n)]
+    tasks = [asyncio.create_task(worker(sessions[i % len(sessions)], files[i])) for i in range(n)]
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+    finally:
+        for fp in files:
+            fp.close()
+
+    name = os.path.basename(path)
+    if is_big:
+        return raw.types.InputFileBig(id=file_id, parts=total_parts, name=name)
+    with open(path, "rb") as fp:
+        md5_sum = md5(fp.read()).hexdigest()
+    return raw.types.InputFile(id=file_id, parts=total_parts, name=name, md5_checksum=md5_sum)
+
+
+async def relay_thumb(client, msg, custom=None):
+    """Upload the thumbnail for a relayed post without touching disk.
+    `custom` is a local path (user's custom thumbnail). Returns InputFile or None."""
+    try:
+        if custom:
+            return await client.save_file(custom)
+        kind, obj = relay_media(msg)
+        thumbs = getattr(obj, "thumbs", None) if kind in ("video", "document", "audio", "animation") else None
+        if thumbs:
+            bio = await client.download_media(thumbs[0].file_id, in_memory=True)
+            if bio:
+                bio.name = "thumb.jpg"
+                return await client.save_file(bio)
+    except Exception as e:
+        logger.warning(f"[Relay] Thumbnail skipped: {e}")
+    return None
+
+
+async def send_relayed(client, chat_id, msg, input_file, caption=None, thumb=None,
+                       disable_notification=None):
+    """Post an uploaded InputFile with `msg`'s media attributes. Returns the Message."""
+    kind, obj = relay_media(msg)
+    if kind == "photo":
+        media = raw.types.InputMediaUploadedPhoto(file=input_file)
+    else:
+        attrs = [raw.types.DocumentAttributeFilename(file_name=getattr(obj, "file_name", None) or f"file_{msg.id}")]
+        force_file = None
+        if kind == "video":
+            attrs.append(raw.types.DocumentAttributeVideo(
+                duration=obj.duration or 0, w=obj.width or 0, h=obj.height or 0, supports_streaming=True
+            ))
+        elif kind == "animation":
+            attrs.append(raw.types.DocumentAttributeVideo(duration=obj.duration or 0, w=obj.width or 0, h=obj.height or 0))
+            attrs.append(raw.types.DocumentAttributeAnimated())
+        elif kind == "audio":
+            attrs.append(raw.types.DocumentAttributeAudio(
+                duration=obj.duration or 0, performer=obj.performer, title=obj.title
+            ))
+        elif kind == "voice":
+            attrs.append(raw.types.DocumentAttributeAudio(duration=obj.duration or 0, voice=True))
+        else:
+            force_file = True
+        media = raw.types.InputMediaUploadedDocument(
+            file=input_file, thumb=thumb, force_file=force_file, attributes=attrs,
+            mime_type=getattr(obj, "mime_type", None) or "application/octet-stream",
+        )
+
+    r = await client.invoke(
+        raw.functions.messages.SendMedia(
+            peer=await client.resolve_peer(chat_id),
+            media=media,
+            random_id=client.rnd_id(),
+            silent=disable_notification or None,
+            **await client.parser.parse(caption or "")
+        )
+    )
+    msgs = await utils.parse_messages(
+        client,
+        raw.types.messages.Messages(
+            messages=[u.message for u in r.updates
+                      if isinstance(u, (raw.types.UpdateNewMessage, raw.types.UpdateNewChannelMessage))],
+            users=r.users,
+            chats=r.chats
+        )
+    )
+    return msgs[0] if msgs else None
+
+
+# ══════════════════════════════════════════════════
+# MEDIA SESSION POOL
+# ══════════════════════════════════════════════════
+_media_sessions = {}   # (client, dc_id) → [Session]  (started, reusable)
+_media_auth     = {}   # (client, dc_id) → auth key authorised on that DC
+_media_locks    = {}   # (client, dc_id) → asyncio.Lock
+
+
+async def get_media_sessions(client, dc_id, count):
+    """`count` started media sessions to `dc_id`. A foreign DC gets one auth
+    key + one ExportAuthorization; extra connections reuse that key."""
+    key  = (client, dc_id)
+    lock = _media_locks.setdefault(key, asyncio.Lock())
+    async with lock:
+        pool = _media_sessions.setdefault(key, [])
+        home = await client.storage.dc_id()
+        test_mode = await client.storage.test_mode()
+        while len(pool) < count:
+            auth_key = _media_auth.get(key)
+            fresh    = auth_key is None
+            if fresh:
+                auth_key = await client.storage.auth_key() if dc_id == home \
+                    else await Auth(client, dc_id, test_mode).create()
+
+            session = Session(client, dc_id, auth_key, test_mode, is_media=True)
+            await session.start()
+            if fresh and dc_id != home:
+                try:
+                    exported = await client.invoke(raw.functions.auth.ExportAuthorization(dc_id=dc_id))
+                    await session.invoke(
+                        raw.functions.auth.ImportAuthorization(id=exported.id, bytes=exported.bytes)
+                    )
+                except BaseException:
+                    await session.stop()
+                    raise
+            _media_auth[key] = auth_key
+            pool.append(session)
+        return pool[:count]
+
+
+async def close_media_sessions(client):
+    """Stop every pooled session of `client` — call before client.stop()."""
+    for key in [k for k in _media_sessions if k[0] is client]:
+        for session in _media_sessions.pop(key, []):
+            try: await session.stop()
+            except Exception: pass
+        _media_auth.pop(key, None)
+        _media_locks.pop(key, None)
+
+
+# ══════════════════════════════════════════════════
+# PARALLEL DOWNLOAD
+# ══════════════════════════════════════════════════
+def _file_location(fid):
+    if fid.file_type == FileType.PHOTO:
+        return raw.types.InputPhotoFileLocation(
+            id=fid.media_id, access_hash=fid.access_hash,
+            file_reference=fid.file_reference, thumb_size=fid.thumbnail_size
+        )
+    return raw.types.InputDocumentFileLocation(
+        id=fid.media_id, access_hash=fid.access_hash,
+        file_reference=fid.file_reference, thumb_size=fid.thumbnail_size
+    )
+
+
+_spool_ids = itertools.count(1)
+_flights   = {}   # file_unique_id (or chat:msg) → Event set when that download ends
+
+
+def spool_path(client, msg, kind, obj):
+    """Spool file name for one download of `msg` — unique per call, so two
+    transfers of the same message never write into the same file."""
+    name = os.path.basename(getattr(obj, "file_name", None) or "")
+    if not name:
+        ext = ".jpg" if kind == "photo" else (client.guess_extension(getattr(obj, "mime_type", "") or "") or "")
+        name = f"{kind}{ext}"
+    chat_id = getattr(getattr(msg, "chat", None), "id", 0)
+    return os.path.join(SPOOL_DIR, f"{abs(chat_id)}_{msg.id}_{next(_spool_ids)}_{name}")
+
+
+def _sidecar(path):
+    return path + ".parts"
+
+
+def discard_partial(path):
+    """Remove a spool file and its resume sidecar."""
+    for pp in (path, _sidecar(path)):
+        try: os.remove(pp)
+        except OSError: pass
+
+
+def _load_parts(path, file_size):
+    """Part numbers already on disk from an earlier attempt (empty = start over)."""
+    try:
+        if os.path.getsize(path) != file_size:
+            return set()
+        with open(_sidecar(path)) as f:
+            return {int(line) for line in f if line.strip().isdigit()}
+    except (OSError, ValueError):
+        return set()
+
+
+async def parallel_download(client, msg, path, progress=None, connections=DL_CONNECTIONS):
+    """
+    Download `msg`'s media into the spool file `path` with `connections`
+    concurrent GetFile streams. Parts finished by an earlier attempt into
+    the same path are skipped. On errors the partial file and its sidecar
+    are kept for the next attempt (removed if cancelled).
+    """
+    kind, obj = relay_media(msg)
+    file_size = getattr(obj, "file_size", 0) or 0
+    if not kind or not file_size:
+        raise ValueError("Media size unknown — can't split download")
+
+    fid      = FileId.decode(obj.file_id)
+    location = _file_location(fid)
+    parts    = math.ceil(file_size / CHUNK_SIZE)
+    sessions = await get_media_sessions(client, fid.dc_id, max(1, min(int(connections), parts)))
+
+    os.makedirs(SPOOL_DIR, exist_ok=True)
+    have = _load_parts(path, file_size)
+    if have:
+        logger.info(f"[Relay] Resuming {os.path.basename(path)} at {len(have)}/{parts} parts")
+    else:
+        discard_partial(path)
+    fd   = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    os.ftruncate(fd, file_size)   # preallocate — parts land at their offsets
+    log  = os.open(_sidecar(path), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+
+    todo = iter([p for p in range(parts) if p not in have])
+    done = sum(min(CHUNK_SIZE, file_size - p * CHUNK_SIZE) for p in have)
+
+    async def worker(session):
+        nonlocal done
+        for part in todo:
+            offset = part * CHUNK_SIZE
+            while True:
+                try:
+                    r = await session.invoke(
+                        raw.functions.upload.GetFile(location=location, offset=offset, limit=CHUNK_SIZE),
+                        sleep_threshold=30
+                    )
+                    break
+                except FloodWait as e:
+                    await asyncio.sleep(e.value + 1)
+            if not isinstance(r, raw.types.upload.File):
+                raise ValueError("CDN redirect — not supported by the parallel downloader")
+            if len(r.bytes) != min(CHUNK_SIZE, file_size - offset):
+                raise TransferError(f"Short part at offset {offset}")
+            os.pwrite(fd, r.bytes, offset)
+            os.write(log, f"{part}\n".encode())
+            done += len(r.bytes)
+            await _report(progress, done, file_size)
+
+    tasks = [asyncio.create_task(worker(s)) for s in sessions]
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException as e:
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        os.close(fd)
+        os.close(log)
+        if isinstance(e, asyncio.CancelledError):
+            discard_partial(path)
+        raise
+    os.close(fd)
+    os.close(log)
+    try: os.remove(_sidecar(path))
+    except OSError: pass
+    return path
+
+
+async def fast_download(client, msg, progress=None, connections=DL_CONNECTIONS):
+    """Drop-in for client.download_media(msg): resumable parallel download
+    first (refreshing the file reference via get_messages when it expires),
+    the regular single-stream download_media if that keeps failing.
+    Finished files go through the media cache: release() them when done."""
+    key = media_unique_id(msg) or f"{getattr(msg.chat, 'id', 0)}:{msg.id}"
+    while True:
+        cached = media_cache.acquire(msg)
+        if cached:
+            return cached
+        flight = _flights.get(key)
+        if flight is None:
+            break
+        await flight.wait()   # someone else is fetching this file — take theirs from the cache
+
+    flight = _flights[key] = asyncio.Event()
+    media_cache.miss()
+    try:
+        return await _download(client, msg, progress, connections)
+    finally:
+        del _flights[key]
+        flight.set()
+
+
+async def _download(client, msg, progress, connections):
+    kind, obj = relay_media(msg)
+    if not (kind and connections):
+        return media_cache.store(msg, await client.download_media(msg, progress=progress))
+    path = spool_path(client, msg, kind, obj)
+    try:
+        for attempt in range(DL_RETRIES):
+            try:
+                return media_cache.store(msg, await parallel_download(
+                    client, msg, path, progress=progress, connections=connections))
+            except asyncio.CancelledError:
+                raise
+            except (FileReferenceExpired, FileReferenceInvalid):
+                fresh = await client.get_messages(msg.chat.id, msg.id)
+                if not fresh or fresh.empty or not fresh.media:
+                    break
+                msg = fresh
+            except (InternalServerError, OSError, asyncio.TimeoutError) as e:
+                logger.warning(f"[Relay] Download of {msg.id} interrupted ({e}), resuming")
+                await asyncio.sleep(2 ** attempt)
+            except Exception as e:
+                logger.warning(f"[Relay] Parallel download of {msg.id} failed, using download_media: {e}")
+                break
+        return media_cache.store(msg, await client.download_media(msg, progress=progress))
+    finally:
+        if os.path.exists(_sidecar(path)):
+            discard_partial(path)   # unfinished spool file of this download — nobody's result
+
+
+# ══════════════════════════════════════════════════
+# DOWNLOAD-AHEAD SPOOL
+# ══════════════════════════════════════════════════
+def media_size(msg) -> int:
+    for prop in ("video", "audio", "document", "voice", "animation", "photo", "sticker"):
+        obj = getattr(msg, prop, None)
+        if obj and getattr(obj, "file_size", 0):
+            return obj.file_size
+    return 0
+
+
+class SpoolAhead:
+    """
+    Background downloader that stays `depth` restricted messages ahead of
+    the uploader.
+
+    Usage:
+        spool = SpoolAhead(userbot).start()
+        spool.schedule(msg)                  # in source order, as messages are queued
+        f_path = await spool.take(msg.id)    # in the restricted branch; None = download yourself
+        await spool.close()
+
+    Nothing is downloaded until activate() is called (source known to be
+    restricted). take() also drops anything older than the requested ID,
+    so skipped or failed messages never pin spool space.
+    """
+
+    def __init__(self, client, depth=RELAY_PREFETCH, max_bytes=RELAY_SPOOL_MB * 1024 * 1024,
+                 connections=DL_CONNECTIONS):
+        self.client    = client
+        self.connections = connections
+        self.depth     = max(0, int(depth))
+        self.max_bytes = max_bytes
+        self.active    = False
+        self.pending   = deque()   # messages not started yet
+        self.entries   = {}        # msg.id → {"task": Task, "size": int}
+        self.bytes     = 0
+        self._wake     = asyncio.Event()
+        self._task     = None
+
+    def start(self):
+        if self._task is None and self.depth:
+            self._task = asyncio.create_task(self._run())
+        return self
+
+    def activate(self):
+        self.active = True
+        self._wake.set()
+
+    def reserved(self) -> int:
+        """Messages scheduled but not yet taken — count them against dl_limit."""
+        return len(self.pending) + len(self.entries)
+
+    def schedule(self, msg):
+        if not self.active or self._task is None:
+            return
+        self.pending.append(msg)
+        self._wake.set()
+
+    async def _download(self, msg):
+        try:
+            return await fast_download(self.client, msg, connections=self.connections)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # The caller retries on its own path (incl. the 0 B refetch)
+            logger.warning(f"[Spool] Prefetch of {msg.id} failed: {e}")
+            return None
+
+    async def _run(self):
+        while True:
+            await self._wake.wait()
+            self._wake.clear()
+            while self.pending and len(self.entries) < self.depth:
+                size = media_size(self.pending[0])
+                if self.entries and self.bytes + size > self.max_bytes:
+                    break   # over budget — wait for take() to free space
+                msg = self.pending.popleft()
+                self.bytes += size
+                self.entries[msg.id] = {"task": asyncio.create_task(self._download(msg)), "size": size}
+
+    async def _drop(self, msg_id):
+        entry = self.entries.pop(msg_id, None)
+        if not entry:
+            return
+        self.bytes -= entry["size"]
+        task = entry["task"]
+        if not task.done():
+            task.cancel()
+        try:
+            path = await task
+        except (asyncio.CancelledError, Exception):
+            path = None
+        if path:
+            media_cache.release(path)
+
+    async def take(self, msg_id):
+        """Path of the spooled download for `msg_id` (waits if still running),
+        or None if it was never started. The caller owns and deletes the file."""
+        for mid in [m for m in self.entries if m < msg_id]:
+            await self._drop(mid)
+        while self.pending and self.pending[0].id <= msg_id:
+            self.pending.popleft()
+        entry = self.entries.pop(msg_id, None)
+        self._wake.set()
+        if not entry:
+            return None
+        try:
+            return await entry["task"]
+        except (asyncio.CancelledError, Exception):
+            return None
+        finally:
+            self.bytes -= entry["size"]
+            self._wake.set()
+
+    async def close(self):
+        if self._task and not self._task.done():
+            self._task.cancel()
+            try: await self._task
+            except (asyncio.CancelledError, Exception): pass
+        self.pending.clear()
+        for mid in list(self.entries):
+            await self._drop(mid)
@@ -0,0 +1,157 @@
+"""
+message_record.py — Lean parsing of raw history results for the Batch engine.
+
+get_messages builds a full Pyrogram Message for every ID (thumbnails,
+entities, chat and sender objects), and with its default replies=1 sends
+extra RPCs to resolve every replied-to post. The copy loop needs only a
+few fields to decide whether a message is copied at all, so the fetchers
+call channels.GetMessages / messages.GetHistory / messages.Search
+directly and keep MessageRecords instead:
+
+  await get_records(client, chat_id, ids)  → [MessageRecord] for those IDs
+  records(client, r)                       → [MessageRecord] from a raw result
+  await rec.message()                      → full Message (replies=0), built
+                                             once, on first use
+
+A record holds the id, media type, file id/size/mime, caption or text,
+media_group_id and the empty/service flags. Only messages that pass the
+filters are ever parsed in full, and no reply lookups are made.
+"""
+
+from pyrogram import raw, types, enums
+
+# Same precedence as Message._parse: the first attribute found decides
+_DOC_KINDS = (
+    (raw.types.DocumentAttributeAnimated, enums.MessageMediaType.ANIMATION),
+    (raw.types.DocumentAttributeSticker,  enums.MessageMediaType.STICKER),
+    (raw.types.DocumentAttributeVideo,    enums.MessageMediaType.VIDEO),
+    (raw.types.DocumentAttributeAudio,    enums.MessageMediaType.AUDIO),
+)
+_SIMPLE_MEDIA = {
+    raw.types.MessageMediaGeo:     enums.MessageMediaType.LOCATION,
+    raw.types.MessageMediaContact: enums.MessageMediaType.CONTACT,
+    raw.types.MessageMediaVenue:   enums.MessageMediaType.VENUE,
+    raw.types.MessageMediaGame:    enums.MessageMediaType.GAME,
+    raw.types.MessageMediaPoll:    enums.MessageMediaType.POLL,
+    raw.types.MessageMediaDice:    enums.MessageMediaType.DICE,
+}
+
+
+class MessageRecord:
+    __slots__ = (
+        "id", "empty", "service", "media", "file_id", "file_size", "mime_type",
+        "caption", "text", "media_group_id",
+        "_client", "_raw", "_users", "_chats", "_message",
+    )
+
+    def __init__(self, client, message, users, chats):
+        self._client  = client
+        self._raw     = message
+        self._users   = users
+        self._chats   = chats
+        self._message = None
+
+        self.id        = message.id
+        self.empty     = isinstance(message, raw.types.MessageEmpty)
+        self.service   = isinstance(message, raw.types.MessageService)
+        self.media     = None
+        self.file_id   = None     # raw photo/document id (stable per file)
+        self.file_size = 0
+        self.mime_type = None
+        self.caption   = None
+        self.text      = None
+        self.media_group_id = None
+        if self.empty or self.service:
+            return
+
+        has_media = self._parse_media(message.media)
+        body = message.message or None
+        if has_media and self.media != enums.MessageMediaType.WEB_PAGE:
+            self.caption = body
+        else:
+            self.text = body
+        self.media_group_id = message.grouped_id
+
+    def _parse_media(self, media):
+        """Set media/file fields. Returns False where Message._parse would
+        drop the media (unsupported or empty web page)."""
+        if media is None:
+            return False
+        if isinstance(media, raw.types.MessageMediaPhoto):
+            self.media = enums.MessageMediaType.PHOTO
+            photo = media.photo
+            if isinstance(photo, raw.types.Photo):
+                self.file_id = photo.id
+                self.mime_type = "image/jpeg"
+                for size in photo.sizes:
+                    self.file_size = max(self.file_size, getattr(size, "size", 0),
+                                         *(getattr(size, "sizes", None) or [0]))
+            return True
+        if isinstance(media, raw.types.MessageMediaDocument):
+            doc = media.document
+            if not isinstance(doc, raw.types.Document):
+                return True
+            self.file_id   = doc.id
+            self.file_size = doc.size
+            self.mime_type = doc.mime_type
+            attributes = {type(a): a for a in doc.attributes}
+            self.media = enums.MessageMediaType.DOCUMENT
+            for attr_type, kind in _DOC_KINDS:
+                attr = attributes.get(attr_type)
+                if attr is None:
+                    continue
+                if kind == enums.MessageMediaType.VIDEO and attr.round_message:
+                    kind = enums.MessageMediaType.VIDEO_NOTE
+                elif kind == enums.MessageMediaType.AUDIO and attr.voice:
+                    kind = enums.MessageMediaType.VOICE
+                self.media = kind
+                break
+            return True
+        if isinstance(media, raw.types.MessageMediaWebPage):
+            if isinstance(media.webpage, raw.types.WebPage):
+                self.media = enums.MessageMediaType.WEB_PAGE
+                return True
+            return False
+        kind = _SIMPLE_MEDIA.get(type(media))
+        self.media = kind
+        return kind is not None
+
+    async def message(self):
+        """Full Pyrogram Message for this record (no reply lookups)."""
+        if self._message is None:
+            self._message = await types.Message._parse(
+                self._client, self._raw, self._users, self._chats, replies=0
+            )
+            self._raw = self._users = self._chats = None
+        return self._message
+
+    def __repr__(self):
+        kind = self.media.name if self.media else ("service" if self.service else "text")
+        return f"<MessageRecord {self.id} {kind}>"
+
+
+def records(client, r):
+    """MessageRecords for a raw messages.Messages / ChannelMessages result."""
+    users = {u.id: u for u in r.users}
+    chats = {c.id: c for c in r.chats}
+    return [MessageRecord(client, m, users, chats) for m in r.messages]
+
+
+async def get_records(client, chat_id, ids, invoke=None):
+    """
+    MessageRecords for `ids` of `chat_id`, in the order of `ids` (missing
+    IDs come back as empty records). Same request get_messages makes;
+    `invoke` lets a caller wrap it (e.g. TakeoutSession.invoke).
+    """
+    peer = await client.resolve_peer(chat_id)
+    input_ids = [raw.types.InputMessageID(id=i) for i in ids]
+    if isinstance(peer, raw.types.InputPeerChannel):
+        query = raw.functions.channels.GetMessages(
+            channel=raw.types.InputChannel(channel_id=peer.channel_id, access_hash=peer.access_hash),
+            id=input_ids
+        )
+    else:
+        query = raw.functions.messages.GetMessages(id=input_ids)
+    r = await (invoke or client.invoke)(query)
+    by_id = {rec.id: rec for rec in records(client, r)}
+    return [by_id.get(i) or MessageRecord(client, raw.types.MessageEmpty(id=i), {}, {}) for i in ids]
@@ -109,6 +109,7 @@ async def show_help_menu(client, message_or_callback, page=1):
             text += (
                 "\n**5. Admin Overrides (God Mode) 🛠**\n"
                 "• `/status` or `/stats` - 📊 Server stats & active user counts\n"
+                "• `/queue` - 🧵 Running & waiting batch jobs\n"
                 "• `/addpremium [ID] [Plan]` - 🎁 Give `day`, `month`, or `unlimited`\n"
                 "• `/removepremium [ID]` - 🔻 Revoke Premium access\n"
                 "• `/protect_channel add [ID]` - 🛡 Lock specific channels\n"
@@ -226,6 +227,7 @@ async def command_list(client, message):
         text += "• `/givetrial [ID]` - 🎁 **Give Trial**: Grant/reset trial for user.\n"
         text += "• `/protect_channel [add/remove/list] [ID]` - 🛡️ **Protect Channels**.\n"
         text += "• `/stats` - 📊 **Statistics**: View bot usage & user counts.\n"
+        text += "• `/queue` - 🧵 **Job Queue**: Running & waiting batch jobs.\n"
         text += "• `/ban [ID] [Reason]` - 🔨 **Ban User**: Block user from bot.\n"
         text += "• `/unban [ID]` - 🕊 **Unban**: Restore user access.\n"
         text += "• `/broadcast [Message]` - 📢 **Broadcast**: Send message to all users.\n"
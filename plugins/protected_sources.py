@@ -0,0 +1,85 @@
+"""
+protected_sources.py — Cached "protected content" flag per source chat.
+
+A source with has_protected_content rejects every copy_message and
+ForwardMessages. Instead of learning that from one failed RPC per message
+(per destination in LiveBatch), both engines resolve the flag once when a
+job or monitor starts and keep it for PROTECT_TTL seconds:
+
+  is_source_protected(client, chat_id, chat)  → bool (cached)
+  observe_copy(chat_id, ok)                    → copy outcome; a result that
+                                                 contradicts the cached flag
+                                                 drops it
+  is_forward_restricted(e)                     → error means "source protected"
+
+Unknown sources (get_chat failed) count as unprotected, so the engines try
+a normal copy first, as before.
+"""
+
+import logging
+import time
+
+from pyrogram.errors import ChatForwardsRestricted
+
+from config import PROTECT_TTL
+
+logger = logging.getLogger(__name__)
+
+_flags = {}   # str(chat_id) → (protected, resolved_at, str(chat.id))
+
+
+def _key(chat_id):
+    return str(chat_id)
+
+
+def is_forward_restricted(e) -> bool:
+    return isinstance(e, ChatForwardsRestricted)
+
+
+def remember_chat(chat, *aliases):
+    """Store the flag of a Chat returned by get_chat (also under `aliases`,
+    e.g. the @username the user typed)."""
+    protected = bool(getattr(chat, "has_protected_content", False))
+    now = time.monotonic()
+    for cid in (chat.id,) + aliases:
+        if cid is not None:
+            _flags[_key(cid)] = (protected, now, _key(chat.id))
+    return protected
+
+
+async def is_source_protected(client, chat_id, chat=None) -> bool:
+    """True if `chat_id` blocks forwarding. `chat` (a fresh get_chat result)
+    skips the lookup and refreshes the cache."""
+    if chat is not None:
+        return remember_chat(chat, chat_id)
+    entry = _flags.get(_key(chat_id))
+    if entry and time.monotonic() - entry[1] < PROTECT_TTL:
+        return entry[0]
+    try:
+        chat = await client.get_chat(chat_id)
+    except Exception as e:
+        logger.warning(f"[Protect] Could not resolve {chat_id}: {e}")
+        return False
+    protected = remember_chat(chat, chat_id)
+    if protected:
+        logger.info(f"[Protect] {chat_id} has protected content, relaying directly")
+    return protected
+
+
+def observe_copy(chat_id, ok):
+    """Record a copy attempt from `chat_id`. If the outcome contradicts the
+    cached flag (copy worked on a "protected" source, or was refused by an
+    "open" one), the flag is dropped and resolved again on next use."""
+    entry = _flags.get(_key(chat_id))
+    if entry and entry[0] == bool(ok):
+        logger.info(f"[Protect] Copy from {chat_id} {'succeeded' if ok else 'was refused'} "
+                    f"against the cached flag, re-checking")
+        forget_source(chat_id)
+
+
+def forget_source(chat_id):
+    """Drop the flag of `chat_id` and of every alias of the same chat."""
+    entry = _flags.pop(_key(chat_id), None)
+    if entry:
+        for k in [k for k, v in _flags.items() if v[2] == entry[2]]:
+            del _flags[k]
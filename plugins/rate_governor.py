@@ -0,0 +1,220 @@
+"""
+rate_governor.py — Adaptive request pacing per Telegram account.
+
+Every account gets one RateGovernor, shared by every coroutine that uses
+that client (batch fetcher, destination workers, relays). It keeps a token
+bucket per request kind and one per destination chat:
+
+  fetch   GetMessages / GetHistory / Search
+  copy    copy_message, ForwardMessages, copy_media_group
+  send    send_message, send_cached_media (nothing to transfer)
+  upload  restricted download + upload
+
+  gov = await get_governor(client)
+  await gov.acquire("copy", dest, live)  → waits for a token (and for any
+                                           FloodWait penalty to pass)
+  gov.success("copy", dest)              → additive increase
+  gov.flood("copy", seconds, dest)       → multiplicative decrease, and the
+                                           bucket is blocked for `seconds`
+                                           (with `dest`, only that chat's
+                                           bucket; the kind just eases off)
+  await gov.save()                       → persist the learned rates
+
+Rates grow by a small step per success while Telegram accepts them and are
+halved on FloodWait (AIMD), so each account settles just below its own
+limit. Learned rates are stored per account in MongoDB ("rate_limits") and
+picked up by the next job.
+
+Priority lanes: LiveBatch and Batch jobs share the same userbot, so live
+forwarding passes live=True and is served first — batch requests wait
+while a live request is queued, and keep LIVE_RESERVE tokens untouched
+while live traffic was seen in the last LIVE_WINDOW seconds. Batch gets
+the leftover capacity. A FloodWait hit by either side blocks the bucket
+for both, so nobody keeps hammering a throttled account.
+"""
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+
+from database import get_rate_state, save_rate_state
+
+logger = logging.getLogger(__name__)
+
+# ── Tuning ─────────────────────────────────────────────────────────
+#            start   floor   ceiling  step (req/s added per success)
+KIND_RATES = {
+    "fetch":  (2.0,   0.05,   10.0,    0.05),
+    "copy":   (5.0,   0.05,   30.0,    0.05),
+    "send":   (3.0,   0.05,   20.0,    0.05),
+    "upload": (1.0,   0.02,    5.0,    0.02),
+}
+DEST_RATE     = (1.5, 0.02, 5.0, 0.02)   # per destination chat, all kinds together
+BURST_SECONDS = 2.0     # bucket capacity = this many seconds of the current rate
+DECREASE      = 0.5     # rate multiplier on FloodWait
+DEST_EASE     = 0.9     # kind rate multiplier when the FloodWait belongs to one destination
+FLOOD_MARGIN  = 1.0     # seconds added to every FloodWait penalty
+MAX_SAVED_DESTS = 200   # destination rates persisted per account
+LIVE_RESERVE  = 1.0     # tokens batch leaves for live traffic
+LIVE_WINDOW   = 30.0    # seconds live traffic counts as "active"
+
+
+class TokenBucket:
+    def __init__(self, rate, floor, ceiling, step):
+        self.rate    = rate
+        self.floor   = floor
+        self.ceiling = ceiling
+        self.step    = step
+        self.tokens  = 1.0
+        self.stamp   = time.monotonic()
+        self.blocked_until = 0.0
+        self.live_waiting  = 0      # live requests queued on this bucket
+        self.live_seen     = 0.0    # last time a live request was served
+
+    @property
+    def capacity(self):
+        return max(1.0 + LIVE_RESERVE, self.rate * BURST_SECONDS)
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp  = now
+
+    async def acquire(self, live=False):
+        if live:
+            self.live_waiting += 1
+        try:
+            while True:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    await asyncio.sleep(self.blocked_until - now)
+                    continue
+                if not live and self.live_waiting:
+                    await asyncio.sleep(0.05)   # live lane goes first
+                    continue
+                self._refill(now)
+                need = 1.0
+                if not live and now - self.live_seen < LIVE_WINDOW:
+                    need += LIVE_RESERVE
+                if self.tokens >= need:
+                    self.tokens -= 1
+                    if live:
+                        self.live_seen = now
+                    return
+                await asyncio.sleep((need - self.tokens) / self.rate)
+        finally:
+            if live:
+                self.live_waiting -= 1
+
+    def increase(self):
+        self.rate = min(self.ceiling, self.rate + self.step)
+
+    def decrease(self, seconds):
+        """Cut the rate once per penalty (concurrent FloodWaits for the same
+        throttle only extend the block) and block for `seconds`."""
+        now = time.monotonic()
+        if now >= self.blocked_until:
+            self.rate = max(self.floor, self.rate * DECREASE)
+        self.blocked_until = max(self.blocked_until, now + seconds + FLOOD_MARGIN)
+        self.tokens = 0.0
+
+    def ease(self):
+        """Small multiplicative step down, without blocking."""
+        self.rate = max(self.floor, self.rate * DEST_EASE)
+
+    def wait_left(self):
+        return max(0.0, self.blocked_until - time.monotonic())
+
+
+class RateGovernor:
+    def __init__(self, account_id):
+        self.account_id = account_id
+        self.kinds = {k: TokenBucket(*v) for k, v in KIND_RATES.items()}
+        self.dests = OrderedDict()   # str(chat_id) → TokenBucket (most recent last)
+        self.floods = 0
+        self.served = {"live": 0, "batch": 0}
+
+    def _dest(self, dest):
+        key = str(dest)
+        bucket = self.dests.get(key)
+        if bucket is None:
+            bucket = self.dests[key] = TokenBucket(*DEST_RATE)
+        self.dests.move_to_end(key)
+        return bucket
+
+    async def acquire(self, kind, dest=None, live=False):
+        await self.kinds[kind].acquire(live)
+        if dest is not None:
+            await self._dest(dest).acquire(live)
+        self.served["live" if live else "batch"] += 1
+
+    def success(self, kind, dest=None):
+        self.kinds[kind].increase()
+        if dest is not None:
+            self._dest(dest).increase()
+
+    def flood(self, kind, seconds, dest=None):
+        self.floods += 1
+        if dest is None:
+            self.kinds[kind].decrease(seconds)
+            logger.warning(f"[Governor] {self.account_id} {kind} FloodWait {seconds}s → "
+                           f"{self.kinds[kind].rate:.2f} req/s")
+            return
+        # A per-chat limit: only that destination waits, the others keep going
+        bucket = self._dest(dest)
+        bucket.decrease(seconds)
+        self.kinds[kind].ease()
+        logger.warning(f"[Governor] {self.account_id} {kind} → {dest} FloodWait {seconds}s → "
+                       f"{bucket.rate:.2f} req/s")
+
+    def wait_left(self, kind):
+        return self.kinds[kind].wait_left()
+
+    # ── Persistence ────────────────────────────────────────────────
+    def _load(self, state):
+        for kind, rate in (state.get("kinds") or {}).items():
+            bucket = self.kinds.get(kind)
+            if bucket:
+                bucket.rate = min(bucket.ceiling, max(bucket.floor, float(rate)))
+        for dest, rate in (state.get("dests") or {}).items():
+            bucket = self._dest(dest)
+            bucket.rate = min(bucket.ceiling, max(bucket.floor, float(rate)))
+
+    async def save(self):
+        if self.account_id is None:
+            return
+        state = {
+            "kinds": {k: round(b.rate, 3) for k, b in self.kinds.items()},
+            "dests": {d: round(b.rate, 3) for d, b in list(self.dests.items())[-MAX_SAVED_DESTS:]},
+        }
+        try:
+            await save_rate_state(self.account_id, state)
+        except Exception as e:
+            logger.warning(f"[Governor] Could not save rates for {self.account_id}: {e}")
+
+    def summary(self):
+        rates = " • ".join(f"{k} {b.rate:.1f}/s" for k, b in self.kinds.items())
+        return f"{rates} • live {self.served['live']} / batch {self.served['batch']} • {self.floods} floods"
+
+
+_governors = {}   # account id → RateGovernor
+
+
+async def get_governor(client):
+    """The RateGovernor shared by every user of `client`'s account."""
+    me = getattr(client, "me", None)
+    account_id = getattr(me, "id", None)
+    key = account_id if account_id is not None else f"client:{id(client)}"
+    gov = _governors.get(key)
+    if gov is None:
+        gov = _governors[key] = RateGovernor(account_id)
+        if account_id is not None:
+            try:
+                gov._load(await get_rate_state(account_id) or {})
+            except Exception as e:
+                logger.warning(f"[Governor] Could not load rates for {account_id}: {e}")
+    return gov
+
+
+def active_governors():
+    return [g for g in _governors.values() if g.account_id is not None]
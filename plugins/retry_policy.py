@@ -0,0 +1,151 @@
+"""
+retry_policy.py — One retry/backoff policy for both copy engines.
+
+Every failed request is sorted into a category:
+
+  flood           FloodWait / SLOWMODE_WAIT (any 420), "0 B" download stall
+  file_reference  expired/invalid file reference, stale media or file_id
+  restricted      ChatForwardsRestricted / UserRestricted / ChatRestricted
+  transient       5xx, timeouts, dropped connections (OSError) and transfers
+                  that ended short (TransferError)
+  permanent       everything else — 400/401/403/406 (kicked, not admin,
+                  deleted channel, invalid peer or message) and bugs, which
+                  should fail fast instead of burning retries
+
+  classify(e)                       → category
+  await retry_or_give_up(e, attempt, attempts, flood=..., refresh=...)
+                                    → True after waiting, if the request
+                                      should be tried again
+  retry_stats.summary()             → retries / give-ups per category
+
+Transient errors back off exponentially with jitter (so parallel workers
+don't retry in lockstep). Floods go to the caller's `flood(seconds)`
+(normally the account's rate governor), file-reference errors call the
+caller's `refresh()` to re-fetch the message before the next attempt.
+Restricted and permanent errors are never retried.
+"""
+
+import asyncio
+import logging
+import random
+
+from pyrogram.errors import (
+    Flood, InternalServerError, ServiceUnavailable,
+    ChatForwardsRestricted, UserRestricted, ChatRestricted,
+    FileReferenceExpired, FileReferenceInvalid, FileReferenceEmpty, FileIdInvalid, MediaEmpty,
+)
+
+logger = logging.getLogger(__name__)
+
+# ── Tuning ─────────────────────────────────────────────────────────
+BACKOFF_BASE = 1.0      # seconds before the first transient retry
+BACKOFF_CAP  = 60.0     # longest transient backoff
+FLOOD_0B_WAIT = 3000    # "0 B" stalls (auth.ExportAuthorization FloodWait) carry no duration
+
+CATEGORIES = ("flood", "file_reference", "restricted", "permanent", "transient")
+GIVE_UP = ("restricted", "permanent")
+
+_FILE_REFERENCE = (
+    FileReferenceExpired, FileReferenceInvalid, FileReferenceEmpty, FileIdInvalid, MediaEmpty,
+)
+_RESTRICTED = (ChatForwardsRestricted, UserRestricted, ChatRestricted)
+
+
+class TransferError(ValueError):
+    """A download or upload that ended short (truncated stream, short part,
+    nothing written) — worth another attempt."""
+
+
+_TRANSIENT = (InternalServerError, ServiceUnavailable, OSError, asyncio.TimeoutError, TransferError)
+
+
+def classify(e) -> str:
+    if isinstance(e, Flood):
+        return "flood"
+    if isinstance(e, ValueError) and str(e) == "FLOOD_WAIT_0B":
+        return "flood"
+    if isinstance(e, _RESTRICTED):
+        return "restricted"
+    if isinstance(e, _FILE_REFERENCE):
+        return "file_reference"
+    if isinstance(e, ValueError) and "0 B" in str(e):
+        return "file_reference"   # "File size equals to 0 B": stale reference makes downloads come back empty
+    if isinstance(e, _TRANSIENT):
+        return "transient"
+    return "permanent"
+
+
+def flood_seconds(e) -> int:
+    value = getattr(e, "value", None)
+    if isinstance(value, int):
+        return value
+    return FLOOD_0B_WAIT
+
+
+def backoff(attempt) -> float:
+    """Exponential backoff with equal jitter for the 0-based `attempt`."""
+    delay = min(BACKOFF_CAP, BACKOFF_BASE * (2 ** attempt))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+class RetryStats:
+    def __init__(self):
+        self.counts = {c: {"retries": 0, "gave_up": 0} for c in CATEGORIES}
+
+    def record(self, category, gave_up=False):
+        self.counts[category]["gave_up" if gave_up else "retries"] += 1
+
+    def summary(self):
+        parts = [f"{c} {v['retries']}↻/{v['gave_up']}✗" for c, v in self.counts.items()
+                 if v["retries"] or v["gave_up"]]
+        return " • ".join(parts) or "no retries"
+
+
+retry_stats = RetryStats()
+
+
+async def _report_flood(flood, seconds):
+    r = flood(seconds)
+    if asyncio.iscoroutine(r):
+        await r
+
+
+async def retry_or_give_up(e, attempt, attempts=3, flood=None, refresh=None, label=""):
+    """
+    Apply the policy after `e` failed 0-based `attempt` of `attempts`.
+    Waits as the category requires and returns True if the caller should
+    try again, False if it should give up (counted in retry_stats).
+    `flood(seconds)` replaces the plain sleep for floods (it may be sync or
+    async) and is called even when the flood ends the retries, so a rate
+    limiter always learns about it; `refresh()` re-fetches stale file
+    references.
+    """
+    category = classify(e)
+    last = attempt + 1 >= attempts
+    if category in GIVE_UP or last or (category == "file_reference" and refresh is None):
+        retry_stats.record(category, gave_up=True)
+        logger.error(f"[Retry] {label} giving up ({category}, attempt {attempt + 1}/{attempts}): {e}")
+        if category == "flood" and flood is not None:
+            await _report_flood(flood, flood_seconds(e))   # the limiter still has to hear about it
+        return False
+
+    retry_stats.record(category)
+    if category == "flood":
+        seconds = flood_seconds(e)
+        logger.warning(f"[Retry] {label} FloodWait {seconds}s (attempt {attempt + 1}/{attempts})")
+        if flood is not None:
+            await _report_flood(flood, seconds)
+        else:
+            await asyncio.sleep(seconds + backoff(0))
+    elif category == "file_reference":
+        logger.info(f"[Retry] {label} stale file reference, re-fetching: {e}")
+        try:
+            await refresh()
+        except Exception as refresh_err:
+            logger.warning(f"[Retry] {label} refresh failed: {refresh_err}")
+            await asyncio.sleep(backoff(attempt))
+    else:
+        delay = backoff(attempt)
+        logger.warning(f"[Retry] {label} {e} — retrying in {delay:.1f}s (attempt {attempt + 1}/{attempts})")
+        await asyncio.sleep(delay)
+    return True
@@ -79,6 +79,14 @@ async def show_settings_panel(user_id, message_obj, is_edit=False):
             InlineKeyboardButton(f"{tick if f.get('text') else cross} Texts", callback_data="tog_text")
         ]
     ]
+    kw = f.get("keyword")
+    kw_row = [InlineKeyboardButton(f"🔎 Keyword: {kw}" if kw else "🔎 Keyword: Off", callback_data="kw_set")]
+    if kw:
+        kw_row.append(InlineKeyboardButton("🗑 Clear Keyword", callback_data="kw_clear"))
+    kb.append(kw_row)
+    kb.append([
+        InlineKeyboardButton(f"{tick if settings.get('export_mode') else cross} 📦 Export Mode (large batches)", callback_data="exp_toggle")
+    ])
     
     markup = InlineKeyboardMarkup(kb)
     
@@ -116,6 +124,43 @@ async def toggle_filter(client, callback: CallbackQuery):
     await update_settings(user_id, filters=settings["filters"])
     await show_settings_panel(user_id, callback.message, is_edit=True)
 
+@Client.on_callback_query(filters.regex("^kw_"))
+async def keyword_filter_handler(client, callback: CallbackQuery):
+    user_id = callback.from_user.id
+
+    if callback.data == "kw_set":
+        client.waiting_input = {"user": user_id, "type": "set_keyword"}
+        await callback.message.reply_text(
+            "🔎 **Send the Keyword**\n\nOnly messages whose text/caption contains it will be copied.\n"
+            "_With a keyword or a single type filter, Batch asks Telegram for matching messages only._",
+            reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("❌ Cancel", callback_data="cancel_input")]])
+        )
+        await callback.answer()
+
+    elif callback.data == "kw_clear":
+        settings = await get_settings(user_id) or {}
+        f = settings.get("filters") or {"all": True}
+        f.pop("keyword", None)
+        await update_settings(user_id, filters=f)
+        await callback.answer("Keyword filter removed.")
+        await show_settings_panel(user_id, callback.message, is_edit=True)
+
+@Client.on_callback_query(filters.regex("^exp_toggle$"))
+async def export_mode_toggle(client, callback: CallbackQuery):
+    user_id = callback.from_user.id
+    settings = await get_settings(user_id) or {}
+    enabled = not settings.get("export_mode", False)
+    await update_settings(user_id, export_mode=enabled)
+    if enabled:
+        await callback.answer(
+            "📦 Export Mode ON\nLarge batches read history through a Telegram data-export "
+            "(takeout) session. Telegram may ask you to confirm it on your phone.",
+            show_alert=True
+        )
+    else:
+        await callback.answer("Export Mode OFF")
+    await show_settings_panel(user_id, callback.message, is_edit=True)
+
 @Client.on_callback_query(filters.regex("^cap_"))
 async def caption_settings_handler(client, callback: CallbackQuery):
     action = callback.data
@@ -22,10 +22,12 @@ PLANS = {
         "dl_limit": 3,             # Download+Upload daily limit
         "duration": 0,
         "live_monitor_limit": 0,
+        "dl_connections": 2,       # Parallel connections per restricted download
         "one_time": False,
         "color": "⚪",
         "badge": "FREE",
         "self_activate": False,
+        "queue_weight": 1,       # Share of job starts when the scheduler is busy
     },
     "trial": {
         "name": "🎁 Trial Plan",
@@ -36,10 +38,12 @@ PLANS = {
         "dl_limit": 5000,
         "duration": 86400,         # 24 hours
         "live_monitor_limit": 0,
+        "dl_connections": 4,
         "one_time": True,
         "color": "🟢",
         "badge": "FREE TRIAL",
         "self_activate": True,     # User can activate themselves!
+        "queue_weight": 2,
     },
     "daily_39": {
         "name": "⚡ Daily Pass",
@@ -50,10 +54,12 @@ PLANS = {
         "dl_limit": 19999,
         "duration": 86400,
         "live_monitor_limit": 2,
+        "dl_connections": 4,
         "one_time": False,
         "color": "🔵",
         "badge": "POPULAR",
         "self_activate": False,
+        "queue_weight": 4,
     },
     "monthly_259": {
         "name": "💎 Monthly Pro",
@@ -64,10 +70,12 @@ PLANS = {
         "dl_limit": 200000,
         "duration": 2592000,
         "live_monitor_limit": 5,
+        "dl_connections": 6,
         "one_time": False,
         "color": "🟣",
         "badge": "BEST VALUE",
         "self_activate": False,
+        "queue_weight": 6,
     },
     "ultra_389": {
         "name": "🚀 Ultra Pass",
@@ -78,10 +86,12 @@ PLANS = {
         "dl_limit": 1000000,
         "duration": 259200,
         "live_monitor_limit": 15,
+        "dl_connections": 8,
         "one_time": False,
         "color": "🟠",
         "badge": "POWER USER",
         "self_activate": False,
+        "queue_weight": 8,
     },
     "lifetime_2999": {
         "name": "♾️ Lifetime",
@@ -92,10 +102,12 @@ PLANS = {
         "dl_limit": float('inf'),
         "duration": 0,
         "live_monitor_limit": 30,
+        "dl_connections": 8,
         "one_time": False,
         "color": "🔴",
         "badge": "ULTIMATE",
         "self_activate": False,
+        "queue_weight": 10,
     },
 }
 
@@ -0,0 +1,103 @@
+"""
+takeout.py — Takeout (data export) sessions for long Batch history reads.
+
+Requests wrapped in invokeWithTakeout run under Telegram's export limits,
+which are much looser for history reads than the regular per-account
+limits that make big "all" batches stall on FloodWait.
+
+  session = TakeoutSession(userbot)
+  await session.open()         → True if Telegram granted the session
+  await session.invoke(query)  → wrapped when active, plain otherwise
+  await session.close(success)
+
+Telegram may refuse a new session (TAKEOUT_INIT_DELAY: the user has to
+confirm the export on another device or wait) or invalidate it midway.
+Either way the session degrades to plain invoke() and label() says why,
+so the job keeps running in standard mode.
+"""
+
+import logging
+
+from pyrogram import raw
+from pyrogram.errors import TakeoutInitDelay, TakeoutInvalid
+
+logger = logging.getLogger(__name__)
+
+
+def _fmt_wait(seconds):
+    if seconds >= 3600:
+        return f"{seconds / 3600:.0f}h"
+    if seconds >= 60:
+        return f"{seconds / 60:.0f}m"
+    return f"{seconds}s"
+
+
+class TakeoutSession:
+    def __init__(self, client):
+        self.client = client
+        self.id     = None
+        self.reason = "not opened"
+        self.used   = False   # True once a request ran under takeout
+
+    @property
+    def active(self):
+        return self.id is not None
+
+    async def open(self):
+        try:
+            r = await self.client.invoke(
+                raw.functions.account.InitTakeoutSession(
+                    message_chats=True,
+                    message_megagroups=True,
+                    message_channels=True,
+                )
+            )
+        except TakeoutInitDelay as e:
+            self.reason = f"refused, confirm on your phone or retry in {_fmt_wait(e.value)}"
+            logger.info(f"[Takeout] Refused: wait {e.value}s")
+            return False
+        except Exception as e:
+            self.reason = f"unavailable: {e}"
+            logger.warning(f"[Takeout] Init failed: {e}")
+            return False
+        self.id = r.id
+        self.reason = ""
+        logger.info(f"[Takeout] Session {self.id} opened")
+        return True
+
+    async def invoke(self, query):
+        if self.id is None:
+            return await self.client.invoke(query)
+        try:
+            r = await self.client.invoke(
+                raw.functions.InvokeWithTakeout(takeout_id=self.id, query=query)
+            )
+            self.used = True
+            return r
+        except TakeoutInvalid:
+            logger.warning(f"[Takeout] Session {self.id} invalidated, continuing without it")
+            self.id = None
+            self.reason = "session ended by Telegram"
+            return await self.client.invoke(query)
+
+    async def close(self, success=True):
+        if self.id is None:
+            return
+        takeout_id, self.id = self.id, None
+        self.reason = "closed"
+        try:
+            await self.client.invoke(
+                raw.functions.InvokeWithTakeout(
+                    takeout_id=takeout_id,
+                    query=raw.functions.account.FinishTakeoutSession(success=success or None),
+                )
+            )
+        except Exception as e:
+            logger.warning(f"[Takeout] Finish failed: {e}")
+
+    def label(self):
+        if self.active or (self.used and self.reason == "closed"):
+            return "Takeout (export limits)"
+        if self.used:
+            return f"Takeout → Standard ({self.reason})"
+        return f"Standard (takeout {self.reason})"
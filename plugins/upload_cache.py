@@ -0,0 +1,120 @@
+"""
+upload_cache.py — Re-send already relayed files by file_id for ExtractX.
+
+Once a restricted file has been downloaded and uploaded, the account's own
+post of it carries a file_id that this account can send again instantly.
+This module keeps a persistent map per account from the source file's
+file_unique_id to that uploaded file_id (MongoDB "uploaded_files", with an
+in-memory front), so later jobs, reruns and live monitors skip both the
+download and the upload.
+
+  send_reused(client, chat_id, msg, caption)  → sent Message, or None
+  remember_upload(client, msg, sent)          → record a fresh upload
+
+If Telegram rejects a stored file_id (expired reference, deleted post,
+revoked access), the entry is dropped and None is returned, so the caller
+falls back to the normal download + upload path.
+"""
+
+import logging
+from collections import OrderedDict
+
+from pyrogram.errors import (
+    FileReferenceExpired, FileReferenceInvalid, FileReferenceEmpty,
+    FileIdInvalid, MediaEmpty, MediaInvalid,
+)
+
+from database import get_uploaded_file_id, save_uploaded_file_id, delete_uploaded_file_id
+from plugins.media_cache import media_unique_id, CACHE_KINDS
+
+logger = logging.getLogger(__name__)
+
+MEMORY_ENTRIES = 5000   # hot entries kept in RAM in front of MongoDB
+
+STALE_ERRORS = (
+    FileReferenceExpired, FileReferenceInvalid, FileReferenceEmpty,
+    FileIdInvalid, MediaEmpty, MediaInvalid, ValueError,
+)
+
+_memory = OrderedDict()   # (account_id, unique_id) → file_id
+
+
+def _account_id(client):
+    me = getattr(client, "me", None)
+    return getattr(me, "id", None)
+
+
+def _sent_file_id(sent):
+    for kind in CACHE_KINDS:
+        obj = getattr(sent, kind, None)
+        if obj and getattr(obj, "file_id", None):
+            return obj.file_id
+    return None
+
+
+def _remember(key, file_id):
+    _memory[key] = file_id
+    _memory.move_to_end(key)
+    while len(_memory) > MEMORY_ENTRIES:
+        _memory.popitem(last=False)
+
+
+async def _lookup(key):
+    if key in _memory:
+        _memory.move_to_end(key)
+        return _memory[key]
+    try:
+        file_id = await get_uploaded_file_id(*key)
+    except Exception as e:
+        logger.warning(f"[Reuse] Lookup failed: {e}")
+        return None
+    if file_id:
+        _remember(key, file_id)
+    return file_id
+
+
+async def forget_upload(client, msg):
+    """Drop the stored file_id for msg's media (Telegram no longer accepts it)."""
+    key = (_account_id(client), media_unique_id(msg))
+    _memory.pop(key, None)
+    if None in key:
+        return
+    try:
+        await delete_uploaded_file_id(*key)
+    except Exception as e:
+        logger.warning(f"[Reuse] Could not drop {key[1]}: {e}")
+
+
+async def remember_upload(client, msg, sent):
+    """Record the file_id of `sent` (this account's upload of msg's media)."""
+    key = (_account_id(client), media_unique_id(msg))
+    file_id = _sent_file_id(sent) if sent else None
+    if None in key or not file_id or _memory.get(key) == file_id:
+        return
+    _remember(key, file_id)
+    try:
+        await save_uploaded_file_id(*key, file_id)
+    except Exception as e:
+        logger.warning(f"[Reuse] Could not store {key[1]}: {e}")
+
+
+async def send_reused(client, chat_id, msg, caption=None, disable_notification=None):
+    """Send msg's media to chat_id from a file_id this account uploaded
+    before. Returns the sent Message, or None if there is no usable entry.
+    FloodWait and unrelated errors are raised as-is."""
+    key = (_account_id(client), media_unique_id(msg))
+    if None in key:
+        return None
+    file_id = await _lookup(key)
+    if not file_id:
+        return None
+    try:
+        return await client.send_cached_media(
+            chat_id, file_id,
+            caption="" if msg.sticker else (caption or ""),
+            disable_notification=disable_notification
+        )
+    except STALE_ERRORS as e:
+        logger.info(f"[Reuse] Stored file_id for {key[1]} rejected ({e}), re-uploading")
+        await forget_upload(client, msg)
+        return None